@@ -1,6 +1,10 @@
 from app import create_app
+import logging
 import os
 
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+                    format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
 app = create_app()
 
 if __name__ == '__main__':
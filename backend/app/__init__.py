@@ -1,9 +1,29 @@
 from flask import Flask
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
-import sqlite3
 import os
 from datetime import timedelta
+from app.db import connect, init_db
+
+DATABASE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), '..', 'database')
+
+# Columns added after a table was first released: (table, column, definition)
+COLUMN_MIGRATIONS = [
+    ('generation_jobs', 'use_cache', 'BOOLEAN DEFAULT TRUE'),
+    ('generation_jobs', 'batch_id', 'VARCHAR(32)'),
+    ('generation_history', 'mode', 'VARCHAR(20)'),
+    ('generation_history', 'prompt_tokens', 'INTEGER'),
+    ('generation_history', 'completion_tokens', 'INTEGER'),
+    ('generation_history', 'tokens_saved', 'INTEGER'),
+    ('website_projects', 'code_hash', 'VARCHAR(64)'),
+    ('generation_history', 'output_hash', 'VARCHAR(64)'),
+    ('generation_history', 'version', 'INTEGER'),
+    ('generation_history', 'continuations', 'INTEGER DEFAULT 0'),
+    ('generation_history', 'continuation_time', 'REAL'),
+    ('request_leases', 'retry_after', 'REAL'),
+    ('generation_jobs', 'worker_id', 'VARCHAR(64)'),
+    ('generation_jobs', 'heartbeat_at', 'TIMESTAMP'),
+]
 
 def create_app():
     app = Flask(__name__)
@@ -12,7 +32,99 @@ def create_app():
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'sitecraft-ai-secret-key-2024')
     app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'jwt-secret-string')
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
-    app.config['DATABASE_PATH'] = os.path.join(os.path.dirname(os.path.dirname(__file__)), '..', 'database', 'sitecraft.db')
+    app.config['DATABASE_PATH'] = os.environ.get('DATABASE_PATH', os.path.join(DATABASE_DIR, 'sitecraft.db'))
+    
+    # Password hashing (scrypt or pbkdf2_sha256) on a bounded worker pool
+    app.config['PASSWORD_HASH_ALGORITHM'] = os.environ.get('PASSWORD_HASH_ALGORITHM', 'scrypt')
+    app.config['PASSWORD_SCRYPT_N'] = int(os.environ.get('PASSWORD_SCRYPT_N', 2 ** 14))
+    app.config['PASSWORD_SCRYPT_R'] = int(os.environ.get('PASSWORD_SCRYPT_R', 8))
+    app.config['PASSWORD_SCRYPT_P'] = int(os.environ.get('PASSWORD_SCRYPT_P', 1))
+    app.config['PASSWORD_PBKDF2_ITERATIONS'] = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 600000))
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 2))
+    app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 32))
+    app.config['PASSWORD_HASH_TIMEOUT'] = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+    
+    # In-process cache of user records
+    app.config['USER_CACHE_ENABLED'] = os.environ.get('USER_CACHE_ENABLED', 'true').lower() == 'true'
+    app.config['USER_CACHE_SIZE'] = int(os.environ.get('USER_CACHE_SIZE', 1024))
+    app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 60))
+    app.config['USER_CACHE_VERSION_CHECK_INTERVAL'] = float(os.environ.get('USER_CACHE_VERSION_CHECK_INTERVAL', 1))
+    
+    # OpenRouter models: candidates in preference order, per-operation overrides and health tracking
+    app.config['AI_MODELS'] = os.environ.get('AI_MODELS', 'deepseek/deepseek-chat')
+    app.config['AI_MODEL_ROUTES'] = os.environ.get('AI_MODEL_ROUTES', '')
+    app.config['AI_ROUTER_WINDOW'] = int(os.environ.get('AI_ROUTER_WINDOW', 200))
+    app.config['AI_ROUTER_MIN_SAMPLES'] = int(os.environ.get('AI_ROUTER_MIN_SAMPLES', 5))
+    app.config['AI_ROUTER_MAX_ERROR_RATE'] = float(os.environ.get('AI_ROUTER_MAX_ERROR_RATE', 0.5))
+    app.config['AI_ROUTER_MAX_CONSECUTIVE_FAILURES'] = int(os.environ.get('AI_ROUTER_MAX_CONSECUTIVE_FAILURES', 3))
+    app.config['AI_ROUTER_COOLDOWN'] = float(os.environ.get('AI_ROUTER_COOLDOWN', 30))
+    
+    # OpenRouter budgets (per minute, 0 disables a limit) and how long calls may queue for them
+    app.config['AI_RATE_LIMIT_ENABLED'] = os.environ.get('AI_RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    app.config['AI_GLOBAL_RPM'] = int(os.environ.get('AI_GLOBAL_RPM', 120))
+    app.config['AI_GLOBAL_TPM'] = int(os.environ.get('AI_GLOBAL_TPM', 1000000))
+    app.config['AI_USER_RPM'] = int(os.environ.get('AI_USER_RPM', 30))
+    app.config['AI_USER_TPM'] = int(os.environ.get('AI_USER_TPM', 300000))
+    app.config['AI_BATCH_HEADROOM'] = float(os.environ.get('AI_BATCH_HEADROOM', 0.25))
+    app.config['AI_INTERACTIVE_DEADLINE'] = float(os.environ.get('AI_INTERACTIVE_DEADLINE', 30))
+    app.config['AI_BATCH_DEADLINE'] = float(os.environ.get('AI_BATCH_DEADLINE', 600))
+    
+    # Background generation jobs
+    app.config['GENERATION_WORKERS'] = int(os.environ.get('GENERATION_WORKERS', 4))
+    app.config['GENERATION_JOBS_PER_USER'] = int(os.environ.get('GENERATION_JOBS_PER_USER', 2))
+    app.config['GENERATION_QUEUE_SIZE'] = int(os.environ.get('GENERATION_QUEUE_SIZE', 100))
+    app.config['GENERATION_JOB_STALE_SECONDS'] = int(os.environ.get('GENERATION_JOB_STALE_SECONDS', 60))
+    app.config['GENERATION_BATCH_MAX_ITEMS'] = int(os.environ.get('GENERATION_BATCH_MAX_ITEMS', 50))
+    
+    # Section-by-section generation pipeline
+    app.config['SECTION_WORKERS'] = int(os.environ.get('SECTION_WORKERS', 4))
+    app.config['SECTION_RETRIES'] = int(os.environ.get('SECTION_RETRIES', 2))
+    
+    # Completions cut off at max_tokens are continued at most this many times
+    app.config['MAX_CONTINUATIONS'] = int(os.environ.get('MAX_CONTINUATIONS', 3))
+    
+    # Documents at least this many characters are modified through patch edits
+    app.config['PATCH_MODE_MIN_SIZE'] = int(os.environ.get('PATCH_MODE_MIN_SIZE', 20000))
+    # Send patch edits only the parts of the document related to the request
+    app.config['PATCH_TRIM_ENABLED'] = os.environ.get('PATCH_TRIM_ENABLED', 'false').lower() == 'true'
+    
+    # Post-processing stages run on every generated page, in order
+    app.config['HTML_PIPELINE'] = os.environ.get('HTML_PIPELINE', 'strip_fences,balance_tags,minify_inline,dedupe_styles')
+    
+    # Project versions: every VERSION_SNAPSHOT_INTERVAL-th one is stored whole, the rest as deltas
+    app.config['VERSION_SNAPSHOT_INTERVAL'] = int(os.environ.get('VERSION_SNAPSHOT_INTERVAL', 10))
+    
+    # Coalescing of identical in-flight AI requests
+    app.config['SINGLE_FLIGHT_LEASE_SECONDS'] = int(os.environ.get('SINGLE_FLIGHT_LEASE_SECONDS', 600))
+    app.config['SINGLE_FLIGHT_RESULT_TTL'] = int(os.environ.get('SINGLE_FLIGHT_RESULT_TTL', 5))
+    
+    # Write-behind generation history logging
+    app.config['HISTORY_BATCH_SIZE'] = int(os.environ.get('HISTORY_BATCH_SIZE', 100))
+    app.config['HISTORY_FLUSH_INTERVAL'] = float(os.environ.get('HISTORY_FLUSH_INTERVAL', 0.5))
+    app.config['HISTORY_QUEUE_SIZE'] = int(os.environ.get('HISTORY_QUEUE_SIZE', 10000))
+    app.config['HISTORY_ENQUEUE_TIMEOUT'] = float(os.environ.get('HISTORY_ENQUEUE_TIMEOUT', 2))
+    
+    # Cache of identical AI generation requests
+    app.config['GENERATION_CACHE_ENABLED'] = os.environ.get('GENERATION_CACHE_ENABLED', 'true').lower() == 'true'
+    app.config['GENERATION_CACHE_TTL'] = int(os.environ.get('GENERATION_CACHE_TTL', 86400))
+    app.config['GENERATION_CACHE_MEMORY_ENTRIES'] = int(os.environ.get('GENERATION_CACHE_MEMORY_ENTRIES', 256))
+    app.config['GENERATION_CACHE_MEMORY_BYTES'] = int(os.environ.get('GENERATION_CACHE_MEMORY_BYTES', 32 * 1024 * 1024))
+    app.config['GENERATION_CACHE_DISK_BYTES'] = int(os.environ.get('GENERATION_CACHE_DISK_BYTES', 256 * 1024 * 1024))
+    
+    # Encoded JSON bodies reused across conditional GETs
+    app.config['RESPONSE_CACHE_BYTES'] = int(os.environ.get('RESPONSE_CACHE_BYTES', 64 * 1024 * 1024))
+    app.config['RESPONSE_COMPRESS_MIN_SIZE'] = int(os.environ.get('RESPONSE_COMPRESS_MIN_SIZE', 1024))
+    
+    # Accounts allowed to read the process-wide metrics at /api/stats
+    app.config['STATS_ADMIN_EMAILS'] = {
+        email.strip().lower() for email in os.environ.get('STATS_ADMIN_EMAILS', '').split(',') if email.strip()
+    }
+    
+    # Precompressed generated-site bundles served by /preview
+    app.config['PREVIEW_EXPORT_DIR'] = os.environ.get(
+        'PREVIEW_EXPORT_DIR', os.path.join(os.path.dirname(app.config['DATABASE_PATH']), 'previews'))
+    # Lifetime of the signed ?token= links for previewing a project in an iframe
+    app.config['PREVIEW_TOKEN_SECONDS'] = int(os.environ.get('PREVIEW_TOKEN_SECONDS', 300))
     
     # Initialize extensions
     CORS(app, origins=["http://localhost:3000", "http://127.0.0.1:3000", "null"], 
@@ -21,32 +133,93 @@ def create_app():
          supports_credentials=True)
     jwt = JWTManager(app)
     
+    from app.json_provider import init_json_provider
+    init_json_provider(app)
+    
     # Initialize database
     init_database(app.config['DATABASE_PATH'])
+    init_db(app)
     
     # Register blueprints
     from app.routes.auth import auth_bp
     from app.routes.projects import projects_bp
     from app.routes.ai_generation import ai_bp
+    from app.routes.stats import stats_bp
+    from app.routes.preview import preview_bp
     
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(projects_bp, url_prefix='/api/projects')
     app.register_blueprint(ai_bp, url_prefix='/api/ai')
+    app.register_blueprint(stats_bp, url_prefix='/api/stats')
+    app.register_blueprint(preview_bp, url_prefix='/preview')
+    
+    # Set up the response cache
+    from app.services.response_cache import init_response_cache
+    init_response_cache(app)
+    
+    # Set up generated-site exports
+    from app.services.site_export import init_site_exporter
+    init_site_exporter(app)
+    
+    # Set up the user cache
+    from app.services.user_cache import init_user_cache
+    init_user_cache(app)
+    
+    # Set up password hashing
+    from app.services.password_hasher import init_password_hasher
+    init_password_hasher(app)
+    
+    # Set up model routing
+    from app.services.model_router import init_model_router
+    init_model_router(app)
+    
+    # Set up post-processing of generated pages
+    from app.services.html_pipeline import init_html_pipeline
+    init_html_pipeline(app)
+    
+    # Set up OpenRouter rate limiting
+    from app.services.rate_limiter import init_rate_limiter
+    init_rate_limiter(app)
+    
+    # Set up the generation cache
+    from app.services.generation_cache import init_generation_cache
+    init_generation_cache(app)
+    
+    # Set up request coalescing
+    from app.services.single_flight import init_single_flight
+    init_single_flight(app)
+    
+    # Start the background history writer
+    from app.services.history_writer import init_history_writer
+    init_history_writer(app)
+    
+    # Start background generation workers
+    from app.services.job_queue import init_job_queue
+    init_job_queue(app)
     
     return app
 
 def init_database(db_path):
-    """Initialize the database with schema if it doesn't exist"""
+    """Initialize the database with schema, creating any missing tables"""
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
     
-    if not os.path.exists(db_path):
-        conn = sqlite3.connect(db_path)
-        
-        # Read and execute schema
-        schema_path = os.path.join(os.path.dirname(db_path), 'schema.sql')
-        if os.path.exists(schema_path):
-            with open(schema_path, 'r') as f:
-                conn.executescript(f.read())
-        
-        conn.close()
+    is_new = not os.path.exists(db_path)
+    conn = connect(db_path)
+    
+    # Add columns that CREATE TABLE IF NOT EXISTS can't add to existing tables
+    # (before the schema runs, so indexes on new columns can be created)
+    for table, column, definition in COLUMN_MIGRATIONS:
+        existing = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+        if existing and column not in existing:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    
+    # Read and execute schema (idempotent, so existing databases pick up new tables)
+    schema_path = os.path.join(DATABASE_DIR, 'schema.sql')
+    if os.path.exists(schema_path):
+        with open(schema_path, 'r') as f:
+            conn.executescript(f.read())
+    conn.commit()
+    
+    conn.close()
+    if is_new:
         print(f"Database initialized at {db_path}")
\ No newline at end of file
@@ -0,0 +1,74 @@
+import sqlite3
+import threading
+from flask import current_app
+
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+_stats_lock = threading.Lock()
+_stats = {'connections_opened': 0, 'connections_reused': 0}
+
+
+def connect(db_path):
+    """Open a SQLite connection tuned for concurrent web access"""
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000.0,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+    return conn
+
+
+def get_db(db_path=None):
+    """Get this thread's cached connection to the database.
+
+    Connections live as long as their thread, so request handlers and
+    background workers skip the file open and schema parse on every query
+    and keep their compiled statement cache. Defaults to the current app's
+    DATABASE_PATH; background threads without an app context pass the path.
+    """
+    if db_path is None:
+        db_path = current_app.config['DATABASE_PATH']
+
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(db_path)
+    with _stats_lock:
+        if conn is None:
+            _stats['connections_opened'] += 1
+        else:
+            _stats['connections_reused'] += 1
+
+    if conn is None:
+        conn = connections[db_path] = connect(db_path)
+    return conn
+
+
+def release_db(exception=None):
+    """Roll back anything a request left uncommitted so the connection can be reused"""
+    connections = getattr(_local, 'connections', None) or {}
+    for conn in connections.values():
+        if conn.in_transaction:
+            conn.rollback()
+
+
+def close_db():
+    """Close this thread's cached connections"""
+    connections = getattr(_local, 'connections', None) or {}
+    for conn in connections.values():
+        conn.close()
+    connections.clear()
+
+
+def db_stats():
+    """Connection cache counters for this process"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def init_db(app):
+    """Hook the connection cache into the application context lifecycle"""
+    app.teardown_appcontext(release_db)
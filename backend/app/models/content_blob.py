@@ -0,0 +1,120 @@
+import hashlib
+import zlib
+from datetime import datetime
+from app.db import get_db
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+class ContentBlob:
+    """Content-addressed, compressed storage for generated HTML.
+
+    Blobs are keyed by the SHA-256 of their text, so identical pages are
+    stored once. New blobs use zstd when the ``zstandard`` package is
+    installed and zlib otherwise; the codec is stored with each row so both
+    can be read back.
+    """
+    
+    @staticmethod
+    def content_hash(text):
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def compress(text):
+        raw = text.encode('utf-8')
+        if zstandard is not None:
+            return 'zstd', zstandard.ZstdCompressor(level=10).compress(raw)
+        return 'zlib', zlib.compress(raw, 6)
+    
+    @staticmethod
+    def decompress(codec, data):
+        if codec == 'zstd':
+            if zstandard is None:
+                raise RuntimeError('zstandard is required to read zstd-compressed content')
+            return zstandard.ZstdDecompressor().decompress(data).decode('utf-8')
+        if codec == 'zlib':
+            return zlib.decompress(data).decode('utf-8')
+        return data.decode('utf-8') if isinstance(data, bytes) else data
+    
+    @staticmethod
+    def put(text, commit=True):
+        """Store text (if not already stored) and return its hash"""
+        return ContentBlob.put_many([text], commit)[0]
+    
+    @staticmethod
+    def put_many(texts, commit=True, conn=None):
+        """Store several texts, returning their hashes in order.
+
+        Compression happens before any write, so the write transaction
+        only covers the inserts. Writes go to ``conn`` when given, else to
+        the thread's connection. The blobs are claimed under the write lock,
+        so until the caller commits its references to them a concurrent
+        release() can't delete them.
+        """
+        hashes = [ContentBlob.content_hash(text) for text in texts]
+        conn = conn or get_db()
+        
+        unique = list(dict.fromkeys(zip(hashes, texts)))
+        placeholders = ', '.join('?' * len(unique))
+        existing = {row[0] for row in conn.execute(
+            f'SELECT hash FROM content_blobs WHERE hash IN ({placeholders})', [h for h, _ in unique])}
+        compressed = {blob_hash: ContentBlob.compress(text) for blob_hash, text in unique
+                      if blob_hash not in existing}
+        
+        # The no-op UPDATE takes the write lock; blobs released since the
+        # SELECT above are stored again
+        conn.execute(f'UPDATE content_blobs SET hash = hash WHERE hash IN ({placeholders})',
+                     [h for h, _ in unique])
+        stored = {row[0] for row in conn.execute(
+            f'SELECT hash FROM content_blobs WHERE hash IN ({placeholders})', [h for h, _ in unique])}
+        
+        rows = []
+        for blob_hash, text in unique:
+            if blob_hash not in stored:
+                codec, data = compressed.get(blob_hash) or ContentBlob.compress(text)
+                rows.append((blob_hash, codec, len(text.encode('utf-8')), len(data), data, datetime.now()))
+        if rows:
+            conn.executemany('''
+                INSERT OR IGNORE INTO content_blobs (hash, codec, size, stored_size, data, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', rows)
+        if commit:
+            conn.commit()
+        
+        return hashes
+    
+    @staticmethod
+    def get(blob_hash):
+        """Load and decompress the text stored under a hash"""
+        row = get_db().execute('SELECT codec, data FROM content_blobs WHERE hash = ?',
+                               (blob_hash,)).fetchone()
+        if not row:
+            return None
+        return ContentBlob.decompress(row[0], row[1])
+    
+    @staticmethod
+    def get_many(blob_hashes):
+        """Load several texts in one query, as a dict of hash to text"""
+        blob_hashes = list(dict.fromkeys(blob_hashes))
+        if not blob_hashes:
+            return {}
+        placeholders = ', '.join('?' * len(blob_hashes))
+        rows = get_db().execute(f'SELECT hash, codec, data FROM content_blobs WHERE hash IN ({placeholders})',
+                                blob_hashes).fetchall()
+        return {blob_hash: ContentBlob.decompress(codec, data) for blob_hash, codec, data in rows}
+    
+    @staticmethod
+    def release(blob_hash, commit=True):
+        """Delete a blob once nothing references it any more"""
+        if not blob_hash:
+            return
+        conn = get_db()
+        conn.execute('''
+            DELETE FROM content_blobs WHERE hash = ?
+            AND NOT EXISTS (SELECT 1 FROM website_projects WHERE code_hash = ?)
+            AND NOT EXISTS (SELECT 1 FROM generation_history WHERE output_hash = ?)
+        ''', (blob_hash, blob_hash, blob_hash))
+        if commit:
+            conn.commit()
@@ -1,126 +1,377 @@
 import sqlite3
 from datetime import datetime
-from flask import current_app
+from app.db import get_db
+from app.models.content_blob import ContentBlob
+from app.models.project_version import ProjectVersion
+from app.services.site_export import get_site_exporter
+
+# Public project fields and the SQL that reads each one. Generated HTML lives
+# in content_blobs and is loaded on demand, so it is never part of a listing.
+PROJECT_FIELDS = {
+    'id': 'id',
+    'user_id': 'user_id',
+    'project_name': 'project_name',
+    'description': 'description',
+    'website_type': 'website_type',
+    'requirements': 'requirements',
+    'status': 'status',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+    'has_code': 'code_hash IS NOT NULL OR generated_code IS NOT NULL'
+}
+
+def select_fields(fields):
+    """SELECT list for public project fields, each aliased to its field name"""
+    return ', '.join(f'{PROJECT_FIELDS[name]} AS {name}' for name in fields)
+
+# Everything a WebsiteProject is built from
+PROJECT_COLUMNS = select_fields(PROJECT_FIELDS) + ', code_hash, generated_code IS NOT NULL AS has_legacy_code'
 
 class WebsiteProject:
+    __slots__ = ('id', 'user_id', 'project_name', 'description', 'website_type', 'requirements',
+                 'status', 'created_at', 'updated_at', 'code_hash', 'saved_version',
+                 '_generated_code', '_code_loaded', '_code_dirty', '_has_legacy_code')
+    
     def __init__(self, id=None, user_id=None, project_name=None, description=None,
-                 website_type=None, requirements=None, generated_code=None, 
-                 status='draft', created_at=None, updated_at=None):
+                 website_type=None, requirements=None, generated_code=None,
+                 status='draft', created_at=None, updated_at=None, code_hash=None,
+                 code_loaded=True, has_legacy_code=False):
         self.id = id
         self.user_id = user_id
         self.project_name = project_name
         self.description = description
         self.website_type = website_type
         self.requirements = requirements
-        self.generated_code = generated_code
         self.status = status
         self.created_at = created_at
         self.updated_at = updated_at
+        self.code_hash = code_hash
+        self.saved_version = None  # Version recorded by the last save() that changed the code
+        
+        self._generated_code = generated_code
+        self._code_loaded = code_loaded
+        self._code_dirty = code_loaded and generated_code is not None
+        self._has_legacy_code = has_legacy_code
     
-    def save(self):
-        """Save project to database"""
-        conn = sqlite3.connect(current_app.config['DATABASE_PATH'])
+    @property
+    def generated_code(self):
+        """Generated HTML, loaded from the content store on first access"""
+        if not self._code_loaded:
+            self._generated_code = self._load_code()
+            self._code_loaded = True
+        return self._generated_code
+    
+    @generated_code.setter
+    def generated_code(self, value):
+        self._generated_code = value
+        self._code_loaded = True
+        self._code_dirty = True
+    
+    @property
+    def has_code(self):
+        """Whether the project has generated code, without loading it"""
+        if self._code_loaded:
+            return bool(self._generated_code)
+        return self.code_hash is not None or self._has_legacy_code
+    
+    def _load_code(self):
+        if self.code_hash:
+            return ContentBlob.get(self.code_hash)
+        if self._has_legacy_code and self.id is not None:
+            # Rows saved before content_blobs existed keep their HTML inline
+            row = get_db().execute('SELECT generated_code FROM website_projects WHERE id = ?',
+                                   (self.id,)).fetchone()
+            return row[0] if row else None
+        return None
+    
+    def _store_code(self):
+        """Write pending generated code to the content store (without committing)"""
+        old_hash = self.code_hash
+        if self._generated_code:
+            self.code_hash = ContentBlob.put(self._generated_code, commit=False)
+        else:
+            self.code_hash = None
+        self._code_dirty = False
+        self._has_legacy_code = False
+        return old_hash
+    
+    def save(self, version_message=None):
+        """Save project to database, recording changed code as a new version"""
+        conn = get_db()
         cursor = conn.cursor()
         
+        old_hash = None
+        code_changed = self._code_dirty
+        if code_changed:
+            old_hash = self._store_code()
+        
         if self.id is None:
             # Create new project
             cursor.execute('''
-                INSERT INTO website_projects 
-                (user_id, project_name, description, website_type, requirements, 
-                 generated_code, status, created_at, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                INSERT INTO website_projects
+                (user_id, project_name, description, website_type, requirements,
+                 generated_code, code_hash, status, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, NULL, ?, ?, ?, ?)
             ''', (self.user_id, self.project_name, self.description, self.website_type,
-                  self.requirements, self.generated_code, self.status, 
+                  self.requirements, self.code_hash, self.status,
                   datetime.now(), datetime.now()))
             self.id = cursor.lastrowid
+        elif code_changed:
+            # Update existing project including its code
+            cursor.execute('''
+                UPDATE website_projects SET
+                project_name=?, description=?, website_type=?, requirements=?,
+                generated_code=NULL, code_hash=?, status=?, updated_at=?
+                WHERE id=? AND user_id=?
+            ''', (self.project_name, self.description, self.website_type,
+                  self.requirements, self.code_hash, self.status,
+                  datetime.now(), self.id, self.user_id))
         else:
-            # Update existing project
+            # Update metadata only
             cursor.execute('''
-                UPDATE website_projects SET 
+                UPDATE website_projects SET
                 project_name=?, description=?, website_type=?, requirements=?,
-                generated_code=?, status=?, updated_at=?
+                status=?, updated_at=?
                 WHERE id=? AND user_id=?
             ''', (self.project_name, self.description, self.website_type,
-                  self.requirements, self.generated_code, self.status,
+                  self.requirements, self.status,
                   datetime.now(), self.id, self.user_id))
         
+        self.saved_version = None
+        if code_changed and self._generated_code:
+            self.saved_version = ProjectVersion.record(self.id, self._generated_code, version_message,
+                                                       commit=False)
+        
+        if old_hash and old_hash != self.code_hash:
+            ContentBlob.release(old_hash, commit=False)
+        
         conn.commit()
-        conn.close()
+        
+        if code_changed:
+            # Precompress the preview once per save rather than once per view
+            if self.code_hash:
+                get_site_exporter().try_export(self.code_hash, self._generated_code)
+            if old_hash and old_hash != self.code_hash:
+                WebsiteProject._discard_export(old_hash)
         return self
     
     @staticmethod
-    def find_by_user(user_id, limit=50, offset=0):
-        """Find projects by user ID"""
-        conn = sqlite3.connect(current_app.config['DATABASE_PATH'])
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT * FROM website_projects 
-            WHERE user_id = ? 
-            ORDER BY updated_at DESC 
-            LIMIT ? OFFSET ?
-        ''', (user_id, limit, offset))
-        
-        rows = cursor.fetchall()
-        conn.close()
+    def _discard_export(code_hash):
+        """Remove a site's preview bundle once no project uses its content"""
+        in_use = get_db().execute('SELECT 1 FROM website_projects WHERE code_hash = ?',
+                                  (code_hash,)).fetchone()
+        if not in_use:
+            get_site_exporter().remove(code_hash)
+    
+    @staticmethod
+    def _from_row(row):
+        return WebsiteProject(
+            id=row['id'], user_id=row['user_id'], project_name=row['project_name'],
+            description=row['description'], website_type=row['website_type'],
+            requirements=row['requirements'], status=row['status'],
+            created_at=row['created_at'], updated_at=row['updated_at'],
+            code_hash=row['code_hash'], code_loaded=False,
+            has_legacy_code=bool(row['has_legacy_code'])
+        )
+    
+    @staticmethod
+    def row_to_dict(row, fields):
+        """Serialize a listing row from list_by_user without building a model"""
+        data = {name: row[name] for name in fields}
+        if 'has_code' in data:
+            data['has_code'] = bool(data['has_code'])
+        return data
+    
+    @staticmethod
+    def _select_by_user(columns, user_id, limit, offset=0, after=None):
+        """Rows of a user's projects, newest first, from an offset or an (updated_at, id) position"""
+        cursor = get_db().cursor()
+        cursor.row_factory = sqlite3.Row
         
-        projects = []
-        for row in rows:
-            projects.append(WebsiteProject(
-                id=row[0], user_id=row[1], project_name=row[2], description=row[3],
-                website_type=row[4], requirements=row[5], generated_code=row[6],
-                status=row[7], created_at=row[8], updated_at=row[9]
-            ))
+        if after is None:
+            cursor.execute(f'''
+                SELECT {columns} FROM website_projects
+                WHERE user_id = ?
+                ORDER BY updated_at DESC, id DESC
+                LIMIT ? OFFSET ?
+            ''', (user_id, limit, offset))
+        else:
+            # Seeks straight to the position on idx_projects_user_updated instead of skipping rows
+            cursor.execute(f'''
+                SELECT {columns} FROM website_projects
+                WHERE user_id = ? AND (updated_at, id) < (?, ?)
+                ORDER BY updated_at DESC, id DESC
+                LIMIT ?
+            ''', (user_id, after[0], after[1], limit))
         
-        return projects
+        return cursor.fetchall()
+    
+    @staticmethod
+    def find_by_user(user_id, limit=50, offset=0):
+        """Find projects by user ID"""
+        rows = WebsiteProject._select_by_user(PROJECT_COLUMNS, user_id, limit, offset=offset)
+        return [WebsiteProject._from_row(row) for row in rows]
+    
+    @staticmethod
+    def find_by_user_after(user_id, limit=50, after=None):
+        """Find projects by user ID that sort after an (updated_at, id) keyset position"""
+        rows = WebsiteProject._select_by_user(PROJECT_COLUMNS, user_id, limit, after=after)
+        return [WebsiteProject._from_row(row) for row in rows]
+    
+    @staticmethod
+    def list_by_user(user_id, fields, limit=50, offset=0, after=None):
+        """Listing rows holding only the requested fields (plus id and updated_at for cursors)"""
+        columns = select_fields(dict.fromkeys(('id', 'updated_at') + tuple(fields)))
+        return WebsiteProject._select_by_user(columns, user_id, limit, offset=offset, after=after)
+    
+    @staticmethod
+    def count_by_user(user_id):
+        """Number of projects a user has, from the trigger-maintained counter"""
+        row = get_db().execute('SELECT project_count FROM user_project_counts WHERE user_id = ?',
+                               (user_id,)).fetchone()
+        return row[0] if row else 0
     
     @staticmethod
     def find_by_id(project_id, user_id):
         """Find project by ID and user ID"""
-        conn = sqlite3.connect(current_app.config['DATABASE_PATH'])
+        conn = get_db()
         cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
         
-        cursor.execute('''
-            SELECT * FROM website_projects 
+        cursor.execute(f'''
+            SELECT {PROJECT_COLUMNS} FROM website_projects
             WHERE id = ? AND user_id = ?
         ''', (project_id, user_id))
         
         row = cursor.fetchone()
-        conn.close()
         
         if row:
-            return WebsiteProject(
-                id=row[0], user_id=row[1], project_name=row[2], description=row[3],
-                website_type=row[4], requirements=row[5], generated_code=row[6],
-                status=row[7], created_at=row[8], updated_at=row[9]
-            )
+            return WebsiteProject._from_row(row)
         return None
     
+    @staticmethod
+    def find_owned(project_ids, user_id):
+        """Map each of the given project IDs the user owns to its code hash, in one query"""
+        if not project_ids:
+            return {}
+        placeholders = ', '.join('?' * len(project_ids))
+        rows = get_db().execute(f'''
+            SELECT id, code_hash FROM website_projects
+            WHERE user_id = ? AND id IN ({placeholders})
+        ''', (user_id, *project_ids)).fetchall()
+        return dict(rows)
+    
+    @staticmethod
+    def create_many(projects):
+        """Insert new projects in a single transaction"""
+        conn = get_db()
+        cursor = conn.cursor()
+        now = datetime.now()
+        
+        for project in projects:
+            cursor.execute('''
+                INSERT INTO website_projects
+                (user_id, project_name, description, website_type, requirements,
+                 generated_code, code_hash, status, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, NULL, NULL, ?, ?, ?)
+            ''', (project.user_id, project.project_name, project.description, project.website_type,
+                  project.requirements, project.status, now, now))
+            project.id = cursor.lastrowid
+        
+        conn.commit()
+        return projects
+    
+    @staticmethod
+    def update_status_many(project_ids, user_id, status):
+        """Set the status of several projects in one statement; returns the IDs updated"""
+        owned = list(WebsiteProject.find_owned(project_ids, user_id))
+        if owned:
+            conn = get_db()
+            placeholders = ', '.join('?' * len(owned))
+            conn.execute(f'''
+                UPDATE website_projects SET status = ?, updated_at = ?
+                WHERE user_id = ? AND id IN ({placeholders})
+            ''', (status, datetime.now(), user_id, *owned))
+            conn.commit()
+        return set(owned)
+    
+    @staticmethod
+    def delete_many(project_ids, user_id):
+        """Delete several projects in one transaction; returns the IDs deleted"""
+        owned = WebsiteProject.find_owned(project_ids, user_id)
+        if not owned:
+            return set()
+        
+        conn = get_db()
+        placeholders = ', '.join('?' * len(owned))
+        conn.execute(f'DELETE FROM website_projects WHERE user_id = ? AND id IN ({placeholders})',
+                     (user_id, *owned))
+        ProjectVersion.delete_for(list(owned), commit=False)
+        code_hashes = {code_hash for code_hash in owned.values() if code_hash}
+        for code_hash in code_hashes:
+            ContentBlob.release(code_hash, commit=False)
+        conn.commit()
+        
+        for code_hash in code_hashes:
+            WebsiteProject._discard_export(code_hash)
+        return set(owned)
+    
+    @staticmethod
+    def iter_by_user(user_id, project_ids=None, include_code=True, page_size=100):
+        """Yield a user's projects (or the given ones) in ID order, a page of rows at a time"""
+        id_filter = ''
+        params = ()
+        if project_ids is not None:
+            if not project_ids:
+                return
+            id_filter = f"AND id IN ({', '.join('?' * len(project_ids))})"
+            params = tuple(project_ids)
+        
+        last_id = 0
+        while True:
+            cursor = get_db().cursor()
+            cursor.row_factory = sqlite3.Row
+            cursor.execute(f'''
+                SELECT {PROJECT_COLUMNS} FROM website_projects
+                WHERE user_id = ? AND id > ? {id_filter}
+                ORDER BY id
+                LIMIT ?
+            ''', (user_id, last_id, *params, page_size))
+            projects = [WebsiteProject._from_row(row) for row in cursor.fetchall()]
+            if not projects:
+                return
+            
+            if include_code:
+                # One blob query per page instead of one per project
+                code = ContentBlob.get_many([p.code_hash for p in projects if p.code_hash])
+                for project in projects:
+                    if project.code_hash in code:
+                        project._generated_code = code[project.code_hash]
+                        project._code_loaded = True
+            
+            yield from projects
+            last_id = projects[-1].id
+    
     def delete(self):
         """Delete project from database"""
         if self.id:
-            conn = sqlite3.connect(current_app.config['DATABASE_PATH'])
+            conn = get_db()
             cursor = conn.cursor()
             
-            cursor.execute('DELETE FROM website_projects WHERE id = ? AND user_id = ?', 
+            cursor.execute('DELETE FROM website_projects WHERE id = ? AND user_id = ?',
                           (self.id, self.user_id))
+            ProjectVersion.delete_for([self.id], commit=False)
+            ContentBlob.release(self.code_hash, commit=False)
             
             conn.commit()
-            conn.close()
+            if self.code_hash:
+                WebsiteProject._discard_export(self.code_hash)
             return True
         return False
     
-    def to_dict(self):
-        """Convert project to dictionary"""
-        return {
-            'id': self.id,
-            'user_id': self.user_id,
-            'project_name': self.project_name,
-            'description': self.description,
-            'website_type': self.website_type,
-            'requirements': self.requirements,
-            'generated_code': self.generated_code,
-            'status': self.status,
-            'created_at': self.created_at,
-            'updated_at': self.updated_at
-        }
\ No newline at end of file
+    def to_dict(self, include_code=True, fields=None):
+        """Convert project to dictionary, optionally only the given fields"""
+        data = {name: getattr(self, name) for name in (fields or PROJECT_FIELDS)}
+        if include_code and fields is None:
+            data['generated_code'] = self.generated_code
+        return data
\ No newline at end of file
@@ -0,0 +1,178 @@
+import difflib
+import json
+import sqlite3
+from datetime import datetime
+from flask import current_app
+from app.db import get_db
+from app.models.content_blob import ContentBlob
+
+# Store a snapshot instead of a delta when the delta is at least this share of the snapshot
+MAX_DELTA_RATIO = 0.5
+
+def make_delta(parent, text):
+    """Line delta turning ``parent`` into ``text``.
+
+    A JSON list where ``[start, end]`` copies parent lines and a string is
+    inserted as is. Lines shared at both ends are matched before running
+    SequenceMatcher, since most edits only touch the middle of a page.
+    """
+    old = parent.splitlines(keepends=True)
+    new = text.splitlines(keepends=True)
+    
+    head = 0
+    while head < min(len(old), len(new)) and old[head] == new[head]:
+        head += 1
+    tail = 0
+    while tail < min(len(old), len(new)) - head and old[-1 - tail] == new[-1 - tail]:
+        tail += 1
+    
+    ops = [[0, head]] if head else []
+    matcher = difflib.SequenceMatcher(None, old[head:len(old) - tail], new[head:len(new) - tail],
+                                      autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([head + i1, head + i2])
+        elif j2 > j1:
+            ops.append(''.join(new[head + j1:head + j2]))
+    if tail:
+        ops.append([len(old) - tail, len(old)])
+    return json.dumps(ops, separators=(',', ':'))
+
+def apply_delta(parent, delta):
+    """Rebuild a text from its parent and a delta from make_delta"""
+    old = parent.splitlines(keepends=True)
+    parts = []
+    for op in json.loads(delta):
+        if isinstance(op, list):
+            parts.extend(old[op[0]:op[1]])
+        else:
+            parts.append(op)
+    return ''.join(parts)
+
+class ProjectVersion:
+    """Every saved revision of a project's generated code.
+
+    Versions are numbered per project and each one's parent is the version
+    before it. A version is stored as a compressed line delta against its
+    parent, or as a compressed snapshot of the full page for the first
+    version, every ``VERSION_SNAPSHOT_INTERVAL`` versions, and whenever the
+    delta would not be much smaller. Rebuilding a version therefore reads
+    one snapshot and at most ``VERSION_SNAPSHOT_INTERVAL - 1`` deltas.
+    """
+    
+    COLUMNS = 'version, parent_version, kind, size, stored_size, content_hash, message, created_at'
+    
+    @staticmethod
+    def record(project_id, text, message=None, commit=True):
+        """Store text as the project's next version; returns its number (None if unchanged)"""
+        conn = get_db()
+        content_hash = ContentBlob.content_hash(text)
+        head = conn.execute('''
+            SELECT version, content_hash FROM project_versions
+            WHERE project_id = ? ORDER BY version DESC LIMIT 1
+        ''', (project_id,)).fetchone()
+        if head and head[1] == content_hash:
+            return None
+        
+        version = head[0] + 1 if head else 1
+        parent_version = head[0] if head else None
+        kind, (codec, data) = 'snapshot', ContentBlob.compress(text)
+        
+        if head:
+            snapshot = conn.execute('''
+                SELECT MAX(version) FROM project_versions
+                WHERE project_id = ? AND kind = 'snapshot'
+            ''', (project_id,)).fetchone()[0]
+            if version - (snapshot or 0) < current_app.config['VERSION_SNAPSHOT_INTERVAL']:
+                delta_codec, delta = ContentBlob.compress(
+                    make_delta(ProjectVersion.get_text(project_id, parent_version), text))
+                if len(delta) < MAX_DELTA_RATIO * len(data):
+                    kind, codec, data = 'delta', delta_codec, delta
+        
+        conn.execute('''
+            INSERT INTO project_versions
+            (project_id, version, parent_version, kind, codec, data, size, stored_size,
+             content_hash, message, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (project_id, version, parent_version, kind, codec, data, len(text.encode('utf-8')),
+              len(data), content_hash, message, datetime.now()))
+        if commit:
+            conn.commit()
+        return version
+    
+    @staticmethod
+    def get_text(project_id, version):
+        """Rebuild a version from its nearest snapshot; None if it doesn't exist"""
+        rows = get_db().execute('''
+            SELECT version, kind, codec, data, content_hash FROM project_versions
+            WHERE project_id = ? AND version <= ? AND version >= (
+                SELECT MAX(version) FROM project_versions
+                WHERE project_id = ? AND version <= ? AND kind = 'snapshot'
+            )
+            ORDER BY version
+        ''', (project_id, version, project_id, version)).fetchall()
+        if not rows or rows[-1][0] != version:
+            return None
+        
+        text = None
+        for _, kind, codec, data, _ in rows:
+            content = ContentBlob.decompress(codec, data)
+            text = content if kind == 'snapshot' else apply_delta(text, content)
+        
+        if ContentBlob.content_hash(text) != rows[-1][4]:
+            raise RuntimeError(f"Version {version} of project {project_id} failed its integrity check")
+        return text
+    
+    @staticmethod
+    def find_by_project(project_id, limit=50, before=None):
+        """Version metadata, newest first, optionally only versions before a number"""
+        cursor = get_db().cursor()
+        cursor.row_factory = sqlite3.Row
+        
+        where = 'project_id = ?'
+        params = [project_id]
+        if before is not None:
+            where += ' AND version < ?'
+            params.append(before)
+        
+        cursor.execute(f'''
+            SELECT {ProjectVersion.COLUMNS} FROM project_versions
+            WHERE {where}
+            ORDER BY version DESC
+            LIMIT ?
+        ''', (*params, limit))
+        return [dict(row) for row in cursor.fetchall()]
+    
+    @staticmethod
+    def find(project_id, version):
+        """Metadata of one version, or None"""
+        cursor = get_db().cursor()
+        cursor.row_factory = sqlite3.Row
+        cursor.execute(f'''
+            SELECT {ProjectVersion.COLUMNS} FROM project_versions
+            WHERE project_id = ? AND version = ?
+        ''', (project_id, version))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+    
+    @staticmethod
+    def storage(project_id):
+        """Number of versions and their total size, as written and as stored"""
+        row = get_db().execute('''
+            SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(stored_size), 0),
+                   COALESCE(SUM(kind = 'snapshot'), 0)
+            FROM project_versions WHERE project_id = ?
+        ''', (project_id,)).fetchone()
+        return {'versions': row[0], 'size': row[1], 'stored_size': row[2], 'snapshots': row[3]}
+    
+    @staticmethod
+    def delete_for(project_ids, commit=True):
+        """Delete every version of the given projects"""
+        if not project_ids:
+            return
+        conn = get_db()
+        placeholders = ', '.join('?' * len(project_ids))
+        conn.execute(f'DELETE FROM project_versions WHERE project_id IN ({placeholders})',
+                     tuple(project_ids))
+        if commit:
+            conn.commit()
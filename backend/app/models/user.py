@@ -1,10 +1,16 @@
-import sqlite3
-import hashlib
 import secrets
+import sqlite3
 from datetime import datetime, timedelta
-from flask import current_app
+from app.db import get_db
+from app.services.password_hasher import get_password_hasher, PasswordHasherBusyError
+from app.services.user_cache import get_user_cache
+
+USER_COLUMNS = 'id, username, email, password_hash, full_name, created_at, updated_at, is_active'
 
 class User:
+    __slots__ = ('id', 'username', 'email', 'password_hash', 'full_name',
+                 'created_at', 'updated_at', 'is_active')
+    
     def __init__(self, id=None, username=None, email=None, password_hash=None, 
                  full_name=None, created_at=None, updated_at=None, is_active=True):
         self.id = id
@@ -18,17 +24,36 @@ class User:
     
     @staticmethod
     def hash_password(password):
-        """Hash password using SHA-256"""
-        return hashlib.sha256(password.encode()).hexdigest()
+        """Hash password with the configured salted KDF (off the request thread)"""
+        return get_password_hasher().hash(password)
     
     @staticmethod
     def verify_password(password, password_hash):
         """Verify password against hash"""
-        return hashlib.sha256(password.encode()).hexdigest() == password_hash
+        matches, _ = get_password_hasher().verify(password, password_hash)
+        return matches
+    
+    def check_password(self, password):
+        """Verify the user's password, upgrading an outdated hash on success"""
+        matches, needs_rehash = get_password_hasher().verify(password, self.password_hash)
+        if matches and needs_rehash:
+            try:
+                self.update_password_hash(User.hash_password(password))
+            except PasswordHasherBusyError:
+                pass  # Upgrade on a later login instead of failing this one
+        return matches
+    
+    def update_password_hash(self, password_hash):
+        """Replace the stored password hash"""
+        conn = get_db()
+        conn.execute('UPDATE users SET password_hash=?, updated_at=? WHERE id=?',
+                     (password_hash, datetime.now(), self.id))
+        User._invalidate(conn, self.id)
+        self.password_hash = password_hash
     
     def save(self):
         """Save user to database"""
-        conn = sqlite3.connect(current_app.config['DATABASE_PATH'])
+        conn = get_db()
         cursor = conn.cursor()
         
         if self.id is None:
@@ -39,67 +64,83 @@ class User:
             ''', (self.username, self.email, self.password_hash, self.full_name, 
                   datetime.now(), datetime.now()))
             self.id = cursor.lastrowid
+            conn.commit()
         else:
             # Update existing user
             cursor.execute('''
                 UPDATE users SET username=?, email=?, full_name=?, updated_at=?
                 WHERE id=?
             ''', (self.username, self.email, self.full_name, datetime.now(), self.id))
+            User._invalidate(conn, self.id)
         
-        conn.commit()
-        conn.close()
         return self
     
     @staticmethod
-    def find_by_email(email):
-        """Find user by email"""
-        conn = sqlite3.connect(current_app.config['DATABASE_PATH'])
-        cursor = conn.cursor()
+    def _invalidate(conn, user_id):
+        """Commit a change to a user and drop it from every process's cache"""
+        cache = get_user_cache()
+        if cache is not None:
+            cache.bump_version(conn)
+        conn.commit()
+        if cache is not None:
+            cache.invalidate(user_id)
+    
+    @staticmethod
+    def _find(field, value):
+        """Find an active user by id, email or username, going through the user cache"""
+        cache = get_user_cache()
+        row = cache.get(field, value) if cache is not None else None
         
-        cursor.execute('SELECT * FROM users WHERE email = ? AND is_active = TRUE', (email,))
-        row = cursor.fetchone()
-        conn.close()
+        if row is None:
+            conn = get_db()
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            
+            cursor.execute(f'SELECT {USER_COLUMNS} FROM users WHERE {field} = ? AND is_active = TRUE', (value,))
+            row = cursor.fetchone()
+            
+            if row and cache is not None:
+                cache.put(row, {'email': row['email'], 'username': row['username']})
         
         if row:
             return User(
-                id=row[0], username=row[1], email=row[2], password_hash=row[3],
-                full_name=row[4], created_at=row[5], updated_at=row[6], is_active=row[7]
+                id=row['id'], username=row['username'], email=row['email'],
+                password_hash=row['password_hash'], full_name=row['full_name'],
+                created_at=row['created_at'], updated_at=row['updated_at'], is_active=row['is_active']
             )
         return None
     
+    @staticmethod
+    def find_by_email(email):
+        """Find user by email"""
+        return User._find('email', email)
+    
     @staticmethod
     def find_by_username(username):
         """Find user by username"""
-        conn = sqlite3.connect(current_app.config['DATABASE_PATH'])
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM users WHERE username = ? AND is_active = TRUE', (username,))
-        row = cursor.fetchone()
-        conn.close()
-        
-        if row:
-            return User(
-                id=row[0], username=row[1], email=row[2], password_hash=row[3],
-                full_name=row[4], created_at=row[5], updated_at=row[6], is_active=row[7]
-            )
-        return None
+        return User._find('username', username)
     
     @staticmethod
     def find_by_id(user_id):
         """Find user by ID"""
-        conn = sqlite3.connect(current_app.config['DATABASE_PATH'])
+        return User._find('id', user_id)
+    
+    @staticmethod
+    def find_conflicts(email, username):
+        """Which of an email and username are already registered, in one query"""
+        conn = get_db()
         cursor = conn.cursor()
         
-        cursor.execute('SELECT * FROM users WHERE id = ? AND is_active = TRUE', (user_id,))
-        row = cursor.fetchone()
-        conn.close()
+        cursor.execute('''
+            SELECT email = ?, username = ? FROM users
+            WHERE email = ? OR username = ?
+        ''', (email, username, email, username))
+        rows = cursor.fetchall()
         
-        if row:
-            return User(
-                id=row[0], username=row[1], email=row[2], password_hash=row[3],
-                full_name=row[4], created_at=row[5], updated_at=row[6], is_active=row[7]
-            )
-        return None
+        return {
+            'email': any(row[0] for row in rows),
+            'username': any(row[1] for row in rows)
+        }
     
     def to_dict(self):
         """Convert user to dictionary (excluding password)"""
@@ -0,0 +1,31 @@
+import base64
+import json
+
+MAX_PAGE_SIZE = 100
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor can't be decoded"""
+    pass
+
+def page_size(value, default):
+    """Clamp a requested page size to 1..MAX_PAGE_SIZE"""
+    if value is None:
+        return default
+    return max(1, min(value, MAX_PAGE_SIZE))
+
+def encode_cursor(*values):
+    """Encode the sort key of the last row on a page as an opaque token"""
+    raw = json.dumps(list(values), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(token, size):
+    """Decode a token from encode_cursor into a tuple of ``size`` values"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor("Invalid pagination cursor")
+    
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor("Invalid pagination cursor")
+    return tuple(values)
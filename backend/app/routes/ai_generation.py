@@ -1,7 +1,12 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.models.project import WebsiteProject
 from app.services.ai_service import AIService
+from app.services.job_queue import get_job_queue, QueueFullError
+from app.services.generation import generate_once, GenerationError
+from app.services.rate_limiter import get_rate_limiter, RateLimitError
+from app.pagination import InvalidCursor, encode_cursor, decode_cursor, page_size
+import json
 import time
 
 ai_bp = Blueprint('ai', __name__)
@@ -24,46 +29,42 @@ def generate_website():
         
         project_id = data['project_id']
         prompt = data['prompt'].strip()
+        use_cache = data.get('use_cache', True)
+        
+        # "sections" builds large sites from an outline, one section per parallel call
+        kind = 'sections' if data.get('mode') == 'sections' else 'generate'
         
         # Get project
         project = WebsiteProject.find_by_id(project_id, user_id)
         if not project:
             return jsonify({'error': 'Project not found'}), 404
         
-        # Generate website using AI
-        start_time = time.time()
-        ai_service = AIService()
+        # Hand off to the background workers if requested
+        if data.get('async'):
+            return enqueue_job(user_id, project_id, prompt, kind, use_cache)
         
+        # Generate website using AI (identical in-flight requests share one call)
         try:
-            generated_code = ai_service.generate_website_code(prompt, project.website_type)
-            generation_time = time.time() - start_time
-            
-            # Update project with generated code
-            project.generated_code = generated_code
-            project.status = 'generated'
-            project.save()
-            
-            # Log generation history
-            ai_service.log_generation(project_id, prompt, generated_code, generation_time, True)
-            
-            return jsonify({
-                'message': 'Website generated successfully',
-                'project': project.to_dict(),
-                'generation_time': generation_time
-            }), 200
-            
-        except Exception as ai_error:
-            generation_time = time.time() - start_time
-            error_message = str(ai_error)
-            
-            # Log failed generation
-            ai_service.log_generation(project_id, prompt, None, generation_time, False, error_message)
-            
+            result, shared = generate_once(project, prompt, kind, use_cache)
+        except RateLimitError as e:
+            return rate_limited_response(e)
+        except GenerationError as ai_error:
             return jsonify({
                 'error': 'AI generation failed',
-                'details': error_message
+                'details': str(ai_error)
             }), 500
         
+        if shared:
+            project = WebsiteProject.find_by_id(project_id, user_id)
+        
+        return jsonify({
+            'message': 'Website generated successfully',
+            'project': project.to_dict(),
+            'generation_time': result['generation_time'],
+            'cached': result['cached'],
+            'deduplicated': shared
+        }), 200
+        
     except Exception as e:
         return jsonify({'error': 'Generation request failed', 'details': str(e)}), 500
 
@@ -85,6 +86,7 @@ def regenerate_website():
         
         project_id = data['project_id']
         modifications = data['modifications'].strip()
+        use_cache = data.get('use_cache', True)
         
         # Get project
         project = WebsiteProject.find_by_id(project_id, user_id)
@@ -94,48 +96,358 @@ def regenerate_website():
         if not project.generated_code:
             return jsonify({'error': 'No existing code to modify. Generate website first.'}), 400
         
-        # Regenerate with modifications
+        # Hand off to the background workers if requested
+        if data.get('async'):
+            return enqueue_job(user_id, project_id, modifications, 'regenerate', use_cache)
+        
+        # Regenerate with modifications (identical in-flight requests share one call)
+        try:
+            result, shared = generate_once(project, modifications, 'regenerate', use_cache)
+        except RateLimitError as e:
+            return rate_limited_response(e)
+        except GenerationError as ai_error:
+            return jsonify({
+                'error': 'AI regeneration failed',
+                'details': str(ai_error)
+            }), 500
+        
+        if shared:
+            project = WebsiteProject.find_by_id(project_id, user_id)
+        
+        return jsonify({
+            'message': 'Website regenerated successfully',
+            'project': project.to_dict(),
+            'generation_time': result['generation_time'],
+            'cached': result['cached'],
+            'deduplicated': shared
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Regeneration request failed', 'details': str(e)}), 500
+
+@ai_bp.route('/generate-website/stream', methods=['POST'])
+@ai_bp.route('/generate-website/stream/', methods=['POST'])
+@jwt_required()
+def generate_website_stream():
+    """Generate website using AI, streaming the code as Server-Sent Events"""
+    try:
+        user_id = int(get_jwt_identity())
+        data = request.get_json()
+        
+        # Validate required fields
+        if not data.get('project_id'):
+            return jsonify({'error': 'Project ID is required'}), 400
+        
+        if not data.get('prompt'):
+            return jsonify({'error': 'Website description/prompt is required'}), 400
+        
+        prompt = data['prompt'].strip()
+        
+        # Get project
+        project = WebsiteProject.find_by_id(data['project_id'], user_id)
+        if not project:
+            return jsonify({'error': 'Project not found'}), 404
+        
+        ai_service = AIService(user_id=user_id)
+        chunks = ai_service.stream_website_code(prompt, project.website_type,
+                                                current_app.config['MAX_CONTINUATIONS'])
+        
+        return stream_generation(ai_service, project, chunks, prompt, 'generated')
+        
+    except Exception as e:
+        return jsonify({'error': 'Generation request failed', 'details': str(e)}), 500
+
+@ai_bp.route('/regenerate-website/stream', methods=['POST'])
+@ai_bp.route('/regenerate-website/stream/', methods=['POST'])
+@jwt_required()
+def regenerate_website_stream():
+    """Regenerate website with modifications, streaming the code as Server-Sent Events"""
+    try:
+        user_id = int(get_jwt_identity())
+        data = request.get_json()
+        
+        # Validate required fields
+        if not data.get('project_id'):
+            return jsonify({'error': 'Project ID is required'}), 400
+        
+        if not data.get('modifications'):
+            return jsonify({'error': 'Modification instructions are required'}), 400
+        
+        modifications = data['modifications'].strip()
+        
+        # Get project
+        project = WebsiteProject.find_by_id(data['project_id'], user_id)
+        if not project:
+            return jsonify({'error': 'Project not found'}), 404
+        
+        if not project.generated_code:
+            return jsonify({'error': 'No existing code to modify. Generate website first.'}), 400
+        
+        ai_service = AIService(user_id=user_id)
+        chunks = ai_service.stream_modified_code(project.generated_code, modifications,
+                                                 project.website_type, current_app.config['MAX_CONTINUATIONS'])
+        
+        return stream_generation(ai_service, project, chunks,
+                                 f"Modifications: {modifications}", 'regenerated')
+        
+    except Exception as e:
+        return jsonify({'error': 'Regeneration request failed', 'details': str(e)}), 500
+
+def sse_event(event, data):
+    """Format a Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_generation(ai_service, project, chunks, history_prompt, status):
+    """Relay streamed code to the client, then persist the finished document"""
+    def events():
         start_time = time.time()
-        ai_service = AIService()
+        parts = []
         
         try:
-            modified_code = ai_service.modify_website_code(
-                project.generated_code, 
-                modifications, 
-                project.website_type
-            )
+            for chunk in chunks:
+                parts.append(chunk)
+                yield sse_event('chunk', {'content': chunk})
+            
             generation_time = time.time() - start_time
+            generated_code = ''.join(parts)
             
-            # Update project
-            project.generated_code = modified_code
-            project.status = 'regenerated'
-            project.save()
+            # Update project with the complete code
+            project.generated_code = generated_code
+            project.status = status
+            project.save(version_message=history_prompt)
             
             # Log generation history
-            ai_service.log_generation(project_id, f"Modifications: {modifications}", 
-                                    modified_code, generation_time, True)
+            ai_service.log_generation(project.id, history_prompt, generated_code, generation_time, True,
+                                      version=project.saved_version)
             
-            return jsonify({
-                'message': 'Website regenerated successfully',
+            yield sse_event('done', {
+                'message': 'Website generated successfully',
                 'project': project.to_dict(),
                 'generation_time': generation_time
-            }), 200
+            })
             
         except Exception as ai_error:
             generation_time = time.time() - start_time
             error_message = str(ai_error)
             
             # Log failed generation
-            ai_service.log_generation(project_id, f"Modifications: {modifications}", 
-                                    None, generation_time, False, error_message)
+            ai_service.log_generation(project.id, history_prompt, None, generation_time, False, error_message)
             
-            return jsonify({
-                'error': 'AI regeneration failed',
+            yield sse_event('error', {
+                'error': 'AI generation failed',
                 'details': error_message
+            })
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def is_project_id(value):
+    """Whether a JSON value is a project ID (true == 1, so booleans are excluded)"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def rate_limited_response(error):
+    """429 telling the client when upstream budget should be available again"""
+    response = jsonify({'error': str(error), 'retry_after': round(error.retry_after, 1)})
+    response.headers['Retry-After'] = str(max(1, int(error.retry_after + 0.999)))
+    return response, 429
+
+def enqueue_job(user_id, project_id, prompt, kind, use_cache=True):
+    """Queue a generation job and return its ID without waiting for the AI"""
+    try:
+        job_id = get_job_queue().submit(user_id, project_id, prompt, kind, use_cache)
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 429
+    
+    return jsonify({
+        'message': 'Generation job queued',
+        'job_id': job_id,
+        'status': 'queued'
+    }), 202
+
+@ai_bp.route('/jobs/<job_id>', methods=['GET'])
+@ai_bp.route('/jobs/<job_id>/', methods=['GET'])
+@jwt_required()
+def get_job_status(job_id):
+    """Get status and progress of a generation job"""
+    try:
+        user_id = int(get_jwt_identity())
+        job = get_job_queue().get_job(job_id, user_id)
+        
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        
+        return jsonify({
+            'job': {
+                'id': job['id'],
+                'project_id': job['project_id'],
+                'kind': job['kind'],
+                'status': job['status'],
+                'progress': job['progress'],
+                'queue_position': job['queue_position'],
+                'error_message': job['error_message'],
+                'generation_time': job['generation_time'],
+                'created_at': job['created_at'],
+                'started_at': job['started_at'],
+                'finished_at': job['finished_at']
+            }
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to get job status', 'details': str(e)}), 500
+
+@ai_bp.route('/jobs/<job_id>/result', methods=['GET'])
+@ai_bp.route('/jobs/<job_id>/result/', methods=['GET'])
+@jwt_required()
+def get_job_result(job_id):
+    """Get the generated project once a job has completed"""
+    try:
+        user_id = int(get_jwt_identity())
+        job = get_job_queue().get_job(job_id, user_id)
+        
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        
+        if job['status'] == 'failed':
+            return jsonify({
+                'error': 'AI generation failed',
+                'details': job['error_message']
             }), 500
         
+        if job['status'] != 'completed':
+            return jsonify({
+                'message': 'Job not finished yet',
+                'status': job['status'],
+                'progress': job['progress']
+            }), 202
+        
+        project = WebsiteProject.find_by_id(job['project_id'], user_id)
+        if not project:
+            return jsonify({'error': 'Project not found'}), 404
+        
+        return jsonify({
+            'message': 'Website generated successfully',
+            'project': project.to_dict(),
+            'generation_time': job['generation_time']
+        }), 200
+        
     except Exception as e:
-        return jsonify({'error': 'Regeneration request failed', 'details': str(e)}), 500
+        return jsonify({'error': 'Failed to get job result', 'details': str(e)}), 500
+
+@ai_bp.route('/generate-batch', methods=['POST'])
+@ai_bp.route('/generate-batch/', methods=['POST'])
+@jwt_required()
+def generate_batch():
+    """Queue website generation for many projects at once"""
+    try:
+        user_id = int(get_jwt_identity())
+        data = request.get_json() or {}
+        items = data.get('items')
+        use_cache = data.get('use_cache', True)
+        kind = 'sections' if data.get('mode') == 'sections' else 'generate'
+        max_items = current_app.config['GENERATION_BATCH_MAX_ITEMS']
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'A list of items with project_id and prompt is required'}), 400
+        if len(items) > max_items:
+            return jsonify({'error': f'At most {max_items} items per batch'}), 400
+        
+        # Check ownership of every project in one query
+        project_ids = [item.get('project_id') for item in items if isinstance(item, dict)]
+        project_ids = [pid for pid in project_ids if is_project_id(pid)]
+        owned = WebsiteProject.find_owned(list(dict.fromkeys(project_ids)), user_id)
+        
+        results = []
+        accepted = []
+        seen = set()
+        for index, item in enumerate(items):
+            item = item if isinstance(item, dict) else {}
+            project_id = item.get('project_id')
+            prompt = item.get('prompt')
+            
+            if not isinstance(prompt, str) or not prompt.strip():
+                error = 'Website description/prompt is required'
+            elif not is_project_id(project_id) or project_id not in owned:
+                error = 'Project not found'
+            elif project_id in seen:
+                error = 'Project appears more than once in the batch'
+            else:
+                error = None
+                seen.add(project_id)
+                accepted.append((index, project_id, prompt.strip()))
+            results.append({'index': index, 'project_id': project_id, 'error': error})
+        
+        if not accepted:
+            return jsonify({'error': 'No valid items in batch', 'results': results}), 400
+        
+        try:
+            batch_id, job_ids = get_job_queue().submit_batch(
+                user_id, [(project_id, prompt) for _, project_id, prompt in accepted], kind, use_cache)
+        except QueueFullError as e:
+            return jsonify({'error': str(e)}), 429
+        
+        for (index, _, _), job_id in zip(accepted, job_ids):
+            results[index] = {'index': index, 'project_id': results[index]['project_id'],
+                              'job_id': job_id, 'status': 'queued'}
+        
+        return jsonify({
+            'message': f'Queued {len(job_ids)} of {len(items)} generations',
+            'batch_id': batch_id,
+            'results': results
+        }), 202
+    
+    except Exception as e:
+        return jsonify({'error': 'Batch generation request failed', 'details': str(e)}), 500
+
+@ai_bp.route('/batches/<batch_id>', methods=['GET'])
+@ai_bp.route('/batches/<batch_id>/', methods=['GET'])
+@jwt_required()
+def get_batch_status(batch_id):
+    """Get overall and per-item progress of a batch generation"""
+    try:
+        user_id = int(get_jwt_identity())
+        jobs = get_job_queue().get_batch(batch_id, user_id)
+        
+        if not jobs:
+            return jsonify({'error': 'Batch not found'}), 404
+        
+        counts = {'queued': 0, 'running': 0, 'completed': 0, 'failed': 0}
+        for job in jobs:
+            counts[job['status']] = counts.get(job['status'], 0) + 1
+        
+        return jsonify({
+            'batch': {
+                'id': batch_id,
+                'total': len(jobs),
+                'counts': counts,
+                'done': counts['completed'] + counts['failed'] == len(jobs)
+            },
+            'jobs': jobs
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': 'Failed to get batch status', 'details': str(e)}), 500
+
+@ai_bp.route('/usage', methods=['GET'])
+@ai_bp.route('/usage/', methods=['GET'])
+@jwt_required()
+def get_usage():
+    """Get the user's AI requests and token usage over the last 24 hours"""
+    try:
+        user_id = int(get_jwt_identity())
+        limiter = get_rate_limiter()
+        
+        if limiter is None:
+            return jsonify({'usage': None}), 200
+        
+        return jsonify({
+            'usage': limiter.usage(user_id),
+            'limits': {'requests_per_minute': limiter.user_rpm, 'tokens_per_minute': limiter.user_tpm}
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': 'Failed to get usage', 'details': str(e)}), 500
 
 @ai_bp.route('/generation-history/<int:project_id>', methods=['GET'])
 @ai_bp.route('/generation-history/<int:project_id>/', methods=['GET'])
@@ -145,15 +457,53 @@ def get_generation_history(project_id):
     try:
         user_id = int(get_jwt_identity())
         
+        # Verify project ownership
+        project = WebsiteProject.find_by_id(project_id, user_id)
+        if not project:
+            return jsonify({'error': 'Project not found'}), 404
+        
+        per_page = page_size(request.args.get('per_page', type=int), 20)
+        cursor = request.args.get('cursor')
+        after = None
+        if cursor:
+            try:
+                after = decode_cursor(cursor, 2)
+            except InvalidCursor as e:
+                return jsonify({'error': str(e)}), 400
+        
+        ai_service = AIService()
+        history = ai_service.get_generation_history(project_id, limit=per_page + 1, after=after)
+        
+        next_cursor = None
+        has_more = len(history) > per_page
+        history = history[:per_page]
+        if has_more and history:
+            next_cursor = encode_cursor(history[-1]['created_at'], history[-1]['id'])
+        
+        return jsonify({'history': history, 'next_cursor': next_cursor}), 200
+    
+    except Exception as e:
+        return jsonify({'error': 'Failed to get generation history', 'details': str(e)}), 500
+
+@ai_bp.route('/generation-history/<int:project_id>/<int:entry_id>/output', methods=['GET'])
+@ai_bp.route('/generation-history/<int:project_id>/<int:entry_id>/output/', methods=['GET'])
+@jwt_required()
+def get_generation_output(project_id, entry_id):
+    """Get the generated HTML of one history entry"""
+    try:
+        user_id = int(get_jwt_identity())
+        
         # Verify project ownership
         project = WebsiteProject.find_by_id(project_id, user_id)
         if not project:
             return jsonify({'error': 'Project not found'}), 404
         
         ai_service = AIService()
-        history = ai_service.get_generation_history(project_id)
+        found, output = ai_service.get_generation_output(project_id, entry_id)
+        if not found:
+            return jsonify({'error': 'History entry not found'}), 404
         
-        return jsonify({'history': history}), 200
+        return jsonify({'id': entry_id, 'generated_output': output}), 200
         
     except Exception as e:
-        return jsonify({'error': 'Failed to get generation history', 'details': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': 'Failed to get generation output', 'details': str(e)}), 500
\ No newline at end of file
@@ -1,7 +1,9 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 from app.models.user import User
+from app.services.password_hasher import PasswordHasherBusyError
 import re
+import sqlite3
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -16,6 +18,12 @@ def validate_password(password):
         return False, "Password must be at least 6 characters long"
     return True, "Valid password"
 
+def busy_response(error):
+    """503 telling the client to retry when password hashing is saturated"""
+    response = jsonify({'error': str(error)})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
 @auth_bp.route('/register', methods=['POST'])
 @auth_bp.route('/register/', methods=['POST'])
 def register():
@@ -44,10 +52,11 @@ def register():
             return jsonify({'error': message}), 400
         
         # Check if user already exists
-        if User.find_by_email(email):
+        conflicts = User.find_conflicts(email, username)
+        if conflicts['email']:
             return jsonify({'error': 'Email already registered'}), 400
         
-        if User.find_by_username(username):
+        if conflicts['username']:
             return jsonify({'error': 'Username already taken'}), 400
         
         # Create new user
@@ -69,6 +78,11 @@ def register():
             'user': user.to_dict()
         }), 201
         
+    except PasswordHasherBusyError as e:
+        return busy_response(e)
+    except sqlite3.IntegrityError:
+        # Lost a race with a concurrent registration
+        return jsonify({'error': 'Email or username already registered'}), 400
     except Exception as e:
         return jsonify({'error': 'Registration failed', 'details': str(e)}), 500
 
@@ -92,7 +106,7 @@ def login():
             return jsonify({'error': 'Invalid email or password'}), 401
         
         # Verify password
-        if not User.verify_password(password, user.password_hash):
+        if not user.check_password(password):
             return jsonify({'error': 'Invalid email or password'}), 401
         
         # Create access token
@@ -104,6 +118,8 @@ def login():
             'user': user.to_dict()
         }), 200
         
+    except PasswordHasherBusyError as e:
+        return busy_response(e)
     except Exception as e:
         return jsonify({'error': 'Login failed', 'details': str(e)}), 500
 
@@ -156,5 +172,7 @@ def update_profile():
             'user': user.to_dict()
         }), 200
         
+    except sqlite3.IntegrityError:
+        return jsonify({'error': 'Username already taken'}), 400
     except Exception as e:
         return jsonify({'error': 'Failed to update profile', 'details': str(e)}), 500
\ No newline at end of file
@@ -0,0 +1,117 @@
+from flask import Blueprint, request, jsonify, send_file, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from itsdangerous import URLSafeTimedSerializer, BadData
+from app.models.project import WebsiteProject
+from app.models.content_blob import ContentBlob
+from app.services.site_export import get_site_exporter
+
+preview_bp = Blueprint('preview', __name__)
+
+# Generated pages run in a sandbox so their scripts don't share the API's origin
+PREVIEW_CSP = 'sandbox allow-scripts allow-forms allow-popups allow-modals'
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+def preview_serializer():
+    # Signed separately from JWTs, so a preview link can never be used as an API token
+    return URLSafeTimedSerializer(current_app.config['JWT_SECRET_KEY'], salt='preview')
+
+def preview_user(project_id):
+    """User a ?token= preview link was issued to for this project, or None"""
+    try:
+        data = preview_serializer().loads(request.args.get('token', ''),
+                                          max_age=current_app.config['PREVIEW_TOKEN_SECONDS'])
+    except BadData:
+        return None
+    if data.get('project_id') != project_id:
+        return None
+    return data.get('user_id')
+
+def send_bundle(content_hash, cache_control):
+    """Send a bundle's best precompressed variant, with range and conditional support"""
+    exporter = get_site_exporter()
+    coding = exporter.best_coding(request.accept_encodings)
+    
+    response = send_file(exporter.path(content_hash, coding), mimetype='text/html',
+                         conditional=True, etag=f"{content_hash}-{coding or 'identity'}")
+    if coding:
+        response.headers['Content-Encoding'] = coding
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = cache_control
+    response.headers['Content-Security-Policy'] = PREVIEW_CSP
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    # Generated pages may load third-party assets; don't tell them where they came from
+    response.headers['Referrer-Policy'] = 'no-referrer'
+    return response
+
+@preview_bp.route('/<int:project_id>/token', methods=['POST'])
+@preview_bp.route('/<int:project_id>/token/', methods=['POST'])
+@jwt_required()
+def preview_token(project_id):
+    """Issue a short-lived link for previewing a project where headers can't be sent (iframes)"""
+    try:
+        user_id = int(get_jwt_identity())
+        if not WebsiteProject.find_by_id(project_id, user_id):
+            return jsonify({'error': 'Project not found'}), 404
+        
+        token = preview_serializer().dumps({'user_id': user_id, 'project_id': project_id})
+        return jsonify({
+            'token': token,
+            'url': f'/preview/{project_id}?token={token}',
+            'expires_in': current_app.config['PREVIEW_TOKEN_SECONDS']
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': 'Failed to create preview link', 'details': str(e)}), 500
+
+@preview_bp.route('/<int:project_id>', methods=['GET'])
+@preview_bp.route('/<int:project_id>/', methods=['GET'])
+@jwt_required(optional=True)
+def preview_project(project_id):
+    """Serve a project's generated site as HTML (access token in the header, or a ?token= preview link)"""
+    try:
+        identity = get_jwt_identity()
+        user_id = int(identity) if identity is not None else preview_user(project_id)
+        if user_id is None:
+            return jsonify({'error': 'Missing or expired preview token'}), 401
+        
+        project = WebsiteProject.find_by_id(project_id, user_id)
+        
+        if not project:
+            return jsonify({'error': 'Project not found'}), 404
+        
+        if not project.has_code:
+            return jsonify({'error': 'No generated code to preview'}), 404
+        
+        content_hash = project.code_hash
+        exporter = get_site_exporter()
+        if content_hash is None or not exporter.exists(content_hash):
+            # Sites saved before exports existed are exported on first view
+            html = project.generated_code
+            content_hash = content_hash or ContentBlob.content_hash(html)
+            exporter.export(content_hash, html)
+        
+        # The URL outlives any one version of the site, so always revalidate
+        return send_bundle(content_hash, 'private, no-cache')
+    
+    except Exception as e:
+        return jsonify({'error': 'Failed to preview project', 'details': str(e)}), 500
+
+@preview_bp.route('/sites/<content_hash>/index.html', methods=['GET'])
+def preview_bundle(content_hash):
+    """Serve an exported bundle by content hash; its contents never change.
+    
+    The hash is the only credential: anyone who has the URL can view the
+    site. Bundles are therefore cached by browsers only, never by shared
+    caches or CDNs.
+    """
+    try:
+        exporter = get_site_exporter()
+        if not exporter.exists(content_hash):
+            return jsonify({'error': 'Site not found'}), 404
+        
+        return send_bundle(content_hash, f'private, max-age={IMMUTABLE_MAX_AGE}, immutable')
+    
+    except ValueError:
+        return jsonify({'error': 'Site not found'}), 404
+    except Exception as e:
+        return jsonify({'error': 'Failed to serve site', 'details': str(e)}), 500
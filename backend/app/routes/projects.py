@@ -1,9 +1,54 @@
-from flask import Blueprint, request, jsonify
+import difflib
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models.project import WebsiteProject
+from app.models.project import WebsiteProject, PROJECT_FIELDS
+from app.models.project_version import ProjectVersion
+from app.pagination import InvalidCursor, encode_cursor, decode_cursor, page_size
+from app.services.response_cache import conditional_json, etag_for, json_with_etag
 
 projects_bp = Blueprint('projects', __name__)
 
+# Largest list a bulk endpoint accepts (also keeps IN (...) under SQLite's variable limit)
+MAX_BULK_ITEMS = 500
+
+# Create request fields that must be strings when present
+SPEC_TEXT_FIELDS = ('project_name', 'description', 'website_type', 'requirements')
+INVALID_SPEC_ERROR = 'Project name is required and text fields must be strings'
+
+def parse_fields(value):
+    """Parse a ?fields= projection into a list of project fields, or None if invalid"""
+    if not value:
+        return list(PROJECT_FIELDS)
+    fields = [name.strip() for name in value.split(',') if name.strip()]
+    if not fields or any(name not in PROJECT_FIELDS for name in fields):
+        return None
+    return fields
+
+def parse_ids(values):
+    """Parse a list of project IDs, dropping duplicates; None if invalid"""
+    if not isinstance(values, list) or not values:
+        return None
+    if any(isinstance(value, bool) or not isinstance(value, int) for value in values):
+        return None
+    return list(dict.fromkeys(values))
+
+def project_from_spec(user_id, spec):
+    """Build a new draft project from a create request body, or None if invalid"""
+    if not isinstance(spec, dict):
+        return None
+    if any(not isinstance(spec.get(name, ''), str) for name in SPEC_TEXT_FIELDS):
+        return None
+    if not spec.get('project_name', '').strip():
+        return None
+    return WebsiteProject(
+        user_id=user_id,
+        project_name=spec['project_name'].strip(),
+        description=spec.get('description', '').strip(),
+        website_type=spec.get('website_type', 'general'),
+        requirements=spec.get('requirements', '').strip(),
+        status='draft'
+    )
+
 @projects_bp.route('', methods=['GET'])
 @projects_bp.route('/', methods=['GET'])
 @jwt_required()
@@ -11,22 +56,178 @@ def get_projects():
     """Get user's projects"""
     try:
         user_id = int(get_jwt_identity())
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
+        page = max(1, request.args.get('page', 1, type=int))
+        per_page = page_size(request.args.get('per_page', type=int), 10)
+        cursor = request.args.get('cursor')
+        
+        fields = parse_fields(request.args.get('fields'))
+        if fields is None:
+            return jsonify({'error': 'Invalid fields', 'allowed_fields': list(PROJECT_FIELDS)}), 400
         
-        # Calculate offset
-        offset = (page - 1) * per_page
+        # Fetch one extra row to know whether there is a next page
+        if cursor:
+            try:
+                after = decode_cursor(cursor, 2)
+            except InvalidCursor as e:
+                return jsonify({'error': str(e)}), 400
+            rows = WebsiteProject.list_by_user(user_id, fields, limit=per_page + 1, after=after)
+        else:
+            # Calculate offset
+            offset = (page - 1) * per_page
+            rows = WebsiteProject.list_by_user(user_id, fields, limit=per_page + 1, offset=offset)
         
-        projects = WebsiteProject.find_by_user(user_id, limit=per_page, offset=offset)
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        next_cursor = None
+        if has_more and rows:
+            next_cursor = encode_cursor(rows[-1]['updated_at'], rows[-1]['id'])
+        
+        response = {
+            'projects': [WebsiteProject.row_to_dict(row, fields) for row in rows],
+            'per_page': per_page,
+            'next_cursor': next_cursor
+        }
+        if not cursor:
+            response['page'] = page
+        return json_with_etag(response)
+    
+    except Exception as e:
+        return jsonify({'error': 'Failed to get projects', 'details': str(e)}), 500
+
+@projects_bp.route('/count', methods=['GET'])
+@projects_bp.route('/count/', methods=['GET'])
+@jwt_required()
+def count_projects():
+    """Get the number of projects a user has"""
+    try:
+        user_id = int(get_jwt_identity())
+        return jsonify({'total': WebsiteProject.count_by_user(user_id)}), 200
+    
+    except Exception as e:
+        return jsonify({'error': 'Failed to count projects', 'details': str(e)}), 500
+
+@projects_bp.route('/bulk', methods=['POST'])
+@projects_bp.route('/bulk/', methods=['POST'])
+@jwt_required()
+def bulk_create_projects():
+    """Create several projects in one transaction"""
+    try:
+        user_id = int(get_jwt_identity())
+        specs = (request.get_json() or {}).get('projects')
+        
+        if not isinstance(specs, list) or not specs:
+            return jsonify({'error': 'A list of projects is required'}), 400
+        if len(specs) > MAX_BULK_ITEMS:
+            return jsonify({'error': f'At most {MAX_BULK_ITEMS} projects per request'}), 400
+        
+        projects = [project_from_spec(user_id, spec) for spec in specs]
+        WebsiteProject.create_many([project for project in projects if project is not None])
+        
+        results = []
+        for index, project in enumerate(projects):
+            if project is None:
+                results.append({'index': index, 'error': INVALID_SPEC_ERROR})
+            else:
+                results.append({'index': index, 'project': project.to_dict()})
+        created = sum(1 for project in projects if project is not None)
         
         return jsonify({
-            'projects': [project.to_dict() for project in projects],
-            'page': page,
-            'per_page': per_page
+            'message': f'Created {created} of {len(projects)} projects',
+            'results': results
         }), 200
         
     except Exception as e:
-        return jsonify({'error': 'Failed to get projects', 'details': str(e)}), 500
+        return jsonify({'error': 'Failed to create projects', 'details': str(e)}), 500
+
+@projects_bp.route('/bulk/status', methods=['POST'])
+@projects_bp.route('/bulk/status/', methods=['POST'])
+@jwt_required()
+def bulk_update_status():
+    """Set the status of several projects"""
+    try:
+        user_id = int(get_jwt_identity())
+        data = request.get_json() or {}
+        
+        project_ids = parse_ids(data.get('ids'))
+        if project_ids is None:
+            return jsonify({'error': 'A list of project IDs is required'}), 400
+        if len(project_ids) > MAX_BULK_ITEMS:
+            return jsonify({'error': f'At most {MAX_BULK_ITEMS} projects per request'}), 400
+        
+        status = data.get('status')
+        if not isinstance(status, str) or not status.strip() or len(status.strip()) > 20:
+            return jsonify({'error': 'Status must be 1 to 20 characters'}), 400
+        
+        updated = WebsiteProject.update_status_many(project_ids, user_id, status.strip())
+        results = [{'id': project_id, 'status': status.strip()} if project_id in updated
+                   else {'id': project_id, 'error': 'Project not found'}
+                   for project_id in project_ids]
+        
+        return jsonify({
+            'message': f'Updated {len(updated)} of {len(project_ids)} projects',
+            'results': results
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': 'Failed to update projects', 'details': str(e)}), 500
+
+@projects_bp.route('/bulk/delete', methods=['POST'])
+@projects_bp.route('/bulk/delete/', methods=['POST'])
+@jwt_required()
+def bulk_delete_projects():
+    """Delete several projects in one transaction"""
+    try:
+        user_id = int(get_jwt_identity())
+        project_ids = parse_ids((request.get_json() or {}).get('ids'))
+        
+        if project_ids is None:
+            return jsonify({'error': 'A list of project IDs is required'}), 400
+        if len(project_ids) > MAX_BULK_ITEMS:
+            return jsonify({'error': f'At most {MAX_BULK_ITEMS} projects per request'}), 400
+        
+        deleted = WebsiteProject.delete_many(project_ids, user_id)
+        results = [{'id': project_id, 'deleted': True} if project_id in deleted
+                   else {'id': project_id, 'error': 'Project not found'}
+                   for project_id in project_ids]
+        
+        return jsonify({
+            'message': f'Deleted {len(deleted)} of {len(project_ids)} projects',
+            'results': results
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': 'Failed to delete projects', 'details': str(e)}), 500
+
+@projects_bp.route('/bulk/export', methods=['GET'])
+@projects_bp.route('/bulk/export/', methods=['GET'])
+@jwt_required()
+def bulk_export_projects():
+    """Stream projects as NDJSON, one project per line"""
+    try:
+        user_id = int(get_jwt_identity())
+        include_code = request.args.get('include_code', 'true').lower() != 'false'
+        
+        project_ids = None
+        if request.args.get('ids'):
+            try:
+                project_ids = parse_ids([int(value) for value in request.args['ids'].split(',')])
+            except ValueError:
+                project_ids = None
+            if project_ids is None:
+                return jsonify({'error': 'ids must be a comma-separated list of project IDs'}), 400
+            if len(project_ids) > MAX_BULK_ITEMS:
+                return jsonify({'error': f'At most {MAX_BULK_ITEMS} projects per request'}), 400
+        
+        dumps = current_app.json.dumps
+        
+        def lines():
+            for project in WebsiteProject.iter_by_user(user_id, project_ids, include_code=include_code):
+                yield dumps(project.to_dict(include_code=include_code)) + '\n'
+        
+        return Response(stream_with_context(lines()), mimetype='application/x-ndjson')
+    
+    except Exception as e:
+        return jsonify({'error': 'Failed to export projects', 'details': str(e)}), 500
 
 @projects_bp.route('', methods=['POST'])
 @projects_bp.route('/', methods=['POST'])
@@ -38,17 +239,9 @@ def create_project():
         data = request.get_json()
         
         # Validate required fields
-        if not data.get('project_name'):
-            return jsonify({'error': 'Project name is required'}), 400
-        
-        project = WebsiteProject(
-            user_id=user_id,
-            project_name=data['project_name'].strip(),
-            description=data.get('description', '').strip(),
-            website_type=data.get('website_type', 'general'),
-            requirements=data.get('requirements', '').strip(),
-            status='draft'
-        )
+        project = project_from_spec(user_id, data)
+        if project is None:
+            return jsonify({'error': INVALID_SPEC_ERROR}), 400
         
         project.save()
         
@@ -72,7 +265,9 @@ def get_project(project_id):
         if not project:
             return jsonify({'error': 'Project not found'}), 404
         
-        return jsonify({'project': project.to_dict()}), 200
+        # The generated code is only loaded when the client's copy is stale
+        etag = etag_for('project', project.id, project.updated_at, project.code_hash, project.has_code)
+        return conditional_json(etag, lambda: {'project': project.to_dict()})
         
     except Exception as e:
         return jsonify({'error': 'Failed to get project', 'details': str(e)}), 500
@@ -110,7 +305,7 @@ def update_project(project_id):
         if data.get('status'):
             project.status = data['status']
         
-        project.save()
+        project.save(version_message='Manual edit')
         
         return jsonify({
             'message': 'Project updated successfully',
@@ -137,4 +332,129 @@ def delete_project(project_id):
         return jsonify({'message': 'Project deleted successfully'}), 200
         
     except Exception as e:
-        return jsonify({'error': 'Failed to delete project', 'details': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': 'Failed to delete project', 'details': str(e)}), 500
+
+@projects_bp.route('/<int:project_id>/versions', methods=['GET'])
+@projects_bp.route('/<int:project_id>/versions/', methods=['GET'])
+@jwt_required()
+def get_versions(project_id):
+    """List a project's code versions, newest first (?before=<version> for older ones)"""
+    try:
+        user_id = int(get_jwt_identity())
+        project = WebsiteProject.find_by_id(project_id, user_id)
+        
+        if not project:
+            return jsonify({'error': 'Project not found'}), 404
+        
+        per_page = page_size(request.args.get('per_page', type=int), 50)
+        before = request.args.get('before', type=int)
+        versions = ProjectVersion.find_by_project(project_id, limit=per_page + 1, before=before)
+        
+        next_before = None
+        has_more = len(versions) > per_page
+        versions = versions[:per_page]
+        if has_more and versions:
+            next_before = versions[-1]['version']
+        
+        return jsonify({
+            'versions': versions,
+            'next_before': next_before,
+            'storage': ProjectVersion.storage(project_id)
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': 'Failed to get versions', 'details': str(e)}), 500
+
+@projects_bp.route('/<int:project_id>/versions/<int:version>', methods=['GET'])
+@projects_bp.route('/<int:project_id>/versions/<int:version>/', methods=['GET'])
+@jwt_required()
+def get_version(project_id, version):
+    """Get one version of a project's code"""
+    try:
+        user_id = int(get_jwt_identity())
+        project = WebsiteProject.find_by_id(project_id, user_id)
+        
+        if not project:
+            return jsonify({'error': 'Project not found'}), 404
+        
+        info = ProjectVersion.find(project_id, version)
+        if not info:
+            return jsonify({'error': 'Version not found'}), 404
+        
+        # A version never changes, so its content hash identifies the response
+        etag = etag_for('version', project_id, version, info['content_hash'])
+        return conditional_json(etag, lambda: {
+            'version': info,
+            'generated_code': ProjectVersion.get_text(project_id, version)
+        })
+    
+    except Exception as e:
+        return jsonify({'error': 'Failed to get version', 'details': str(e)}), 500
+
+@projects_bp.route('/<int:project_id>/versions/<int:version>/diff', methods=['GET'])
+@projects_bp.route('/<int:project_id>/versions/<int:version>/diff/', methods=['GET'])
+@jwt_required()
+def diff_version(project_id, version):
+    """Unified diff of a version against its parent or ?against=<version>"""
+    try:
+        user_id = int(get_jwt_identity())
+        project = WebsiteProject.find_by_id(project_id, user_id)
+        
+        if not project:
+            return jsonify({'error': 'Project not found'}), 404
+        
+        info = ProjectVersion.find(project_id, version)
+        if not info:
+            return jsonify({'error': 'Version not found'}), 404
+        
+        against = request.args.get('against', info['parent_version'], type=int)
+        old_code = ''
+        if against is not None:
+            if not ProjectVersion.find(project_id, against):
+                return jsonify({'error': 'Version to compare against not found'}), 404
+            old_code = ProjectVersion.get_text(project_id, against)
+        new_code = ProjectVersion.get_text(project_id, version)
+        
+        diff = list(difflib.unified_diff(
+            old_code.splitlines(keepends=True), new_code.splitlines(keepends=True),
+            fromfile=f'version {against}' if against is not None else 'empty',
+            tofile=f'version {version}'
+        ))
+        return jsonify({
+            'version': version,
+            'against': against,
+            'added_lines': sum(1 for line in diff if line.startswith('+') and not line.startswith('+++')),
+            'removed_lines': sum(1 for line in diff if line.startswith('-') and not line.startswith('---')),
+            'diff': ''.join(diff)
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': 'Failed to diff versions', 'details': str(e)}), 500
+
+@projects_bp.route('/<int:project_id>/versions/<int:version>/rollback', methods=['POST'])
+@projects_bp.route('/<int:project_id>/versions/<int:version>/rollback/', methods=['POST'])
+@jwt_required()
+def rollback_version(project_id, version):
+    """Restore a version's code; the restored code is saved as a new version"""
+    try:
+        user_id = int(get_jwt_identity())
+        project = WebsiteProject.find_by_id(project_id, user_id)
+        
+        if not project:
+            return jsonify({'error': 'Project not found'}), 404
+        
+        code = ProjectVersion.get_text(project_id, version)
+        if code is None:
+            return jsonify({'error': 'Version not found'}), 404
+        
+        project.generated_code = code
+        project.save(version_message=f'Rollback to version {version}')
+        
+        return jsonify({
+            'message': f'Project rolled back to version {version}',
+            'version': project.saved_version,
+            'project': project.to_dict()
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': 'Failed to roll back project', 'details': str(e)}), 500
\ No newline at end of file
@@ -0,0 +1,52 @@
+from flask import Blueprint, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.db import db_stats
+from app.models.user import User
+from app.services.job_queue import get_job_queue
+from app.services.generation_cache import get_generation_cache
+from app.services.single_flight import get_single_flight
+from app.services.history_writer import get_history_writer
+from app.services.password_hasher import get_password_hasher
+from app.services.user_cache import get_user_cache
+from app.services.response_cache import get_response_cache
+from app.services.site_export import get_site_exporter
+from app.services.rate_limiter import get_rate_limiter
+from app.services.model_router import get_model_router
+from app.services.html_pipeline import get_html_pipeline
+from app.services.openrouter_client import get_openrouter_client
+
+stats_bp = Blueprint('stats', __name__)
+
+@stats_bp.route('', methods=['GET'])
+@stats_bp.route('/', methods=['GET'])
+@jwt_required()
+def get_stats():
+    """Get runtime metrics of the AI pipeline (STATS_ADMIN_EMAILS only)"""
+    try:
+        # The metrics cover every user's jobs, caches and usage
+        user = User.find_by_id(int(get_jwt_identity()))
+        if user is None or user.email.lower() not in current_app.config['STATS_ADMIN_EMAILS']:
+            return jsonify({'error': 'Not allowed to view stats'}), 403
+        
+        cache = get_generation_cache()
+        user_cache = get_user_cache()
+        limiter = get_rate_limiter()
+        
+        return jsonify({
+            'generation_cache': cache.stats() if cache is not None else None,
+            'openrouter': get_openrouter_client().stats(),
+            'model_router': get_model_router().stats(),
+            'html_pipeline': get_html_pipeline().stats(),
+            'rate_limiter': limiter.stats() if limiter is not None else None,
+            'generation_jobs': get_job_queue().stats(),
+            'single_flight': get_single_flight().stats(),
+            'history_writer': get_history_writer().stats(),
+            'password_hasher': get_password_hasher().stats(),
+            'user_cache': user_cache.stats() if user_cache is not None else None,
+            'response_cache': get_response_cache().stats(),
+            'site_exports': get_site_exporter().stats(),
+            'database': db_stats()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to get stats', 'details': str(e)}), 500
@@ -1,22 +1,207 @@
 import os
-import sqlite3
-import requests
 import json
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from flask import current_app
+from html import escape
+from app.db import get_db
+from app.models.content_blob import ContentBlob
+from app.models.project_version import ProjectVersion
+from app.services.history_writer import get_history_writer
+from app.services.openrouter_client import get_openrouter_client
+from app.services.generation_cache import get_generation_cache, cache_key
+from app.services.rate_limiter import get_rate_limiter, RateLimitError
+from app.services.model_router import get_model_router
+from app.services.html_patch import parse_edits, apply_edits, PatchError
+from app.services.html_context import trim_document
+from app.services.html_pipeline import get_html_pipeline, strip_code_fences
+
+logger = logging.getLogger(__name__)
+
+MAX_TOKENS = 8000
+OUTLINE_MAX_TOKENS = 1500
+SECTION_MAX_TOKENS = 3000
+PATCH_MAX_TOKENS = 4000
+MAX_SECTIONS = 8
+
+# Continuations of a cut-off completion are sent this much of the document's end
+CONTINUATION_TAIL_CHARS = 3000
+# Shortest repeated text treated as overlap when stitching a continuation on
+MIN_OVERLAP = 8
+
+# Longest a history read waits for queued history records to be written
+HISTORY_FLUSH_TIMEOUT = 2.0
+
+class AIRequestError(Exception):
+    """Raised when OpenRouter answers a completion request with an error status"""
+    
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+def is_model_failure(error):
+    """Whether an error counts against the model, so another model may do better.
+    
+    Timeouts, connection errors, 429s and 5xx are the model's (or its
+    provider's); other 4xx mean the request itself was refused.
+    """
+    if isinstance(error, AIRequestError):
+        return error.status_code == 429 or error.status_code >= 500
+    return not isinstance(error, RateLimitError)
+
+def new_call_info():
+    """Per-call bookkeeping: cache use, mode, token usage and finish reason"""
+    return {
+        'cached': False,
+        'mode': 'full',
+        'prompt_tokens': None,
+        'cached_prompt_tokens': None,
+        'completion_tokens': None,
+        'tokens_saved': None,
+        'finish_reason': None,
+        'model': None,
+        'continuations': 0,
+        'continuation_time': None
+    }
+
+def record_usage(call, usage):
+    """Copy the token usage reported by OpenRouter into a call record"""
+    if usage:
+        call['prompt_tokens'] = usage.get('prompt_tokens')
+        call['completion_tokens'] = usage.get('completion_tokens')
+        # Prompt tokens served from the provider's prompt cache
+        call['cached_prompt_tokens'] = (usage.get('prompt_tokens_details') or {}).get('cached_tokens')
+
+def parse_outline(text):
+    """Parse and validate the JSON site outline returned by the model"""
+    try:
+        outline = json.loads(strip_json_fences(text))
+    except ValueError as e:
+        raise Exception(f"AI returned an invalid site outline: {e}")
+    
+    sections = outline.get('sections') if isinstance(outline, dict) else None
+    if not isinstance(sections, list) or not sections:
+        raise Exception("AI returned a site outline without sections")
+    
+    cleaned = []
+    for index, section in enumerate(sections[:MAX_SECTIONS]):
+        if not isinstance(section, dict):
+            continue
+        section_id = re.sub(r'[^a-z0-9-]+', '-', str(section.get('id') or '').lower()).strip('-')
+        cleaned.append({
+            'id': section_id or f'section-{index + 1}',
+            'name': str(section.get('name') or section_id or f'Section {index + 1}'),
+            'description': str(section.get('description') or '')
+        })
+    
+    return {
+        'title': str(outline.get('title') or 'Website'),
+        'shared_css': str(outline.get('shared_css') or ''),
+        'sections': cleaned
+    }
+
+def strip_json_fences(text):
+    """Remove a markdown fence around a JSON reply"""
+    text = text.strip()
+    if text.startswith('```'):
+        text = text[3:]
+        if text.startswith('json'):
+            text = text[4:]
+        if text.endswith('```'):
+            text = text[:-3]
+    return text.strip()
+
+def assemble_document(outline, sections):
+    """Join generated sections into one HTML document with the shared CSS"""
+    body = '\n\n'.join(section for section in sections if section)
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{escape(outline['title'])}</title>
+    <style>
+{outline['shared_css']}
+    </style>
+</head>
+<body>
+{body}
+</body>
+</html>"""
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token) for savings estimates"""
+    return len(text) // 4
+
+def estimate_prompt_tokens(messages):
+    """Rough token count of a list of chat messages"""
+    return sum(estimate_tokens(message['content']) for message in messages)
+
+def strip_opening_fence(text):
+    """Remove a markdown fence a continuation may open with"""
+    stripped = text.lstrip()
+    if not stripped.startswith('```'):
+        return text
+    newline = stripped.find('\n')
+    return '' if newline == -1 else stripped[newline + 1:]
+
+def overlap_length(tail, continuation):
+    """Length of the longest start of ``continuation`` repeating the end of ``tail``.
+
+    Models asked to continue often start again a little before where they
+    stopped; that repeated text is dropped when stitching. Shorter repeats
+    than MIN_OVERLAP are taken as coincidence.
+    """
+    probe = continuation[:MIN_OVERLAP]
+    if len(probe) < MIN_OVERLAP:
+        return 0
+    start = tail.find(probe)
+    while start != -1:
+        if continuation.startswith(tail[start:]):
+            return len(tail) - start
+        start = tail.find(probe, start + 1)
+    return 0
+
+def stitch(document, continuation):
+    """Append a continuation to a cut-off document without repeating the overlap"""
+    continuation = strip_opening_fence(continuation)
+    return document + continuation[overlap_length(document[-CONTINUATION_TAIL_CHARS:], continuation):]
 
 class AIService:
-    def __init__(self):
+    def __init__(self, user_id=None, priority='interactive'):
         self.api_key = os.environ.get('OPENROUTER_API_KEY')
-        self.base_url = "https://openrouter.ai/api/v1/chat/completions"
-        self.model = "deepseek/deepseek-chat"
+        self.base_url = os.environ.get('OPENROUTER_BASE_URL', "https://openrouter.ai/api/v1/chat/completions")
+        self.client = get_openrouter_client()
+        self.router = get_model_router()
+        self.postprocessor = get_html_pipeline()
+        self.cache = get_generation_cache()
+        self.limiter = get_rate_limiter()
+        self.user_id = user_id
+        self.priority = priority
+        self.last_call = {}
         
         if not self.api_key:
             raise ValueError("OPENROUTER_API_KEY environment variable is required")
     
-    def generate_website_code(self, prompt, website_type="general"):
-        """Generate complete website code using AI"""
+    def generate_website_code(self, prompt, website_type="general", use_cache=True, max_continuations=0):
+        """Generate complete website code using AI.
         
+        A completion cut off at max_tokens is continued up to
+        ``max_continuations`` times and the parts stitched together.
+        """
+        messages = self._generation_messages(prompt, website_type)
+        return self.postprocessor.process(self._complete_continued(messages, use_cache, 'generate',
+                                                                   max_continuations))
+    
+    def stream_website_code(self, prompt, website_type="general", max_continuations=0):
+        """Generate website code, yielding cleaned chunks as the AI produces them"""
+        messages = self._generation_messages(prompt, website_type)
+        return self._stream_cleaned(messages, 'generate', max_continuations)
+    
+    def _generation_messages(self, prompt, website_type):
+        """Build the chat messages for generating a new website"""
         system_prompt = f"""You are SiteCraft AI, an expert website generator. Generate a complete, professional website based on the user's requirements.
 
 Website Type: {website_type}
@@ -37,138 +222,547 @@ Return ONLY the complete HTML code, no explanations or markdown formatting."""
 
         user_prompt = f"Create a professional website for: {prompt}"
         
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "model": self.model,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            "max_tokens": 8000,
-            "temperature": 0.7
-        }
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+    
+    def generate_website_sections(self, prompt, website_type="general", use_cache=True, max_workers=4,
+                                  section_retries=2):
+        """Generate a website section by section instead of in one completion.
         
-        response = requests.post(self.base_url, headers=headers, json=payload)
+        A short outline call fixes the sections and shared CSS, the sections are
+        then generated concurrently and assembled into one document. Sections
+        cut off at max_tokens are retried on their own with a larger budget.
+        """
+        outline_call = new_call_info()
+        outline = parse_outline(self._call(self._outline_messages(prompt, website_type),
+                                           outline_call, use_cache, OUTLINE_MAX_TOKENS, 'outline'))
+        calls = [outline_call]
         
-        if response.status_code != 200:
-            raise Exception(f"AI API request failed: {response.status_code} - {response.text}")
+        def build_section(section):
+            max_tokens = SECTION_MAX_TOKENS
+            for attempt in range(section_retries + 1):
+                call = new_call_info()
+                calls.append(call)
+                messages = self._section_messages(prompt, website_type, outline, section, attempt > 0)
+                html = strip_code_fences(self._call(messages, call, use_cache, max_tokens, 'section'))
+                if call['finish_reason'] != 'length':
+                    return html
+                max_tokens = min(MAX_TOKENS, max_tokens * 2)
+            logger.warning("Section '%s' still truncated after %d retries", section['id'], section_retries)
+            return html
         
-        result = response.json()
+        workers = max(1, min(max_workers, len(outline['sections'])))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            sections = list(executor.map(build_section, outline['sections']))
         
-        if 'choices' not in result or not result['choices']:
-            raise Exception("No response from AI model")
+        self.last_call = new_call_info()
+        self.last_call.update({
+            'mode': 'sections',
+            'cached': all(call['cached'] for call in calls),
+            'prompt_tokens': sum(call['prompt_tokens'] or 0 for call in calls),
+            'completion_tokens': sum(call['completion_tokens'] or 0 for call in calls),
+            'finish_reason': 'stop',
+            'model': outline_call['model']
+        })
+        return self.postprocessor.process(assemble_document(outline, sections))
+    
+    def modify_website_code(self, existing_code, modifications, website_type="general", use_cache=True,
+                            mode='full', trim=False, max_continuations=0):
+        """Modify existing website code based on user instructions.
         
-        generated_code = result['choices'][0]['message']['content'].strip()
+        In ``patch`` mode the AI returns targeted search/replace edits that are
+        applied locally; if they can't be applied the full document is
+        regenerated instead. With ``trim``, patch mode only sends the parts of
+        the document related to the modifications; this gives up the provider's
+        prompt cache, which needs the whole document as a stable prefix. A full
+        document cut off at max_tokens is continued up to ``max_continuations``
+        times.
+        """
+        patch_call = None
+        if mode == 'patch':
+            messages = self._patch_messages(existing_code, modifications, website_type)
+            untrimmed = estimate_prompt_tokens(messages)
+            if trim:
+                document, omitted = trim_document(existing_code, modifications)
+                if omitted:
+                    messages = self._patch_messages(document, modifications, website_type, trimmed=True)
+            try:
+                content = self._complete(messages, use_cache, PATCH_MAX_TOKENS, 'patch')
+                self._log_prompt('patch', messages, untrimmed)
+                edits = parse_edits(content)
+                modified_code = self.postprocessor.process(apply_edits(existing_code, edits))
+                
+                self.last_call['mode'] = 'patch'
+                self.last_call['tokens_saved'] = estimate_tokens(modified_code) - (self.last_call['completion_tokens'] or 0)
+                return modified_code
+            except PatchError as e:
+                logger.warning("Patch edits could not be applied, regenerating full document: %s", e)
+                patch_call = self.last_call
         
-        # Clean up the response (remove markdown formatting if present)
-        if generated_code.startswith('```html'):
-            generated_code = generated_code[7:]
-        if generated_code.startswith('```'):
-            generated_code = generated_code[3:]
-        if generated_code.endswith('```'):
-            generated_code = generated_code[:-3]
+        messages = self._modification_messages(existing_code, modifications, website_type)
+        modified_code = self.postprocessor.process(self._complete_continued(messages, use_cache, 'modify',
+                                                                            max_continuations))
+        self._log_prompt('modify', messages)
         
-        return generated_code.strip()
+        if patch_call is not None:
+            # Tokens spent on the failed patch attempt are lost
+            wasted = (patch_call['prompt_tokens'] or 0) + (patch_call['completion_tokens'] or 0)
+            self.last_call['mode'] = 'patch_fallback'
+            self.last_call['tokens_saved'] = -wasted
+            for field in ('prompt_tokens', 'completion_tokens'):
+                if self.last_call[field] is not None:
+                    self.last_call[field] += patch_call[field] or 0
+        return modified_code
     
-    def modify_website_code(self, existing_code, modifications, website_type="general"):
-        """Modify existing website code based on user instructions"""
+    def stream_modified_code(self, existing_code, modifications, website_type="general", max_continuations=0):
+        """Modify website code, yielding cleaned chunks as the AI produces them"""
+        messages = self._modification_messages(existing_code, modifications, website_type)
+        yield from self._stream_cleaned(messages, 'modify', max_continuations)
+        self._log_prompt('modify', messages)
+    
+    def _document_messages(self, existing_code, website_type):
+        """Opening messages shared by every modification call on a document.
         
-        system_prompt = f"""You are SiteCraft AI, an expert website modifier. Modify the existing website code based on the user's instructions.
+        They hold everything that doesn't depend on the request, byte for byte
+        the same between calls, so providers with prompt caching can reuse
+        them; the requested changes and the answer format come after.
+        """
+        system_prompt = f"""You are SiteCraft AI, an expert website modifier. You change existing website code based on the user's instructions.
 
 Website Type: {website_type}
 
-Instructions:
-1. Take the existing HTML code and apply the requested modifications
-2. Maintain the overall structure and quality
-3. Ensure the modifications are properly integrated
-4. Keep the professional 3D styling and responsiveness
-5. Return the complete modified HTML code
-6. Do not break existing functionality
+Guidelines:
+1. Maintain the overall structure and quality
+2. Ensure the modifications are properly integrated
+3. Keep the professional 3D styling and responsiveness
+4. Do not break existing functionality"""
+        
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"Existing website code:\n{existing_code}"}
+        ]
+    
+    def _modification_messages(self, existing_code, modifications, website_type):
+        """Build the chat messages for modifying an existing website"""
+        user_prompt = f"""Modifications requested:
+{modifications}
+
+Apply these modifications to the existing code and return the complete updated website.
 
 Return ONLY the complete modified HTML code, no explanations or markdown formatting."""
+        
+        return self._document_messages(existing_code, website_type) + [
+            {"role": "user", "content": user_prompt}
+        ]
+    
+    def _outline_messages(self, prompt, website_type):
+        """Build the chat messages asking for a short site outline"""
+        system_prompt = f"""You are SiteCraft AI, an expert website planner. Plan a complete, professional website based on the user's requirements.
+
+Website Type: {website_type}
+
+Return a JSON object with:
+- "title": the page title
+- "shared_css": compact CSS shared by every section (CSS variables for the color scheme, typography, layout helpers, buttons, responsive breakpoints)
+- "sections": 4 to {MAX_SECTIONS} objects with "id" (lowercase, hyphenated), "name" and "description", starting with the navigation and ending with the footer
+
+Return ONLY the JSON object, no explanations or markdown formatting."""
+
+        user_prompt = f"Plan a professional website for: {prompt}"
+        
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+    
+    def _section_messages(self, prompt, website_type, outline, section, retry=False):
+        """Build the chat messages for generating one section of an outlined site"""
+        site_map = '\n'.join(f"- {item['id']}: {item['name']}" for item in outline['sections'])
+        system_prompt = f"""You are SiteCraft AI, an expert website generator. Generate ONE section of a website whose outline and shared CSS are already fixed.
+
+Website Type: {website_type}
+
+Site sections:
+{site_map}
+
+Shared CSS (already included in the page):
+{outline['shared_css']}
+
+Requirements:
+1. Return a single <header>, <nav>, <section> or <footer> element with id="{section['id']}"
+2. Reuse the shared CSS variables and classes; put section-specific styles in one <style> block scoped with #{section['id']} selectors
+3. Add a <script> block only if the section needs interaction
+4. Use modern, responsive design with 3D effects and professional styling
+5. Do not include <html>, <head> or <body> tags
 
-        user_prompt = f"""Existing website code:
-{existing_code}
+Return ONLY the HTML for this section, no explanations or markdown formatting."""
 
-Modifications requested:
+        user_prompt = f"""Website: {prompt}
+
+Section "{section['name']}": {section['description']}"""
+        if retry:
+            user_prompt += "\n\nYour previous answer for this section was cut off. Keep it more concise."
+        
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+    
+    def _patch_messages(self, existing_code, modifications, website_type, trimmed=False):
+        """Build the chat messages asking for targeted edits instead of a full document"""
+        omitted_rule = ""
+        if trimmed:
+            omitted_rule = ("\n6. Parts of the code unrelated to the request were left out and replaced by "
+                            "<!-- omitted: ... --> markers; never edit them or copy a marker into \"search\"")
+
+        user_prompt = f"""Modifications requested:
 {modifications}
 
-Apply these modifications to the existing code and return the complete updated website."""
+Do NOT return the complete document. Describe the modifications as targeted edits:
+1. Return a JSON array of edits: [{{"search": "...", "replace": "..."}}]
+2. Each "search" must be copied verbatim from the existing code and match exactly one place
+3. Keep each "search" as short as possible while still unique
+4. "replace" is the new code for that snippet; include the snippet itself to insert around it
+5. Keep the professional 3D styling and responsiveness and do not break existing functionality{omitted_rule}
+
+Return ONLY the JSON array of edits, no explanations or markdown formatting."""
         
-        headers = {
+        return self._document_messages(existing_code, website_type) + [
+            {"role": "user", "content": user_prompt}
+        ]
+    
+    def _continuation_messages(self, messages, document):
+        """Build the chat messages asking the model to carry on with a cut-off document"""
+        return messages + [
+            {"role": "assistant", "content": document[-CONTINUATION_TAIL_CHARS:]},
+            {"role": "user", "content": "Your answer was cut off at the length limit; above is the end of "
+                                        "what you wrote. Continue the code from exactly where it stops. Do not "
+                                        "repeat anything already written, do not start over and do not add "
+                                        "markdown formatting or explanations."}
+        ]
+    
+    def _log_prompt(self, operation, messages, untrimmed=None):
+        """Log a call's prompt size: estimated before and after trimming, then as billed"""
+        sent = estimate_prompt_tokens(messages)
+        call = self.last_call
+        logger.info("Prompt for %s: ~%d tokens before trimming, ~%d sent, %s billed (%d from the prompt cache)",
+                    operation, untrimmed or sent, sent, call['prompt_tokens'], call['cached_prompt_tokens'] or 0)
+    
+    def _headers(self):
+        return {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
-        
+    
+    def _payload(self, messages, stream=False, max_tokens=MAX_TOKENS):
+        # The model is picked per attempt by the router
         payload = {
-            "model": self.model,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            "max_tokens": 8000,
+            "messages": messages,
+            "max_tokens": max_tokens,
             "temperature": 0.7
         }
+        if stream:
+            payload["stream"] = True
+        return payload
+    
+    def _complete(self, messages, use_cache=True, max_tokens=MAX_TOKENS, operation='generate'):
+        """Send a chat completion request and return the raw message content"""
+        self.last_call = new_call_info()
+        return self._call(messages, self.last_call, use_cache, max_tokens, operation)
+    
+    def _complete_continued(self, messages, use_cache=True, operation='generate', max_continuations=0):
+        """Complete a document, continuing it while it is cut off at max_tokens"""
+        document = self._complete(messages, use_cache, operation=operation)
+        total = self.last_call
+        start = time.monotonic()
         
-        response = requests.post(self.base_url, headers=headers, json=payload)
+        while total['finish_reason'] == 'length' and total['continuations'] < max_continuations:
+            call = new_call_info()
+            part = self._call(self._continuation_messages(messages, document), call, use_cache,
+                              operation=operation)
+            document = stitch(document, part)
+            self._add_continuation(total, call, time.monotonic() - start)
         
-        if response.status_code != 200:
-            raise Exception(f"AI API request failed: {response.status_code} - {response.text}")
+        if total['finish_reason'] == 'length':
+            logger.warning("Output for %s still cut off after %d continuation(s)", operation, total['continuations'])
+        return document
+    
+    def _add_continuation(self, total, call, seconds):
+        """Fold a continuation call into the record of the call it continues"""
+        total['continuations'] += 1
+        total['continuation_time'] = seconds
+        total['finish_reason'] = call['finish_reason']
+        total['cached'] = total['cached'] and call['cached']
+        for field in ('prompt_tokens', 'cached_prompt_tokens', 'completion_tokens'):
+            if call[field] is not None:
+                total[field] = (total[field] or 0) + call[field]
+        logger.info("Continued cut-off output (%d): %s more tokens in %.2fs so far", total['continuations'],
+                    call['completion_tokens'], seconds)
+    
+    def _call(self, messages, call, use_cache=True, max_tokens=MAX_TOKENS, operation='generate'):
+        """Run one completion, recording usage into ``call`` (safe to use from worker threads)"""
+        payload = self._payload(messages, max_tokens=max_tokens)
         
-        result = response.json()
+        # Serve identical requests from the generation cache, whichever model answered them
+        key = None
+        if use_cache and self.cache is not None:
+            key = cache_key({**payload, 'model': self.router.route_key(operation)})
+            cached = self.cache.get(key)
+            if cached is not None:
+                call.update({'cached': True, 'prompt_tokens': 0, 'completion_tokens': 0,
+                             'finish_reason': 'stop'})
+                return cached
         
-        if 'choices' not in result or not result['choices']:
+        content = self._request_completion(payload, call, operation)
+        
+        # Truncated completions are never worth serving again
+        if key is not None and call['finish_reason'] != 'length':
+            self.cache.set(key, content, call['model'])
+        return content
+    
+    def _reserve(self, payload):
+        """Wait for rate limit budget for a payload; returns the tokens reserved"""
+        if self.limiter is None:
+            return 0
+        tokens = estimate_tokens(json.dumps(payload['messages'])) + payload['max_tokens']
+        return self.limiter.acquire(self.user_id, tokens, self.priority)
+    
+    def _settle(self, reserved, call, model, failed=False):
+        """Hand the usage OpenRouter reported back to the rate limiter"""
+        if self.limiter is None:
+            return
+        try:
+            if failed and call['prompt_tokens'] is None:
+                self.limiter.settle(self.user_id, reserved, 0, 0, self.priority, model)
+            else:
+                self.limiter.settle(self.user_id, reserved, call['prompt_tokens'],
+                                    call['completion_tokens'], self.priority, model)
+        except Exception as e:
+            logger.warning("Failed to record AI usage: %s", e)
+    
+    def _request_completion(self, payload, call, operation='generate'):
+        """Complete a payload on the operation's best model, failing over to the next on errors"""
+        models = self.router.candidates(operation)
+        for attempt, model in enumerate(models):
+            try:
+                content = self._post_completion({**payload, 'model': model}, call, operation)
+            except Exception as e:
+                if attempt == len(models) - 1 or not is_model_failure(e):
+                    raise
+                self.router.record_failover(operation)
+                logger.warning("Model %s failed for %s, trying %s: %s", model, operation, models[attempt + 1], e)
+                continue
+            call['model'] = model
+            return content
+    
+    def _post_completion(self, payload, call, operation):
+        """POST a completion payload to OpenRouter and return the message content"""
+        reserved = self._reserve(payload)
+        error = None
+        start = time.monotonic()
+        try:
+            response = self.client.post(self.base_url, headers=self._headers(), json=payload)
+            
+            if response.status_code != 200:
+                raise AIRequestError(f"AI API request failed: {response.status_code} - {response.text}",
+                                     response.status_code)
+            
+            result = response.json()
+            
+            if 'choices' not in result or not result['choices']:
+                raise Exception("No response from AI model")
+            
+            record_usage(call, result.get('usage'))
+            call['finish_reason'] = result['choices'][0].get('finish_reason')
+            return result['choices'][0]['message']['content']
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._record(operation, payload['model'], time.monotonic() - start, error)
+            self._settle(reserved, call, payload['model'], error is not None)
+    
+    def _record(self, operation, model, seconds, error=None):
+        """Report a call's outcome to the model router; refused requests say nothing about the model"""
+        if error is None or is_model_failure(error):
+            self.router.record(operation, model, seconds, error is None)
+    
+    def _open_stream(self, payload, operation):
+        """Start a streaming completion, failing over between models until one answers"""
+        models = self.router.candidates(operation)
+        for attempt, model in enumerate(models):
+            attempt_payload = {**payload, 'model': model}
+            reserved = self._reserve(attempt_payload)
+            start = time.monotonic()
+            try:
+                response = self.client.post(self.base_url, headers=self._headers(),
+                                            json=attempt_payload, stream=True)
+                if response.status_code != 200:
+                    error = AIRequestError(f"AI API request failed: {response.status_code} - {response.text}",
+                                           response.status_code)
+                    response.close()
+                    raise error
+            except Exception as e:
+                self._record(operation, model, time.monotonic() - start, e)
+                self._settle(reserved, self.last_call, model, failed=True)
+                if attempt == len(models) - 1 or not is_model_failure(e):
+                    raise
+                self.router.record_failover(operation)
+                logger.warning("Model %s failed for %s, trying %s: %s", model, operation, models[attempt + 1], e)
+                continue
+            self.last_call['model'] = model
+            return response, reserved, start
+    
+    def _stream(self, messages, operation='generate'):
+        """Send a streaming chat completion request and yield raw content deltas"""
+        self.last_call = new_call_info()
+        response, reserved, start = self._open_stream(self._payload(messages, stream=True), operation)
+        
+        failed = True
+        try:
+            # OpenRouter sends Server-Sent Events; comment lines keep the connection alive
+            response.encoding = 'utf-8'
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or line.startswith(':') or not line.startswith('data:'):
+                    continue
+                
+                data = line[5:].strip()
+                if data == '[DONE]':
+                    break
+                
+                chunk = json.loads(data)
+                if 'error' in chunk:
+                    raise Exception(f"AI API stream failed: {chunk['error']}")
+                
+                record_usage(self.last_call, chunk.get('usage'))
+                choices = chunk.get('choices') or []
+                if choices:
+                    if choices[0].get('finish_reason'):
+                        self.last_call['finish_reason'] = choices[0]['finish_reason']
+                    content = (choices[0].get('delta') or {}).get('content')
+                    if content:
+                        yield content
+            failed = False
+        finally:
+            response.close()
+            model = self.last_call['model']
+            self.router.record(operation, model, time.monotonic() - start, not failed)
+            self._settle(reserved, self.last_call, model, failed)
+    
+    def _stream_cleaned(self, messages, operation='generate', max_continuations=0):
+        """Stream content deltas through the post-processing pipeline as they arrive.
+        
+        Output cut off at max_tokens is continued up to ``max_continuations``
+        times. The start of each continuation is held back until it is clear
+        how much of it repeats the end of the document, which is dropped.
+        """
+        pipeline = self.postprocessor.pipeline()
+        parts = []
+        
+        for delta in self._stream(messages, operation):
+            parts.append(delta)
+            cleaned = pipeline.feed(delta)
+            if cleaned:
+                yield cleaned
+        
+        if not parts:
             raise Exception("No response from AI model")
         
-        modified_code = result['choices'][0]['message']['content'].strip()
+        total = self.last_call
+        start = time.monotonic()
+        while total['finish_reason'] == 'length' and total['continuations'] < max_continuations:
+            document = ''.join(parts)
+            tail = document[-CONTINUATION_TAIL_CHARS:]
+            received = ''  # Start of the continuation, until its overlap is known
+            stitched = False
+            
+            for delta in self._stream(self._continuation_messages(messages, document), operation):
+                if not stitched:
+                    received += delta
+                    head = strip_opening_fence(received)
+                    # Wait while the continuation may still be repeating the tail
+                    if len(head) < MIN_OVERLAP or head in tail[:-1]:
+                        continue
+                    delta = head[overlap_length(tail, head):]
+                    stitched = True
+                parts.append(delta)
+                cleaned = pipeline.feed(delta)
+                if cleaned:
+                    yield cleaned
+            
+            if not stitched:
+                head = strip_opening_fence(received)
+                parts.append(head[overlap_length(tail, head):])
+                cleaned = pipeline.feed(parts[-1])
+                if cleaned:
+                    yield cleaned
+            
+            call, self.last_call = self.last_call, total
+            self._add_continuation(total, call, time.monotonic() - start)
         
-        # Clean up the response
-        if modified_code.startswith('```html'):
-            modified_code = modified_code[7:]
-        if modified_code.startswith('```'):
-            modified_code = modified_code[3:]
-        if modified_code.endswith('```'):
-            modified_code = modified_code[:-3]
+        if total['finish_reason'] == 'length':
+            logger.warning("Output for %s still cut off after %d continuation(s)", operation, total['continuations'])
         
-        return modified_code.strip()
+        cleaned = pipeline.finish()
+        self.postprocessor.record(pipeline)
+        if cleaned:
+            yield cleaned
     
-    def log_generation(self, project_id, prompt, generated_output, generation_time, success, error_message=None):
-        """Log AI generation attempt to database"""
+    def log_generation(self, project_id, prompt, generated_output, generation_time, success, error_message=None,
+                       version=None):
+        """Queue an AI generation attempt for the background history writer.
+        
+        An output saved as a project version is referenced by its version
+        number instead of being stored again.
+        """
         try:
-            conn = sqlite3.connect(current_app.config['DATABASE_PATH'])
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO generation_history 
-                (project_id, prompt, generated_output, generation_time, success, error_message, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (project_id, prompt, generated_output, generation_time, success, error_message, datetime.now()))
-            
-            conn.commit()
-            conn.close()
+            get_history_writer().submit({
+                'project_id': project_id,
+                'prompt': prompt,
+                'generated_output': generated_output if version is None else None,
+                'version': version,
+                'generation_time': generation_time,
+                'success': success,
+                'error_message': error_message,
+                'mode': self.last_call.get('mode'),
+                'prompt_tokens': self.last_call.get('prompt_tokens'),
+                'completion_tokens': self.last_call.get('completion_tokens'),
+                'tokens_saved': self.last_call.get('tokens_saved'),
+                'continuations': self.last_call.get('continuations'),
+                'continuation_time': self.last_call.get('continuation_time'),
+                'created_at': datetime.now()
+            })
             
         except Exception as e:
-            print(f"Failed to log generation: {e}")
+            logger.error("Failed to log generation: %s", e)
     
-    def get_generation_history(self, project_id, limit=20):
-        """Get generation history for a project"""
-        conn = sqlite3.connect(current_app.config['DATABASE_PATH'])
+    def get_generation_history(self, project_id, limit=20, after=None):
+        """Get generation history for a project, newest first, after a (created_at, id) position"""
+        # Make the caller's own recent generations visible
+        get_history_writer().flush(HISTORY_FLUSH_TIMEOUT)
+        
+        conn = get_db()
         cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT id, prompt, generation_time, success, error_message, created_at
+        where = 'project_id = ?'
+        params = [project_id]
+        if after is not None:
+            where += ' AND (created_at, id) < (?, ?)'
+            params.extend(after)
+        
+        cursor.execute(f'''
+            SELECT id, prompt, generation_time, success, error_message, created_at,
+                   mode, prompt_tokens, completion_tokens, tokens_saved, continuations, continuation_time,
+                   output_hash IS NOT NULL OR generated_output IS NOT NULL OR version IS NOT NULL
             FROM generation_history 
-            WHERE project_id = ? 
-            ORDER BY created_at DESC 
+            WHERE {where}
+            ORDER BY created_at DESC, id DESC
             LIMIT ?
-        ''', (project_id, limit))
+        ''', (*params, limit))
         
         rows = cursor.fetchall()
-        conn.close()
         
         history = []
         for row in rows:
@@ -178,7 +772,37 @@ Apply these modifications to the existing code and return the complete updated w
                 'generation_time': row[2],
                 'success': row[3],
                 'error_message': row[4],
-                'created_at': row[5]
+                'created_at': row[5],
+                'mode': row[6],
+                'prompt_tokens': row[7],
+                'completion_tokens': row[8],
+                'tokens_saved': row[9],
+                'continuations': row[10],
+                'continuation_time': row[11],
+                'has_output': bool(row[12])
             })
         
-        return history
\ No newline at end of file
+        return history
+    
+    def get_generation_output(self, project_id, entry_id):
+        """Get the generated HTML of one history entry; returns (found, output)"""
+        get_history_writer().flush(HISTORY_FLUSH_TIMEOUT)
+        
+        conn = get_db()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT output_hash, generated_output, version FROM generation_history
+            WHERE id = ? AND project_id = ?
+        ''', (entry_id, project_id))
+        
+        row = cursor.fetchone()
+        
+        if not row:
+            return False, None
+        if row[0]:
+            return True, ContentBlob.get(row[0])
+        if row[2] is not None:
+            return True, ProjectVersion.get_text(project_id, row[2])
+        # Entries logged before content_blobs existed keep their output inline
+        return True, row[1]
\ No newline at end of file
@@ -0,0 +1,81 @@
+import time
+from flask import current_app
+from app.services.ai_service import AIService
+from app.services.single_flight import get_single_flight, flight_key, SingleFlightError
+from app.services.rate_limiter import RateLimitError
+
+
+class GenerationError(Exception):
+    """Raised when the AI failed to generate or modify a website"""
+    pass
+
+
+def run_generation(project, prompt, kind='generate', use_cache=True, priority='interactive'):
+    """Generate (or modify) a project's website, save it and log the attempt"""
+    ai_service = AIService(user_id=project.user_id, priority=priority)
+    history_prompt = f"Modifications: {prompt}" if kind == 'regenerate' else prompt
+    start_time = time.time()
+
+    try:
+        if kind == 'regenerate':
+            if not project.generated_code:
+                raise Exception('No existing code to modify. Generate website first.')
+            # Large documents are edited in place instead of being sent back whole
+            mode = 'patch' if len(project.generated_code) >= current_app.config['PATCH_MODE_MIN_SIZE'] else 'full'
+            generated_code = ai_service.modify_website_code(
+                project.generated_code, prompt, project.website_type, use_cache, mode,
+                trim=current_app.config['PATCH_TRIM_ENABLED'],
+                max_continuations=current_app.config['MAX_CONTINUATIONS']
+            )
+            status = 'regenerated'
+        elif kind == 'sections':
+            generated_code = ai_service.generate_website_sections(
+                prompt, project.website_type, use_cache,
+                max_workers=current_app.config['SECTION_WORKERS'],
+                section_retries=current_app.config['SECTION_RETRIES']
+            )
+            status = 'generated'
+        else:
+            generated_code = ai_service.generate_website_code(prompt, project.website_type, use_cache,
+                                                              current_app.config['MAX_CONTINUATIONS'])
+            status = 'generated'
+        generation_time = time.time() - start_time
+
+        # Update project with generated code
+        project.generated_code = generated_code
+        project.status = status
+        project.save(version_message=history_prompt)
+
+        # Log generation history
+        ai_service.log_generation(project.id, history_prompt, generated_code, generation_time, True,
+                                  version=project.saved_version)
+
+        return {
+            'generation_time': generation_time,
+            'cached': ai_service.last_call.get('cached', False)
+        }
+
+    except Exception as ai_error:
+        generation_time = time.time() - start_time
+        error_message = str(ai_error)
+
+        # Log failed generation
+        ai_service.log_generation(project.id, history_prompt, None, generation_time, False, error_message)
+
+        if isinstance(ai_error, RateLimitError):
+            raise
+        raise GenerationError(error_message)
+
+
+def generate_once(project, prompt, kind='generate', use_cache=True, priority='interactive'):
+    """Run a generation, sharing the outcome with identical concurrent requests.
+
+    Returns ``(result, shared)``; when ``shared`` is True another request did
+    the work and ``project`` was not updated in memory, so callers should
+    reload it.
+    """
+    key = flight_key(project.id, prompt, kind)
+    try:
+        return get_single_flight().do(key, lambda: run_generation(project, prompt, kind, use_cache, priority))
+    except SingleFlightError as e:
+        raise GenerationError(str(e))
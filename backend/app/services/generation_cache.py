@@ -0,0 +1,231 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from app.db import connect
+
+WHITESPACE = re.compile(r'\s+')
+
+# Disk hits update last_access in batches of this many, or after this many seconds
+TOUCH_BATCH_SIZE = 64
+TOUCH_INTERVAL = 60.0
+
+
+def cache_key(payload):
+    """Content hash of a chat completion payload.
+
+    Whitespace in message content is collapsed so prompts that only differ in
+    spacing share an entry; model and sampling parameters are part of the key.
+    """
+    normalized = {
+        'model': payload.get('model'),
+        'messages': [
+            {'role': message['role'], 'content': WHITESPACE.sub(' ', message['content']).strip()}
+            for message in payload.get('messages', [])
+        ],
+        'params': {
+            name: value for name, value in payload.items()
+            if name not in ('model', 'messages', 'stream')
+        }
+    }
+    encoded = json.dumps(normalized, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class GenerationCache:
+    """Two-tier cache of AI completions: an in-memory LRU in front of SQLite.
+
+    Entries expire after ``ttl`` seconds. The memory tier is bounded by entry
+    count and total size, the disk tier by total size; the least recently used
+    entries are evicted first.
+    
+    The disk tier has its own autocommit connection, so lookups and stores
+    never commit a transaction the calling request has open. Disk hits
+    record their access time in memory and write them in batches, so reads
+    don't each take the SQLite write lock.
+    """
+
+    def __init__(self, db_path, ttl=86400, max_memory_entries=256,
+                 max_memory_bytes=32 * 1024 * 1024, max_disk_bytes=256 * 1024 * 1024):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (value, stored_at)
+        self._memory_bytes = 0
+        self._touches = {}  # key -> last access not yet written to disk
+        self._touched_at = time.time()
+        self._counters = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'memory_evictions': 0,
+            'disk_evictions': 0,
+            'expirations': 0
+        }
+
+    def get(self, key):
+        """Look up a cached completion, promoting disk hits into memory"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if now - stored_at < self.ttl:
+                    self._memory.move_to_end(key)
+                    self._counters['memory_hits'] += 1
+                    return value
+                self._drop(key)
+                self._counters['expirations'] += 1
+
+        conn = self._connection()
+        row = conn.execute('SELECT response, created_at FROM generation_cache WHERE cache_key = ?',
+                           (key,)).fetchone()
+        if row and now - row[1] >= self.ttl:
+            conn.execute('DELETE FROM generation_cache WHERE cache_key = ?', (key,))
+            with self._lock:
+                self._counters['expirations'] += 1
+            row = None
+
+        with self._lock:
+            if row is None:
+                self._counters['misses'] += 1
+                return None
+            self._counters['disk_hits'] += 1
+            self._remember(key, row[0], row[1])
+            self._touches[key] = now
+            flush = len(self._touches) >= TOUCH_BATCH_SIZE or now - self._touched_at >= TOUCH_INTERVAL
+        if flush:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._write_touches(conn, now)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return row[0]
+
+    def set(self, key, value, model=None):
+        """Store a completion in both tiers"""
+        now = time.time()
+        size = len(value.encode('utf-8'))
+
+        with self._lock:
+            self._counters['stores'] += 1
+            self._remember(key, value, now)
+
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('''
+                INSERT OR REPLACE INTO generation_cache
+                (cache_key, model, response, size, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (key, model, value, size, now, now))
+            # Eviction goes by last_access, so write the pending accesses first
+            self._write_touches(conn, now)
+            evicted = self._evict_disk(conn, now)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        if evicted:
+            with self._lock:
+                self._counters['disk_evictions'] += evicted
+
+    def stats(self):
+        """Hit, miss and eviction counters plus current memory usage"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['memory_entries'] = len(self._memory)
+            stats['memory_bytes'] = self._memory_bytes
+
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else None
+        return stats
+
+    def _remember(self, key, value, stored_at):
+        """Insert into the memory tier and evict down to its limits (lock held)"""
+        self._drop(key)
+        size = len(value)
+        if size > self.max_memory_bytes:
+            return
+
+        self._memory[key] = (value, stored_at)
+        self._memory_bytes += size
+        while (len(self._memory) > self.max_memory_entries
+               or self._memory_bytes > self.max_memory_bytes):
+            oldest = next(iter(self._memory))
+            self._drop(oldest)
+            self._counters['memory_evictions'] += 1
+
+    def _drop(self, key):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= len(entry[0])
+    
+    def _write_touches(self, conn, now):
+        """Write the batched last_access times of disk hits (transaction open)"""
+        with self._lock:
+            touches = self._touches
+            self._touches = {}
+            self._touched_at = now
+        if touches:
+            conn.executemany('UPDATE generation_cache SET last_access = ? WHERE cache_key = ?',
+                             [(accessed, key) for key, accessed in touches.items()])
+    
+    def _connection(self):
+        # A connection of our own, in autocommit mode, so cache writes never
+        # commit (or wait on) a transaction the request has open on its connection
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = connect(self.db_path)
+            conn.isolation_level = None
+        return conn
+
+    def _evict_disk(self, conn, now):
+        """Remove expired rows, then least recently used rows over the size budget"""
+        evicted = conn.execute('DELETE FROM generation_cache WHERE created_at < ?',
+                               (now - self.ttl,)).rowcount
+
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM generation_cache').fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return evicted
+
+        rows = conn.execute('SELECT cache_key, size FROM generation_cache ORDER BY last_access').fetchall()
+        for key, size in rows:
+            if total <= self.max_disk_bytes:
+                break
+            conn.execute('DELETE FROM generation_cache WHERE cache_key = ?', (key,))
+            total -= size
+            evicted += 1
+        return evicted
+
+
+def init_generation_cache(app):
+    """Create the application's generation cache"""
+    cache = None
+    if app.config['GENERATION_CACHE_ENABLED']:
+        cache = GenerationCache(
+            app.config['DATABASE_PATH'],
+            ttl=app.config['GENERATION_CACHE_TTL'],
+            max_memory_entries=app.config['GENERATION_CACHE_MEMORY_ENTRIES'],
+            max_memory_bytes=app.config['GENERATION_CACHE_MEMORY_BYTES'],
+            max_disk_bytes=app.config['GENERATION_CACHE_DISK_BYTES']
+        )
+    app.extensions['generation_cache'] = cache
+    return cache
+
+
+def get_generation_cache():
+    """Get the generation cache of the current application, or None if disabled"""
+    return current_app.extensions.get('generation_cache')
@@ -0,0 +1,196 @@
+import atexit
+import threading
+import time
+from collections import deque
+from flask import current_app
+from app.db import connect
+from app.models.content_blob import ContentBlob
+
+HISTORY_COLUMNS = ('project_id', 'prompt', 'generation_time', 'success', 'error_message',
+                   'mode', 'prompt_tokens', 'completion_tokens', 'tokens_saved', 'version', 'continuations',
+                   'continuation_time', 'created_at')
+
+class HistoryWriter:
+    """Write-behind logger for the ``generation_history`` table.
+
+    Records are queued in memory and a background thread inserts them in
+    batched transactions once ``batch_size`` records are waiting or
+    ``flush_interval`` seconds have passed, so requests never wait on the
+    SQLite write lock to log a generation. When the queue is full, callers
+    wait up to ``enqueue_timeout`` seconds for room and then write the record
+    themselves, on a connection of the writer's rather than their own.
+    Pending records are flushed when the writer is stopped.
+    """
+    
+    def __init__(self, app, batch_size=100, flush_interval=0.5, max_queue_size=10000,
+                 enqueue_timeout=2.0):
+        self.app = app
+        self.db_path = app.config['DATABASE_PATH']
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.enqueue_timeout = enqueue_timeout
+        
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._pending = deque()
+        self._writing = 0
+        self._flush_waiters = 0
+        self._thread = None
+        self._stopped = False
+        self._counters = {
+            'submitted': 0,
+            'written': 0,
+            'batches': 0,
+            'sync_writes': 0,
+            'failed': 0
+        }
+    
+    def start(self):
+        """Start the background writer thread"""
+        self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+        self._thread.start()
+    
+    def stop(self, timeout=None):
+        """Write everything still queued and stop the writer thread"""
+        with self._cond:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+    
+    def submit(self, record):
+        """Queue a history record, waiting for room while the queue is full"""
+        deadline = time.monotonic() + self.enqueue_timeout
+        with self._cond:
+            self._counters['submitted'] += 1
+            while not self._stopped and len(self._pending) >= self.max_queue_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            
+            if not self._stopped and len(self._pending) < self.max_queue_size:
+                self._pending.append(record)
+                self._cond.notify_all()
+                return
+            self._counters['sync_writes'] += 1
+        
+        # The writer is stopped or can't keep up: write on the caller's thread
+        self._write([record])
+    
+    def flush(self, timeout=None):
+        """Wait until every queued record has been written; returns False on timeout"""
+        with self._cond:
+            self._flush_waiters += 1
+            self._cond.notify_all()
+            try:
+                return self._cond.wait_for(lambda: not self._pending and not self._writing, timeout)
+            finally:
+                self._flush_waiters -= 1
+    
+    def stats(self):
+        """Queue depth and write counters"""
+        with self._cond:
+            stats = dict(self._counters)
+            stats['queued'] = len(self._pending)
+        stats.update({
+            'batch_size': self.batch_size,
+            'flush_interval': self.flush_interval,
+            'max_queue_size': self.max_queue_size
+        })
+        return stats
+    
+    def _next_batch(self):
+        """Block until a batch is due; returns None once stopped and drained"""
+        with self._cond:
+            while not self._pending and not self._stopped:
+                self._cond.wait()
+            if not self._pending:
+                return None
+            
+            # Give the batch time to fill unless it's full or someone is waiting on it
+            deadline = time.monotonic() + self.flush_interval
+            while len(self._pending) < self.batch_size and not self._stopped and not self._flush_waiters:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            
+            batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            self._writing = len(batch)
+            self._cond.notify_all()
+            return batch
+    
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            
+            try:
+                with self.app.app_context():
+                    self._write(batch)
+            finally:
+                with self._cond:
+                    self._writing = 0
+                    self._cond.notify_all()
+    
+    def _write(self, records):
+        """Insert records (and their outputs) in a single transaction"""
+        conn = self._connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            outputs = [record['generated_output'] for record in records if record.get('generated_output')]
+            output_hashes = iter(ContentBlob.put_many(outputs, commit=False, conn=conn) if outputs else [])
+            
+            rows = []
+            for record in records:
+                output_hash = next(output_hashes) if record.get('generated_output') else None
+                rows.append(tuple(record.get(column) for column in HISTORY_COLUMNS) + (output_hash,))
+            
+            conn.executemany(f'''
+                INSERT INTO generation_history ({', '.join(HISTORY_COLUMNS)}, output_hash)
+                VALUES ({', '.join('?' * (len(HISTORY_COLUMNS) + 1))})
+            ''', rows)
+            conn.execute('COMMIT')
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            print(f"Failed to write {len(records)} generation history record(s): {e}")
+            with self._cond:
+                self._counters['failed'] += len(records)
+            return
+        
+        with self._cond:
+            self._counters['written'] += len(records)
+            self._counters['batches'] += 1
+    
+    def _connection(self):
+        # A connection of our own, in autocommit mode, so a write on the caller's
+        # thread never commits or rolls back the request's own transaction
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = connect(self.db_path)
+            conn.isolation_level = None
+        return conn
+
+def init_history_writer(app):
+    """Create the application's history writer and start it"""
+    writer = HistoryWriter(
+        app,
+        batch_size=app.config['HISTORY_BATCH_SIZE'],
+        flush_interval=app.config['HISTORY_FLUSH_INTERVAL'],
+        max_queue_size=app.config['HISTORY_QUEUE_SIZE'],
+        enqueue_timeout=app.config['HISTORY_ENQUEUE_TIMEOUT']
+    )
+    app.extensions['history_writer'] = writer
+    writer.start()
+    atexit.register(writer.stop)
+    return writer
+
+def get_history_writer():
+    """Get the history writer of the current application"""
+    return current_app.extensions['history_writer']
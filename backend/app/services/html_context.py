@@ -0,0 +1,159 @@
+import math
+import re
+from html.parser import HTMLParser
+
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param',
+             'source', 'track', 'wbr'}
+CONTAINER_TAGS = {'html', 'head', 'body', 'main'}
+
+WORD = re.compile(r'[a-z][a-z0-9-]{2,}')
+STOP_WORDS = {
+    'the', 'and', 'for', 'with', 'make', 'change', 'add', 'into', 'this', 'that', 'more', 'less',
+    'please', 'should', 'all', 'some', 'from', 'use', 'can', 'its', 'than', 'them', 'then',
+    'there', 'also', 'new', 'like', 'want', 'would', 'could', 'page', 'website', 'site'
+}
+
+# Regions smaller than this are always sent; omitting them saves too little
+MIN_OMIT_SIZE = 200
+# Split a region into its children when it holds more than this share of the document
+SPLIT_RATIO = 0.4
+
+class Element:
+    __slots__ = ('tag', 'attrs', 'start', 'end', 'children')
+    
+    def __init__(self, tag, attrs, start):
+        self.tag = tag
+        self.attrs = attrs
+        self.start = start
+        self.end = None
+        self.children = []
+
+class OutlineParser(HTMLParser):
+    """Builds a tree of elements with their character offsets in the source"""
+    
+    def __init__(self, source):
+        super().__init__(convert_charrefs=False)
+        self.source = source
+        self.line_starts = [0] + [match.end() for match in re.finditer('\n', source)]
+        self.root = Element(None, {}, 0)
+        self.stack = [self.root]
+    
+    def source_offset(self):
+        line, column = self.getpos()
+        return self.line_starts[line - 1] + column
+    
+    def handle_starttag(self, tag, attrs):
+        start = self.source_offset()
+        element = Element(tag, dict(attrs), start)
+        self.stack[-1].children.append(element)
+        if tag in VOID_TAGS:
+            element.end = start + len(self.get_starttag_text())
+        else:
+            self.stack.append(element)
+    
+    def handle_startendtag(self, tag, attrs):
+        start = self.source_offset()
+        element = Element(tag, dict(attrs), start)
+        element.end = start + len(self.get_starttag_text())
+        self.stack[-1].children.append(element)
+    
+    def handle_endtag(self, tag):
+        # Close the nearest open element of this tag, along with anything left open inside it
+        for depth in range(len(self.stack) - 1, 0, -1):
+            if self.stack[depth].tag == tag:
+                end = self.source.find('>', self.source_offset())
+                end = len(self.source) if end == -1 else end + 1
+                for element in self.stack[depth:]:
+                    element.end = end
+                del self.stack[depth:]
+                return
+
+def document_regions(html):
+    """Top-level blocks of a document as ``(start, end, element)``, in document order.
+
+    Blocks are the children of ``<head>``, ``<body>`` and ``<main>``; a block
+    holding most of the page is split into its own children so a single
+    wrapper ``<div>`` doesn't swallow the whole document.
+    """
+    parser = OutlineParser(html)
+    parser.feed(html)
+    parser.close()
+    for element in parser.stack[1:]:
+        element.end = len(html)
+    
+    regions = []
+    
+    def collect(element):
+        for child in element.children:
+            size = child.end - child.start
+            if child.tag in CONTAINER_TAGS or (size > SPLIT_RATIO * len(html) and len(child.children) > 1):
+                collect(child)
+            else:
+                regions.append((child.start, child.end, child))
+    
+    collect(parser.root)
+    return regions
+
+def keywords(text):
+    """Lowercased, roughly stemmed words of a modification request"""
+    words = set()
+    for word in WORD.findall(text.lower()):
+        if word in STOP_WORDS:
+            continue
+        for suffix in ('ing', 'es', 'ed', 's'):
+            if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+                word = word[:-len(suffix)]
+                break
+        words.add(word)
+    return words
+
+def describe(element):
+    """Short opening tag naming an element, for omission markers"""
+    label = element.tag
+    if element.attrs.get('id'):
+        label += f' id="{element.attrs["id"]}"'
+    if element.attrs.get('class'):
+        label += f' class="{element.attrs["class"]}"'
+    return f'<{label}>'
+
+def trim_document(html, request, max_ratio=0.8):
+    """Leave out the blocks of a document unrelated to a modification request.
+
+    Each block is scored by the request's keywords found in its source (tags,
+    ids, classes, text and CSS), weighted by how few blocks contain them;
+    keywords in more than half of the blocks count for nothing. Blocks
+    scoring zero are replaced by ``<!-- omitted: ... -->`` markers.
+    Returns ``(document, omitted)``; the document comes back unchanged when
+    no block matches or trimming would keep more than ``max_ratio`` of it.
+    """
+    words = keywords(request)
+    regions = document_regions(html)
+    if not words or len(regions) < 2:
+        return html, 0
+    
+    sources = [html[start:end].lower() for start, end, _ in regions]
+    frequency = {word: sum(1 for source in sources if word in source) for word in words}
+    # Words found in most blocks ("section", "color") don't tell them apart
+    weights = {word: math.log(len(regions) / count) for word, count in frequency.items()
+               if 0 < count <= len(regions) / 2}
+    if not weights:
+        return html, 0
+    
+    omit = []
+    for (start, end, element), source in zip(regions, sources):
+        score = sum(weight for word, weight in weights.items() if word in source)
+        if score <= 0 and end - start >= MIN_OMIT_SIZE:
+            omit.append((start, end, element))
+    
+    omitted_size = sum(end - start for start, end, _ in omit)
+    if not omit or len(html) - omitted_size > max_ratio * len(html):
+        return html, 0
+    
+    parts = []
+    position = 0
+    for start, end, element in omit:
+        parts.append(html[position:start])
+        parts.append(f'<!-- omitted: {describe(element)} ({end - start} characters) -->')
+        position = end
+    parts.append(html[position:])
+    return ''.join(parts), len(omit)
@@ -0,0 +1,49 @@
+import json
+import re
+
+JSON_FENCE = re.compile(r'^\s*```(?:json)?\s*(.*?)\s*```\s*$', re.DOTALL)
+
+
+class PatchError(Exception):
+    """Raised when model-provided edits can't be parsed or applied"""
+    pass
+
+
+def parse_edits(text):
+    """Parse the model's JSON list of ``{"search": ..., "replace": ...}`` edits"""
+    match = JSON_FENCE.match(text)
+    if match:
+        text = match.group(1)
+
+    try:
+        edits = json.loads(text)
+    except ValueError as e:
+        raise PatchError(f"Edits are not valid JSON: {e}")
+
+    if isinstance(edits, dict):
+        edits = edits.get('edits')
+    if not isinstance(edits, list) or not edits:
+        raise PatchError("Expected a non-empty list of edits")
+
+    for edit in edits:
+        if not isinstance(edit, dict) or not isinstance(edit.get('search'), str) \
+                or not isinstance(edit.get('replace'), str):
+            raise PatchError("Each edit needs string 'search' and 'replace' fields")
+        if not edit['search']:
+            raise PatchError("Edit has an empty 'search' snippet")
+
+    return edits
+
+
+def apply_edits(document, edits):
+    """Apply edits in order; every search snippet must match exactly once"""
+    for index, edit in enumerate(edits):
+        occurrences = document.count(edit['search'])
+        if occurrences != 1:
+            raise PatchError(f"Edit {index + 1} matches {occurrences} times, expected exactly once")
+        document = document.replace(edit['search'], edit['replace'], 1)
+
+    if '</html>' not in document.lower():
+        raise PatchError("Patched document is missing its closing </html> tag")
+
+    return document
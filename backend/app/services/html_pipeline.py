@@ -0,0 +1,542 @@
+import logging
+import re
+import threading
+import time
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+TRAILING_FENCE_CHARS = re.compile(r'[\s`]*$')
+
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param',
+             'source', 'track', 'wbr'}
+RAW_TEXT_TAGS = {'script', 'style'}
+
+# A complete start or end tag; attribute values may contain '>'
+TAG = re.compile(r'''<(/?)([a-zA-Z][\w:-]*)((?:\s+[^\s"'>/=]+(?:\s*=\s*(?:"[^"]*"|'[^']*'|[^\s"'>]+))?)*)\s*(/?)>''')
+# At-rules whose blocks hold declarations rather than rules
+DECLARATION_AT_RULES = ('@font-face', '@page', '@property', '@counter-style')
+# Longest run of text held back while waiting for the rest of a tag
+MAX_TAG_HOLD = 4096
+
+def strip_code_fences(code):
+    """Remove markdown code fences the model may wrap around the HTML"""
+    code = code.strip()
+    if code.startswith('```html'):
+        code = code[7:]
+    if code.startswith('```'):
+        code = code[3:]
+    if code.endswith('```'):
+        code = code[:-3]
+    return code.strip()
+
+def skip_string(text, start):
+    """Index just past the quoted string starting at ``start`` (or the end of the text)"""
+    quote = text[start]
+    index = start + 1
+    while index < len(text):
+        char = text[index]
+        if char == '\\':
+            index += 2
+            continue
+        if char == quote or (char == '\n' and quote != '`'):
+            return index + 1
+        index += 1
+    return len(text)
+
+def skip_regex(text, start):
+    """Index just past the regex literal starting at ``start``, or None if it isn't one"""
+    index = start + 1
+    in_class = False
+    while index < len(text):
+        char = text[index]
+        if char == '\\':
+            index += 2
+            continue
+        if char == '\n':
+            return None
+        if char == '[':
+            in_class = True
+        elif char == ']':
+            in_class = False
+        elif char == '/' and not in_class:
+            index += 1
+            while index < len(text) and text[index].isalpha():
+                index += 1
+            return index
+        index += 1
+    return None
+
+def minify_css(css):
+    """Drop comments and the whitespace CSS doesn't need"""
+    out = []
+    # Whether each open block holds declarations (rather than nested rules)
+    declarations = []
+    prelude = 0  # Where the current selector or declaration starts in ``out``
+    index = 0
+    while index < len(css):
+        char = css[index]
+        if char in '"\'':
+            end = skip_string(css, index)
+            out.append(css[index:end])
+            index = end
+        elif css.startswith('/*', index):
+            end = css.find('*/', index + 2)
+            index = len(css) if end == -1 else end + 2
+        elif char.isspace():
+            end = index
+            while end < len(css) and css[end].isspace():
+                end += 1
+            previous = out[-1][-1] if out else ''
+            following = css[end] if end < len(css) else ''
+            # In selectors a space before ':' matters ("a :hover" is not "a:hover")
+            drop_before = '{};,:' if declarations and declarations[-1] else '{};,'
+            if previous and following and previous not in '{};,:' and following not in drop_before:
+                out.append(' ')
+            index = end
+        else:
+            if char == '{':
+                rule = ''.join(out[prelude:]).strip().lower()
+                declarations.append(not rule.startswith('@') or rule.startswith(DECLARATION_AT_RULES))
+            elif char == '}':
+                if declarations:
+                    declarations.pop()
+                if out and out[-1] == ';':
+                    out.pop()
+            out.append(char)
+            if char in '{};':
+                prelude = len(out)
+            index += 1
+    return ''.join(out)
+
+def minify_js(code):
+    """Drop comments, indentation and blank lines from a script.
+
+    Line breaks are kept so automatic semicolon insertion still sees the
+    same statements; strings, template literals and regex literals are
+    copied untouched.
+    """
+    out = []
+    last = ''  # Last significant character written
+    line_start = True
+    index = 0
+    while index < len(code):
+        char = code[index]
+        if char in '"\'`':
+            end = skip_string(code, index)
+            out.append(code[index:end])
+            last = char
+            line_start = False
+            index = end
+        elif code.startswith('//', index):
+            end = code.find('\n', index)
+            index = len(code) if end == -1 else end
+        elif code.startswith('/*', index):
+            end = code.find('*/', index + 2)
+            index = len(code) if end == -1 else end + 2
+            if not line_start:
+                out.append(' ')
+        elif char == '/' and (not last or last in '(,=:[!&|?{};+-*%<>~^\n'):
+            end = skip_regex(code, index)
+            if end is None:
+                end = index + 1
+            out.append(code[index:end])
+            last = '/'
+            line_start = False
+            index = end
+        elif char == '\n':
+            while out and out[-1] == ' ':
+                out.pop()
+            if out and out[-1] != '\n':
+                out.append('\n')
+            last = '\n'
+            line_start = True
+            index += 1
+        elif char in ' \t\r':
+            end = index
+            while end < len(code) and code[end] in ' \t\r':
+                end += 1
+            if not line_start and end < len(code) and code[end] != '\n' and out and out[-1] != ' ':
+                out.append(' ')
+            index = end
+        else:
+            out.append(char)
+            last = char
+            line_start = False
+            index += 1
+    return ''.join(out).strip()
+
+class Stage:
+    """One incremental step of the pipeline.
+
+    ``feed`` takes the next chunk of the page and returns the text that is
+    final so far; ``finish`` returns whatever was held back.
+    """
+    name = None
+    
+    def feed(self, chunk):
+        return chunk
+    
+    def finish(self):
+        return ''
+
+class FenceStripper(Stage):
+    """Incremental version of strip_code_fences for streamed output.
+
+    Only the undecided prefix and a trailing run of whitespace/backticks are
+    held back, so the document itself is never buffered.
+    """
+    name = 'strip_fences'
+    
+    OPENING_FENCE_LENGTH = len('```html```')
+    
+    def __init__(self):
+        self._head = ''
+        self._tail = ''
+        self._started = False
+        self._content_seen = False
+    
+    def feed(self, chunk):
+        """Consume a chunk and return the cleaned text that is safe to emit"""
+        if not self._started:
+            self._head += chunk
+            if len(self._head.lstrip()) < self.OPENING_FENCE_LENGTH:
+                return ''
+            chunk = self._strip_opening(self._head)
+            self._head = ''
+            self._started = True
+        
+        if not self._content_seen:
+            chunk = chunk.lstrip()
+            if not chunk:
+                return ''
+            self._content_seen = True
+        
+        text = self._tail + chunk
+        split = TRAILING_FENCE_CHARS.search(text).start()
+        self._tail = text[split:]
+        return text[:split]
+    
+    def finish(self):
+        """Flush whatever was held back, dropping a closing fence"""
+        if not self._started:
+            return strip_code_fences(self._head)
+        
+        tail = self._tail.rstrip()
+        if tail.endswith('```'):
+            tail = tail[:-3]
+        self._tail = ''
+        return tail.rstrip()
+    
+    @staticmethod
+    def _strip_opening(text):
+        text = text.lstrip()
+        if text.startswith('```html'):
+            text = text[7:]
+        if text.startswith('```'):
+            text = text[3:]
+        return text
+
+class TagBalancer(Stage):
+    """Repairs tag nesting: drops end tags nothing opened and closes what is left open.
+
+    Output cut off by the token limit ends mid-tag or with open elements;
+    the partial tag is dropped and the missing end tags are appended.
+    """
+    name = 'balance_tags'
+    
+    # Enough of a page to hold back for a split "</script>"
+    RAW_HOLD = len('</script >')
+    
+    def __init__(self):
+        self.repairs = 0
+        self._pending = ''
+        self._stack = []
+        self._raw_close = None
+    
+    def feed(self, chunk):
+        return self._scan(self._pending + chunk, final=False)
+    
+    def finish(self):
+        text = self._scan(self._pending, final=True)
+        self._raw_close = None
+        if self._stack:
+            self.repairs += len(self._stack)
+            text += ''.join(f'</{name}>' for name in reversed(self._stack))
+            self._stack = []
+        return text
+    
+    def _scan(self, text, final):
+        out = []
+        start = position = 0
+        while position < len(text):
+            if self._raw_close is not None:
+                close = self._raw_close.search(text, position)
+                if close is None:
+                    position = len(text) if final else max(position, len(text) - self.RAW_HOLD)
+                    break
+                self._stack.pop()
+                self._raw_close = None
+                position = close.end()
+                continue
+            
+            opening = text.find('<', position)
+            if opening == -1:
+                position = len(text)
+                break
+            if text.startswith('<!--', opening):
+                end = text.find('-->', opening + 4)
+                if end == -1:
+                    position = len(text) if final else opening
+                    break
+                position = end + 3
+                continue
+            
+            match = TAG.match(text, opening)
+            if match is None:
+                # An incomplete tag contains no other '<'; wait for the rest of it
+                incomplete = text.find('<', opening + 1) == -1 and len(text) - opening < MAX_TAG_HOLD
+                if incomplete and not final:
+                    position = opening
+                    break
+                if incomplete and re.match(r'</?(?:[a-zA-Z]|$)', text[opening:]):
+                    out.append(text[start:opening])
+                    start = position = len(text)
+                    self.repairs += 1
+                    break
+                position = opening + 1
+                continue
+            
+            closing, name, self_closing = match.group(1), match.group(2).lower(), match.group(4)
+            if closing:
+                if name in self._stack:
+                    # Elements left open inside are closed implicitly, as browsers do
+                    while self._stack.pop() != name:
+                        pass
+                else:
+                    out.append(text[start:opening])
+                    start = match.end()
+                    self.repairs += 1
+            elif name not in VOID_TAGS and not self_closing:
+                self._stack.append(name)
+                if name in RAW_TEXT_TAGS:
+                    self._raw_close = re.compile(rf'</{name}\s*>', re.IGNORECASE)
+            position = match.end()
+        
+        out.append(text[start:position])
+        self._pending = text[position:]
+        return ''.join(out)
+
+class BlockStage(Stage):
+    """Base for stages that rewrite whole ``<style>``/``<script>`` blocks.
+
+    Text outside the blocks passes straight through; a block is held until
+    its end tag arrives and then replaced by ``block()``'s result.
+    """
+    tags = ('style', 'script')
+    
+    def __init__(self):
+        self._opening = re.compile(
+            r'''<(%s)\b(?:"[^"]*"|'[^']*'|[^>"'])*>''' % '|'.join(self.tags), re.IGNORECASE)
+        self._buffer = ''
+        self._block = None  # (tag, start tag text) of the block being collected
+        self._content = ''
+        self._checked = 0
+        self._closing = None
+    
+    def block(self, tag, start_tag, content, end_tag):
+        return start_tag + content + end_tag
+    
+    def feed(self, chunk):
+        out = []
+        text = chunk
+        while True:
+            if self._block is not None:
+                self._content += text
+                text = ''
+                close = self._closing.search(self._content, max(0, self._checked - len('</script >')))
+                if close is None:
+                    self._checked = len(self._content)
+                    break
+                tag, start_tag = self._block
+                out.append(self.block(tag, start_tag, self._content[:close.start()], close.group(0)))
+                text = self._content[close.end():]
+                self._block = None
+                self._content = ''
+                continue
+            
+            text = self._buffer + text
+            self._buffer = ''
+            match = self._opening.search(text)
+            if match is None:
+                # Hold back a trailing '<...' that may still become a start tag
+                hold = text.rfind('<')
+                if hold == -1 or '>' in text[hold:]:
+                    hold = len(text)
+                out.append(text[:hold])
+                self._buffer = text[hold:]
+                break
+            
+            out.append(text[:match.start()])
+            tag = match.group(1).lower()
+            self._block = (tag, match.group(0))
+            self._closing = re.compile(rf'</{tag}\s*>', re.IGNORECASE)
+            self._content = ''
+            self._checked = 0
+            text = text[match.end():]
+        return ''.join(out)
+    
+    def finish(self):
+        # An unterminated block is passed through unchanged
+        if self._block is not None:
+            text = self._block[1] + self._content
+            self._block = None
+            self._content = ''
+            return text
+        text = self._buffer
+        self._buffer = ''
+        return text
+
+class InlineMinifier(BlockStage):
+    """Minifies inline CSS and JavaScript blocks"""
+    name = 'minify_inline'
+    
+    def block(self, tag, start_tag, content, end_tag):
+        if tag == 'style':
+            return start_tag + minify_css(content) + end_tag
+        script_type = re.search(r'''\btype\s*=\s*["']?([^"'\s>]+)''', start_tag, re.IGNORECASE)
+        if script_type and 'javascript' not in script_type.group(1).lower() \
+                and script_type.group(1).lower() != 'module':
+            return start_tag + content + end_tag  # JSON-LD, templates, ...
+        return start_tag + minify_js(content) + end_tag
+
+class StyleDeduplicator(BlockStage):
+    """Drops ``<style>`` blocks identical to one earlier in the page"""
+    name = 'dedupe_styles'
+    tags = ('style',)
+    
+    def __init__(self):
+        super().__init__()
+        self.removed = 0
+        self._seen = set()
+    
+    def block(self, tag, start_tag, content, end_tag):
+        key = (start_tag.lower(), content.strip())
+        if key in self._seen:
+            self.removed += 1
+            return ''
+        self._seen.add(key)
+        return start_tag + content + end_tag
+
+# Stages available to HTML_PIPELINE, by name; register_stage adds more
+STAGES = {
+    stage.name: stage for stage in (FenceStripper, TagBalancer, InlineMinifier, StyleDeduplicator)
+}
+
+def register_stage(stage_class):
+    """Make a Stage subclass available to HTML_PIPELINE under its name"""
+    STAGES[stage_class.name] = stage_class
+    return stage_class
+
+class Pipeline:
+    """One page's run through a chain of stages, timing each stage"""
+    
+    def __init__(self, stages):
+        self.stages = stages
+        self.seconds = [0.0] * len(stages)
+        self.size_in = 0
+        self.size_out = 0
+    
+    def feed(self, chunk):
+        self.size_in += len(chunk.encode('utf-8'))
+        for index, stage in enumerate(self.stages):
+            if not chunk:
+                break
+            start = time.perf_counter()
+            chunk = stage.feed(chunk)
+            self.seconds[index] += time.perf_counter() - start
+        self.size_out += len(chunk.encode('utf-8'))
+        return chunk
+    
+    def finish(self):
+        text = ''
+        for index, stage in enumerate(self.stages):
+            start = time.perf_counter()
+            text = (stage.feed(text) if text else '') + stage.finish()
+            self.seconds[index] += time.perf_counter() - start
+        self.size_out += len(text.encode('utf-8'))
+        return text
+    
+    def process(self, text):
+        return self.feed(text) + self.finish()
+    
+    def report(self):
+        """Size before and after, and time spent per stage"""
+        return {
+            'size_in': self.size_in,
+            'size_out': self.size_out,
+            'stages': {stage.name: round(seconds * 1000, 3) for stage, seconds in zip(self.stages, self.seconds)}
+        }
+
+class HTMLPostProcessor:
+    """Builds a pipeline for each generated page and keeps totals across pages.
+
+    Stages run in the configured order on each chunk as it arrives, so
+    streamed pages are cleaned without waiting for the whole document.
+    """
+    
+    def __init__(self, stage_names):
+        unknown = [name for name in stage_names if name not in STAGES]
+        if unknown:
+            raise ValueError(f"Unknown HTML pipeline stage(s): {', '.join(unknown)}")
+        self.stage_names = list(stage_names)
+        
+        self._lock = threading.Lock()
+        self._counters = {'pages': 0, 'size_in': 0, 'size_out': 0}
+        self._seconds = dict.fromkeys(self.stage_names, 0.0)
+    
+    def pipeline(self):
+        """A fresh pipeline for one page"""
+        return Pipeline([STAGES[name]() for name in self.stage_names])
+    
+    def process(self, html):
+        """Run a complete page through the pipeline"""
+        pipeline = self.pipeline()
+        html = pipeline.process(html)
+        self.record(pipeline)
+        return html
+    
+    def record(self, pipeline):
+        """Add a finished pipeline to the totals and log its report"""
+        report = pipeline.report()
+        with self._lock:
+            self._counters['pages'] += 1
+            self._counters['size_in'] += report['size_in']
+            self._counters['size_out'] += report['size_out']
+            for name, milliseconds in report['stages'].items():
+                self._seconds[name] += milliseconds / 1000
+        
+        saved = report['size_in'] - report['size_out']
+        timings = ', '.join(f'{name} {milliseconds:.1f} ms' for name, milliseconds in report['stages'].items())
+        logger.info("Post-processed page: %d -> %d bytes (%.1f%% smaller); %s", report['size_in'],
+                    report['size_out'], saved * 100 / max(report['size_in'], 1), timings)
+        return report
+    
+    def stats(self):
+        """Pages processed, total size before and after, and time per stage"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['stage_seconds'] = dict(self._seconds)
+        stats['stages'] = list(self.stage_names)
+        return stats
+
+def init_html_pipeline(app):
+    """Create the application's post-processor for generated pages"""
+    stage_names = [name.strip() for name in app.config['HTML_PIPELINE'].split(',') if name.strip()]
+    processor = HTMLPostProcessor(stage_names)
+    app.extensions['html_pipeline'] = processor
+    return processor
+
+def get_html_pipeline():
+    """Get the post-processor of the current application"""
+    return current_app.extensions['html_pipeline']
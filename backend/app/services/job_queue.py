@@ -0,0 +1,323 @@
+import os
+import sqlite3
+import threading
+import uuid
+from collections import deque, defaultdict
+from datetime import datetime, timedelta
+from flask import current_app
+from app.db import get_db
+
+
+class QueueFullError(Exception):
+    """Raised when the generation queue cannot accept more jobs"""
+    pass
+
+
+class GenerationJobQueue:
+    """Bounded worker pool for AI generation jobs persisted in SQLite.
+
+    Jobs are written to the ``generation_jobs`` table before they are queued,
+    tagged with the queue that owns them. Each queue refreshes a heartbeat on
+    its queued and running jobs every ``stale_after / 4`` seconds and adopts
+    jobs whose heartbeat is older than ``stale_after``, so the jobs of a
+    process that died are re-queued by whichever process is still (or again)
+    running, whether or not it restarted in between. At most ``max_workers``
+    jobs run at once, and at most ``per_user_limit`` of those belong to the
+    same user.
+    """
+
+    def __init__(self, app, max_workers=4, per_user_limit=2, max_queue_size=100,
+                 stale_after=60):
+        self.app = app
+        self.db_path = app.config['DATABASE_PATH']
+        self.max_workers = max_workers
+        self.per_user_limit = per_user_limit
+        self.max_queue_size = max_queue_size
+        self.stale_after = stale_after
+        self.worker_id = f"{os.getpid()}:{uuid.uuid4().hex}"
+
+        self._cond = threading.Condition()
+        self._pending = deque()  # (job_id, user_id) in FIFO order
+        self._running_by_user = defaultdict(int)
+        self._threads = []
+        self._stopped = False
+        self._stop_monitor = threading.Event()
+
+    def start(self):
+        """Recover persisted jobs and start the worker and heartbeat threads"""
+        self._recover()
+        for i in range(self.max_workers):
+            thread = threading.Thread(target=self._worker, name=f'generation-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._monitor, name='generation-job-monitor', daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """Stop the workers once their current job finishes"""
+        self._stop_monitor.set()
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def submit(self, user_id, project_id, prompt, kind='generate', use_cache=True):
+        """Persist a new job and queue it, returning its ID"""
+        with self._cond:
+            if len(self._pending) >= self.max_queue_size:
+                raise QueueFullError('Generation queue is full, try again later')
+
+            job_id = uuid.uuid4().hex
+            conn = get_db(self.db_path)
+            now = datetime.now()
+            conn.execute('''
+                INSERT INTO generation_jobs
+                (id, user_id, project_id, kind, prompt, use_cache, status, progress, worker_id,
+                 heartbeat_at, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, 'queued', 'queued', ?, ?, ?)
+            ''', (job_id, user_id, project_id, kind, prompt, bool(use_cache), self.worker_id, now, now))
+            conn.commit()
+
+            self._pending.append((job_id, user_id))
+            self._cond.notify()
+        return job_id
+    
+    def submit_batch(self, user_id, items, kind='generate', use_cache=True):
+        """Persist and queue a job per (project_id, prompt) pair, all or none.
+
+        Returns ``(batch_id, job_ids)``. The jobs share the worker pool and
+        the per-user limit with every other job, so a batch runs at most
+        ``min(max_workers, per_user_limit)`` generations at once.
+        """
+        with self._cond:
+            if len(self._pending) + len(items) > self.max_queue_size:
+                raise QueueFullError('Generation queue is full, try again later')
+            
+            batch_id = uuid.uuid4().hex
+            job_ids = [uuid.uuid4().hex for _ in items]
+            now = datetime.now()
+            conn = get_db(self.db_path)
+            conn.executemany('''
+                INSERT INTO generation_jobs
+                (id, user_id, project_id, kind, prompt, use_cache, status, progress, batch_id, worker_id,
+                 heartbeat_at, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, 'queued', 'queued', ?, ?, ?, ?)
+            ''', [(job_id, user_id, project_id, kind, prompt, bool(use_cache), batch_id, self.worker_id, now, now)
+                  for job_id, (project_id, prompt) in zip(job_ids, items)])
+            conn.commit()
+            
+            self._pending.extend((job_id, user_id) for job_id in job_ids)
+            self._cond.notify_all()
+        return batch_id, job_ids
+    
+    def get_batch(self, batch_id, user_id):
+        """Get the jobs of a batch owned by the user, in submission order"""
+        cursor = get_db(self.db_path).cursor()
+        cursor.row_factory = sqlite3.Row
+        rows = cursor.execute('''
+            SELECT id, project_id, status, progress, error_message, generation_time,
+                   created_at, started_at, finished_at
+            FROM generation_jobs WHERE batch_id = ? AND user_id = ?
+            ORDER BY rowid
+        ''', (batch_id, user_id)).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_job(self, job_id, user_id):
+        """Get a job owned by the user, including its queue position"""
+        cursor = get_db(self.db_path).cursor()
+        cursor.row_factory = sqlite3.Row
+        row = cursor.execute('SELECT * FROM generation_jobs WHERE id = ? AND user_id = ?',
+                             (job_id, user_id)).fetchone()
+
+        if not row:
+            return None
+
+        job = dict(row)
+        job['queue_position'] = None
+        if job['status'] == 'queued':
+            with self._cond:
+                for position, (pending_id, _) in enumerate(self._pending, start=1):
+                    if pending_id == job_id:
+                        job['queue_position'] = position
+                        break
+        return job
+
+    def stats(self):
+        """Current queue depth and worker usage"""
+        with self._cond:
+            return {
+                'queued': len(self._pending),
+                'running': sum(self._running_by_user.values()),
+                'max_workers': self.max_workers,
+                'per_user_limit': self.per_user_limit
+            }
+
+    def _recover(self):
+        """Adopt jobs left behind by a previous process"""
+        rows = self._sweep(adopt_unowned=True)
+        self._queue(rows)
+        if rows:
+            print(f"Recovered {len(rows)} queued generation job(s)")
+
+    def _monitor(self):
+        """Keep this queue's heartbeats fresh and adopt jobs of queues that died"""
+        while not self._stop_monitor.wait(self.stale_after / 4):
+            try:
+                rows = self._sweep()
+            except Exception as e:
+                print(f"Generation job sweep failed: {e}")
+                continue
+            self._queue(rows)
+            if rows:
+                print(f"Re-queued {len(rows)} generation job(s) of a stopped process")
+
+    def _sweep(self, adopt_unowned=False):
+        """Refresh our heartbeats and take over jobs whose owner went quiet.
+
+        Queued jobs without an owner (from before owners were recorded) are
+        adopted straight away with ``adopt_unowned``, at startup. Returns the adopted jobs
+        as (job_id, user_id), oldest first.
+        """
+        now = datetime.now()
+        stale_before = now - timedelta(seconds=self.stale_after)
+        adopt = 'COALESCE(heartbeat_at, started_at, created_at) < ?'
+        if adopt_unowned:
+            adopt += " OR (worker_id IS NULL AND status = 'queued')"
+
+        conn = get_db(self.db_path)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('''
+                UPDATE generation_jobs SET heartbeat_at = ?
+                WHERE worker_id = ? AND status IN ('queued', 'running')
+            ''', (now, self.worker_id))
+            rows = conn.execute(f'''
+                SELECT id, user_id FROM generation_jobs
+                WHERE status IN ('queued', 'running') AND ({adopt})
+                ORDER BY created_at
+            ''', (stale_before,)).fetchall()
+            conn.executemany('''
+                UPDATE generation_jobs
+                SET status = 'queued', progress = 'queued', worker_id = ?, heartbeat_at = ?
+                WHERE id = ?
+            ''', [(self.worker_id, now, job_id) for job_id, _ in rows])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return rows
+
+    def _queue(self, rows):
+        with self._cond:
+            for job_id, user_id in rows:
+                self._pending.append((job_id, user_id))
+            self._cond.notify_all()
+
+    def _next_job(self):
+        """Block until a job whose user is under the per-user limit is available"""
+        with self._cond:
+            while not self._stopped:
+                for entry in self._pending:
+                    job_id, user_id = entry
+                    if self._running_by_user[user_id] < self.per_user_limit:
+                        self._pending.remove(entry)
+                        self._running_by_user[user_id] += 1
+                        return job_id, user_id
+                self._cond.wait()
+            return None
+
+    def _release(self, user_id):
+        with self._cond:
+            self._running_by_user[user_id] -= 1
+            if self._running_by_user[user_id] <= 0:
+                del self._running_by_user[user_id]
+            self._cond.notify_all()
+
+    def _worker(self):
+        while True:
+            claimed = self._next_job()
+            if claimed is None:
+                return
+
+            job_id, user_id = claimed
+            try:
+                with self.app.app_context():
+                    self._run(job_id)
+            except Exception as e:
+                print(f"Generation job {job_id} crashed: {e}")
+            finally:
+                self._release(user_id)
+
+    def _claim(self, job_id):
+        """Atomically move a job from queued to running (safe across processes)"""
+        conn = get_db(self.db_path)
+        cursor = conn.execute('''
+            UPDATE generation_jobs
+            SET status = 'running', progress = 'starting', started_at = ?, worker_id = ?, heartbeat_at = ?
+            WHERE id = ? AND status = 'queued'
+        ''', (datetime.now(), self.worker_id, datetime.now(), job_id))
+        conn.commit()
+        claimed = cursor.rowcount == 1
+
+        job = None
+        if claimed:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            job = dict(cursor.execute('SELECT * FROM generation_jobs WHERE id = ?', (job_id,)).fetchone())
+        return job
+
+    def _update(self, job_id, **fields):
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        conn = get_db(self.db_path)
+        conn.execute(f'UPDATE generation_jobs SET {assignments} WHERE id = ?',
+                     (*fields.values(), job_id))
+        conn.commit()
+
+    def _run(self, job_id):
+        """Execute a claimed job inside an application context"""
+        from app.models.project import WebsiteProject
+        from app.services.generation import generate_once
+
+        job = self._claim(job_id)
+        if job is None:
+            return  # Another worker or process already took it
+
+        project = WebsiteProject.find_by_id(job['project_id'], job['user_id'])
+        if not project:
+            self._update(job_id, status='failed', progress='failed',
+                         error_message='Project not found', finished_at=datetime.now())
+            return
+
+        try:
+            self._update(job_id, progress='generating')
+            # Batch items yield upstream budget to anything a user is waiting on
+            priority = 'batch' if job.get('batch_id') else 'interactive'
+            result, _ = generate_once(project, job['prompt'], job['kind'], bool(job['use_cache']),
+                                      priority=priority)
+            self._update(job_id, status='completed', progress='done',
+                         generation_time=result['generation_time'], finished_at=datetime.now())
+
+        except Exception as e:
+            self._update(job_id, status='failed', progress='failed', error_message=str(e),
+                         finished_at=datetime.now())
+
+
+def init_job_queue(app):
+    """Create the application's generation job queue and start its workers"""
+    queue = GenerationJobQueue(
+        app,
+        max_workers=app.config['GENERATION_WORKERS'],
+        per_user_limit=app.config['GENERATION_JOBS_PER_USER'],
+        max_queue_size=app.config['GENERATION_QUEUE_SIZE'],
+        stale_after=app.config['GENERATION_JOB_STALE_SECONDS']
+    )
+    app.extensions['generation_jobs'] = queue
+    queue.start()
+    return queue
+
+
+def get_job_queue():
+    """Get the generation job queue of the current application"""
+    return current_app.extensions['generation_jobs']
@@ -0,0 +1,174 @@
+import threading
+import time
+from collections import defaultdict, deque
+from flask import current_app
+from app.services.openrouter_client import percentile
+
+OPERATIONS = ('generate', 'modify', 'patch', 'outline', 'section')
+
+# Upper bounds (seconds) of the latency histogram buckets; a last, unbounded one follows
+LATENCY_BUCKETS = (1, 2, 5, 10, 20, 30, 60, 120)
+
+def parse_routes(value):
+    """Parse ``operation=model|model,operation=model`` into a dict of model lists"""
+    routes = {}
+    for entry in (value or '').split(','):
+        if '=' not in entry:
+            continue
+        operation, models = entry.split('=', 1)
+        models = [model.strip() for model in models.split('|') if model.strip()]
+        if operation.strip() in OPERATIONS and models:
+            routes[operation.strip()] = models
+    return routes
+
+class ModelTracker:
+    """Rolling latency and error record of one model for one operation"""
+    
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)  # (seconds, ok)
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+    
+    def record(self, seconds, ok):
+        self.samples.append((seconds, ok))
+        if ok:
+            self.consecutive_failures = 0
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    self.histogram[index] += 1
+                    break
+            else:
+                self.histogram[-1] += 1
+        else:
+            self.consecutive_failures += 1
+    
+    def latencies(self):
+        return sorted(seconds for seconds, ok in self.samples if ok)
+    
+    def error_rate(self):
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, ok in self.samples if not ok) / len(self.samples)
+
+class ModelRouter:
+    """Picks the OpenRouter model for each operation and fails over between them.
+
+    Every operation has an ordered list of candidate models (``default_models``
+    unless ``routes`` gives it its own). Each (operation, model) pair keeps a
+    rolling window of call latencies and outcomes; healthy models are tried
+    fastest first by p50 latency, and a model that fails is skipped for
+    ``cooldown`` seconds once ``max_consecutive_failures`` calls in a row fail
+    or its error rate over at least ``min_samples`` calls reaches
+    ``max_error_rate``. Models without ``min_samples`` successes yet keep their
+    configured order ahead of measured ones, so each gets measured.
+    """
+    
+    def __init__(self, default_models, routes=None, window=200, min_samples=5,
+                 max_error_rate=0.5, max_consecutive_failures=3, cooldown=30.0):
+        self.default_models = list(default_models)
+        self.routes = dict(routes or {})
+        self.window = window
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.max_consecutive_failures = max_consecutive_failures
+        self.cooldown = cooldown
+        
+        self._lock = threading.Lock()
+        self._trackers = {}
+        self._decisions = defaultdict(lambda: defaultdict(int))  # operation -> model -> calls
+        self._failovers = defaultdict(int)
+    
+    def models_for(self, operation):
+        """Configured candidate models of an operation, in preference order"""
+        return self.routes.get(operation) or self.default_models
+    
+    def route_key(self, operation):
+        """Stable name of an operation's route, for cache keys"""
+        return '|'.join(self.models_for(operation))
+    
+    def candidates(self, operation):
+        """Models to try for an operation, best first; models cooling down go last"""
+        now = time.monotonic()
+        with self._lock:
+            ranked = []
+            for position, model in enumerate(self.models_for(operation)):
+                tracker = self._tracker(operation, model)
+                latencies = tracker.latencies()
+                cooling = tracker.cooldown_until > now
+                if len(latencies) < self.min_samples:
+                    ranked.append((cooling, 0, position, model))
+                else:
+                    ranked.append((cooling, 1, percentile(latencies, 50), model))
+        return [model for *_, model in sorted(ranked)]
+    
+    def record(self, operation, model, seconds, ok):
+        """Record the outcome of a call, cooling the model down if it keeps failing"""
+        with self._lock:
+            tracker = self._tracker(operation, model)
+            tracker.record(seconds, ok)
+            if ok:
+                self._decisions[operation][model] += 1
+                return
+            
+            unhealthy = tracker.consecutive_failures >= self.max_consecutive_failures or (
+                len(tracker.samples) >= self.min_samples and tracker.error_rate() >= self.max_error_rate)
+            if unhealthy:
+                tracker.cooldown_until = time.monotonic() + self.cooldown
+    
+    def record_failover(self, operation):
+        with self._lock:
+            self._failovers[operation] += 1
+    
+    def stats(self):
+        """Per operation: the current model order, calls served, failovers and per-model latency"""
+        operations = {}
+        for operation in OPERATIONS:
+            order = self.candidates(operation)
+            now = time.monotonic()
+            with self._lock:
+                models = {}
+                for model in self.models_for(operation):
+                    tracker = self._tracker(operation, model)
+                    latencies = tracker.latencies()
+                    models[model] = {
+                        'calls': self._decisions[operation][model],
+                        'samples': len(tracker.samples),
+                        'error_rate': tracker.error_rate(),
+                        'latency_p50': percentile(latencies, 50),
+                        'latency_p95': percentile(latencies, 95),
+                        'latency_histogram': [{'le': bound, 'count': count} for bound, count
+                                              in zip(LATENCY_BUCKETS + (None,), tracker.histogram)],
+                        'cooling_down': tracker.cooldown_until > now
+                    }
+                operations[operation] = {
+                    'order': order,
+                    'failovers': self._failovers[operation],
+                    'models': models
+                }
+        return operations
+    
+    def _tracker(self, operation, model):
+        key = (operation, model)
+        tracker = self._trackers.get(key)
+        if tracker is None:
+            tracker = self._trackers[key] = ModelTracker(self.window)
+        return tracker
+
+def init_model_router(app):
+    """Create the application's model router"""
+    router = ModelRouter(
+        [model.strip() for model in app.config['AI_MODELS'].split(',') if model.strip()],
+        routes=parse_routes(app.config['AI_MODEL_ROUTES']),
+        window=app.config['AI_ROUTER_WINDOW'],
+        min_samples=app.config['AI_ROUTER_MIN_SAMPLES'],
+        max_error_rate=app.config['AI_ROUTER_MAX_ERROR_RATE'],
+        max_consecutive_failures=app.config['AI_ROUTER_MAX_CONSECUTIVE_FAILURES'],
+        cooldown=app.config['AI_ROUTER_COOLDOWN']
+    )
+    app.extensions['model_router'] = router
+    return router
+
+def get_model_router():
+    """Get the model router of the current application"""
+    return current_app.extensions['model_router']
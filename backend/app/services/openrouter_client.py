@@ -0,0 +1,174 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class OpenRouterClient:
+    """Process-wide HTTP client for the OpenRouter API.
+
+    Wraps a single ``requests.Session`` so connections to the upstream are
+    pooled and kept alive between generations, applies connect/read timeouts
+    to every call, and retries 429/5xx responses and connection failures with
+    jittered exponential backoff (honouring ``Retry-After`` when present).
+    """
+
+    def __init__(self, pool_size=10, connect_timeout=5.0, read_timeout=120.0,
+                 max_retries=3, backoff_base=0.5, backoff_max=30.0):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=500)
+        self._in_flight = 0
+        self._counters = {
+            'requests': 0,
+            'responses': 0,
+            'retries': 0,
+            'timeouts': 0,
+            'connection_errors': 0,
+            'upstream_errors': 0
+        }
+
+    def post(self, url, headers=None, json=None, stream=False):
+        """POST with pooling, timeouts and retries; returns the final response"""
+        attempt = 0
+        while True:
+            self._count('requests')
+            start = time.monotonic()
+            with self._lock:
+                self._in_flight += 1
+
+            try:
+                response = self.session.post(url, headers=headers, json=json, stream=stream,
+                                             timeout=(self.connect_timeout, self.read_timeout))
+            except requests.exceptions.ConnectTimeout:
+                self._count('timeouts')
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+            except requests.exceptions.Timeout:
+                # A read timeout means the upstream accepted the request; don't pay for it twice
+                self._count('timeouts')
+                raise
+            except requests.exceptions.ConnectionError:
+                self._count('connection_errors')
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+            else:
+                self._record_latency(time.monotonic() - start)
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+
+                self._count('upstream_errors')
+                if attempt >= self.max_retries:
+                    return response
+                delay = self._retry_after(response)
+                if delay is None:
+                    delay = self._backoff(attempt)
+                response.close()
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+
+            attempt += 1
+            self._count('retries')
+            time.sleep(delay)
+
+    def stats(self):
+        """Pool configuration, counters and latency percentiles"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = dict(self._counters)
+            stats['in_flight'] = self._in_flight
+
+        stats.update({
+            'pool_size': self.pool_size,
+            'connect_timeout': self.connect_timeout,
+            'read_timeout': self.read_timeout,
+            'max_retries': self.max_retries,
+            'latency_samples': len(latencies),
+            'latency_avg': sum(latencies) / len(latencies) if latencies else None,
+            'latency_p50': percentile(latencies, 50),
+            'latency_p95': percentile(latencies, 95)
+        })
+        return stats
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _record_latency(self, seconds):
+        with self._lock:
+            self._counters['responses'] += 1
+            self._latencies.append(seconds)
+
+    def _backoff(self, attempt):
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _retry_after(self, response):
+        """Parse a Retry-After header (seconds or HTTP date), capped at backoff_max"""
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                retry_at = parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                return None
+            if retry_at.tzinfo is None:
+                retry_at = retry_at.replace(tzinfo=timezone.utc)
+            delay = (retry_at - datetime.now(timezone.utc)).total_seconds()
+
+        return min(max(delay, 0.0), self.backoff_max)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_openrouter_client():
+    """Get the shared OpenRouter client, creating it from the environment on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OpenRouterClient(
+                    pool_size=int(os.environ.get('OPENROUTER_POOL_SIZE', 10)),
+                    connect_timeout=float(os.environ.get('OPENROUTER_CONNECT_TIMEOUT', 5)),
+                    read_timeout=float(os.environ.get('OPENROUTER_READ_TIMEOUT', 120)),
+                    max_retries=int(os.environ.get('OPENROUTER_MAX_RETRIES', 3)),
+                    backoff_base=float(os.environ.get('OPENROUTER_BACKOFF_BASE', 0.5)),
+                    backoff_max=float(os.environ.get('OPENROUTER_BACKOFF_MAX', 30))
+                )
+    return _client
@@ -0,0 +1,218 @@
+import atexit
+import base64
+import hashlib
+import hmac
+import os
+import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from flask import current_app
+
+ALGORITHMS = ('scrypt', 'pbkdf2_sha256')
+SALT_BYTES = 16
+
+class PasswordHasherBusyError(Exception):
+    """Raised when too many password hashes are already queued"""
+    pass
+
+def _b64encode(data):
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+def _b64decode(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+                          maxmem=128 * r * (n + p + 2) + (1 << 20), dklen=32)
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+
+def encode_hash(password, algorithm, params):
+    """Hash a password with a fresh salt into a self-describing string.
+
+    Formats are ``scrypt$<n>$<r>$<p>$<salt>$<hash>`` and
+    ``pbkdf2_sha256$<iterations>$<salt>$<hash>``, so the cost used for a
+    stored hash is always known when verifying it.
+    """
+    salt = os.urandom(SALT_BYTES)
+    if algorithm == 'scrypt':
+        n, r, p = params
+        return f'scrypt${n}${r}${p}${_b64encode(salt)}${_b64encode(_scrypt(password, salt, n, r, p))}'
+    if algorithm == 'pbkdf2_sha256':
+        iterations, = params
+        return f'pbkdf2_sha256${iterations}${_b64encode(salt)}${_b64encode(_pbkdf2(password, salt, iterations))}'
+    raise ValueError(f"Unknown password hash algorithm: {algorithm}")
+
+def parse_hash(encoded):
+    """Split a stored hash into (algorithm, params); unsalted SHA-256 hex is 'sha256'"""
+    parts = encoded.split('$')
+    if parts[0] == 'scrypt' and len(parts) == 6:
+        return 'scrypt', tuple(int(value) for value in parts[1:4])
+    if parts[0] == 'pbkdf2_sha256' and len(parts) == 4:
+        return 'pbkdf2_sha256', (int(parts[1]),)
+    if len(encoded) == 64 and all(char in string.hexdigits for char in encoded):
+        return 'sha256', ()
+    raise ValueError("Unrecognised password hash format")
+
+def verify_hash(password, encoded):
+    """Check a password against any supported stored hash"""
+    algorithm, params = parse_hash(encoded)
+    parts = encoded.split('$')
+    if algorithm == 'scrypt':
+        expected = _b64decode(parts[5])
+        actual = _scrypt(password, _b64decode(parts[4]), *params)
+    elif algorithm == 'pbkdf2_sha256':
+        expected = _b64decode(parts[3])
+        actual = _pbkdf2(password, _b64decode(parts[2]), *params)
+    else:
+        # Legacy unsalted hashes from before the KDF migration
+        expected = encoded.encode('ascii')
+        actual = hashlib.sha256(password.encode()).hexdigest().encode('ascii')
+    return hmac.compare_digest(expected, actual)
+
+class PasswordHasher:
+    """Salted, tunable password hashing on a dedicated, bounded worker pool.
+
+    Hashing is deliberately slow, so it runs on ``workers`` dedicated threads
+    rather than on however many request threads happen to be logging in.
+    hashlib's scrypt and PBKDF2 release the GIL, so hashes run in parallel
+    without stalling the rest of the API. At most ``max_pending`` hashes may
+    be queued or running; beyond that callers are rejected immediately with
+    PasswordHasherBusyError instead of piling up behind a login burst. A hash
+    whose caller timed out is cancelled if it has not started yet, and keeps
+    its slot until it finishes if it has. ``workers=0`` hashes on the calling
+    thread.
+    """
+    
+    def __init__(self, algorithm='scrypt', scrypt_n=2 ** 14, scrypt_r=8, scrypt_p=1,
+                 pbkdf2_iterations=600000, workers=2, max_pending=32, timeout=10.0):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown password hash algorithm: {algorithm}")
+        self.algorithm = algorithm
+        if algorithm == 'scrypt':
+            self.params = (scrypt_n, scrypt_r, scrypt_p)
+        else:
+            self.params = (pbkdf2_iterations,)
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pending = 0
+        self._counters = {
+            'hashed': 0,
+            'verified': 0,
+            'rejected': 0,
+            'timeouts': 0,
+            'seconds': 0.0
+        }
+    
+    def hash(self, password):
+        """Hash a password with the current algorithm and cost"""
+        result = self._run(encode_hash, password, self.algorithm, self.params)
+        self._count('hashed')
+        return result
+    
+    def verify(self, password, encoded):
+        """Check a password; returns (matches, needs_rehash)"""
+        try:
+            algorithm, params = parse_hash(encoded)
+        except ValueError:
+            return False, False
+        
+        if algorithm == 'sha256':
+            # Cheap enough to check inline; the caller upgrades it on success
+            matches = verify_hash(password, encoded)
+        else:
+            matches = self._run(verify_hash, password, encoded)
+        self._count('verified')
+        return matches, (algorithm, params) != (self.algorithm, self.params)
+    
+    def stats(self):
+        """Pool usage, cost settings and counters"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['pending'] = self._pending
+        jobs = stats['hashed'] + stats['verified']
+        stats.update({
+            'algorithm': self.algorithm,
+            'params': list(self.params),
+            'workers': self.workers,
+            'max_pending': self.max_pending,
+            'avg_seconds': stats.pop('seconds') / jobs if jobs else None
+        })
+        return stats
+    
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+    
+    def _run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._counters['rejected'] += 1
+                raise PasswordHasherBusyError("Too many sign-in requests, try again shortly")
+            self._pending += 1
+        
+        start = time.monotonic()
+        if not self.workers:
+            try:
+                return fn(*args)
+            finally:
+                self._release(start)
+        
+        try:
+            future = self._get_pool().submit(fn, *args)
+        except Exception:
+            self._release(start)
+            raise
+        # The slot is held until the hash has finished or been cancelled, not
+        # just while someone waits for it, so max_pending bounds the pool's backlog
+        future.add_done_callback(lambda _: self._release(start))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            self._count('timeouts')
+            raise PasswordHasherBusyError("Password hashing timed out, try again shortly")
+    
+    def _release(self, start):
+        with self._lock:
+            self._pending -= 1
+            self._counters['seconds'] += time.monotonic() - start
+    
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers,
+                                                thread_name_prefix='password-hash')
+            return self._pool
+    
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+def init_password_hasher(app):
+    """Create the application's password hasher"""
+    hasher = PasswordHasher(
+        algorithm=app.config['PASSWORD_HASH_ALGORITHM'],
+        scrypt_n=app.config['PASSWORD_SCRYPT_N'],
+        scrypt_r=app.config['PASSWORD_SCRYPT_R'],
+        scrypt_p=app.config['PASSWORD_SCRYPT_P'],
+        pbkdf2_iterations=app.config['PASSWORD_PBKDF2_ITERATIONS'],
+        workers=app.config['PASSWORD_HASH_WORKERS'],
+        max_pending=app.config['PASSWORD_HASH_MAX_PENDING'],
+        timeout=app.config['PASSWORD_HASH_TIMEOUT']
+    )
+    app.extensions['password_hasher'] = hasher
+    atexit.register(hasher.shutdown)
+    return hasher
+
+def get_password_hasher():
+    """Get the password hasher of the current application"""
+    return current_app.extensions['password_hasher']
@@ -0,0 +1,234 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from app.db import connect
+
+class RateLimitError(Exception):
+    """Raised when an AI call can't get budget before its deadline"""
+    
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class RateLimiter:
+    """Token buckets for OpenRouter calls, shared by every process through SQLite.
+
+    Each budget (global and per-user, requests/min and tokens/min) is a bucket
+    holding up to one minute's allowance and refilling continuously. A call
+    reserves one request and its worst-case tokens (prompt estimate plus
+    ``max_tokens``) from every bucket at once, then settles with the usage
+    OpenRouter reports, refunding what it didn't use.
+
+    Callers without budget wait, polling the buckets, until their deadline
+    rather than failing straight away. ``batch`` callers must also leave
+    ``batch_headroom`` of each bucket untouched, so interactive requests
+    still get through while a batch is draining the budget. A limit of 0
+    disables that bucket.
+    """
+    
+    def __init__(self, db_path, global_rpm=120, global_tpm=1000000, user_rpm=30, user_tpm=300000,
+                 batch_headroom=0.25, deadlines=None, poll_interval=0.5):
+        self.db_path = db_path
+        self.global_rpm = global_rpm
+        self.global_tpm = global_tpm
+        self.user_rpm = user_rpm
+        self.user_tpm = user_tpm
+        self.batch_headroom = batch_headroom
+        self.deadlines = deadlines or {'interactive': 30, 'batch': 600}
+        self.poll_interval = poll_interval
+        
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._counters = {
+            'admitted': 0,
+            'delayed': 0,
+            'rejected': 0,
+            'wait_seconds': 0.0,
+            'tokens_reserved': 0,
+            'tokens_refunded': 0
+        }
+    
+    def acquire(self, user_id, tokens, priority='interactive'):
+        """Wait until the call fits every budget and reserve it; returns the tokens reserved"""
+        start = time.monotonic()
+        deadline = start + self.deadlines.get(priority, self.deadlines['interactive'])
+        delayed = False
+        
+        while True:
+            wait = self._try_take(user_id, tokens, priority)
+            if wait == 0:
+                break
+            
+            now = time.monotonic()
+            if now + wait > deadline:
+                self._count('rejected')
+                raise RateLimitError("AI request budget exhausted, try again shortly", wait)
+            delayed = True
+            time.sleep(min(wait, self.poll_interval))
+        
+        with self._lock:
+            self._counters['admitted'] += 1
+            self._counters['tokens_reserved'] += tokens
+            if delayed:
+                self._counters['delayed'] += 1
+                self._counters['wait_seconds'] += time.monotonic() - start
+        return tokens
+    
+    def settle(self, user_id, reserved, prompt_tokens=None, completion_tokens=None,
+               priority='interactive', model=None):
+        """Refund unused reserved tokens and record the call's usage"""
+        if prompt_tokens is None and completion_tokens is None:
+            used = reserved  # No usage reported; keep the reservation
+        else:
+            used = (prompt_tokens or 0) + (completion_tokens or 0)
+        refund = reserved - used
+        
+        conn = self._connection()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if refund:
+                for name, limit, _ in self._buckets(user_id, 0):
+                    if name.endswith(':tokens'):
+                        self._adjust(conn, name, limit, refund, now)
+            conn.execute('''
+                INSERT INTO ai_usage (user_id, priority, model, prompt_tokens, completion_tokens, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (user_id, priority, model, prompt_tokens, completion_tokens, datetime.now()))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        
+        if refund > 0:
+            with self._lock:
+                self._counters['tokens_refunded'] += refund
+    
+    def usage(self, user_id=None, since=None):
+        """Requests and tokens recorded since a time (default: the last 24 hours)"""
+        since = since or datetime.now() - timedelta(days=1)
+        query = '''
+            SELECT COUNT(*), COALESCE(SUM(prompt_tokens), 0), COALESCE(SUM(completion_tokens), 0)
+            FROM ai_usage WHERE created_at >= ?
+        '''
+        params = [since]
+        if user_id is not None:
+            query += ' AND user_id = ?'
+            params.append(user_id)
+        
+        requests, prompt_tokens, completion_tokens = self._connection().execute(query, params).fetchone()
+        return {
+            'requests': requests,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'since': since
+        }
+    
+    def stats(self):
+        """Budgets, admission counters and usage over the last minute"""
+        with self._lock:
+            stats = dict(self._counters)
+        stats.update({
+            'global_rpm': self.global_rpm,
+            'global_tpm': self.global_tpm,
+            'user_rpm': self.user_rpm,
+            'user_tpm': self.user_tpm,
+            'batch_headroom': self.batch_headroom,
+            'last_minute': self.usage(since=datetime.now() - timedelta(minutes=1))
+        })
+        return stats
+    
+    def _buckets(self, user_id, tokens):
+        """(name, per-minute limit, amount to take) for every enabled bucket"""
+        buckets = [('global:requests', self.global_rpm, 1), ('global:tokens', self.global_tpm, tokens)]
+        if user_id is not None:
+            buckets += [(f'user:{user_id}:requests', self.user_rpm, 1),
+                        (f'user:{user_id}:tokens', self.user_tpm, tokens)]
+        return [bucket for bucket in buckets if bucket[1] > 0]
+    
+    def _try_take(self, user_id, tokens, priority):
+        """Take from every bucket if they all allow it; otherwise return seconds to wait"""
+        buckets = self._buckets(user_id, tokens)
+        if not buckets:
+            return 0
+        
+        conn = self._connection()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            wait = 0
+            levels = {}
+            for name, limit, amount in buckets:
+                level = self._level(conn, name, limit, now)
+                levels[name] = level
+                # A call bigger than the bucket goes through once the bucket is full
+                needed = min(amount, limit)
+                if priority != 'interactive':
+                    needed = min(needed + self.batch_headroom * limit, limit)
+                if level < needed:
+                    wait = max(wait, (needed - level) * 60.0 / limit)
+            
+            if wait:
+                conn.execute('ROLLBACK')
+                return wait
+            
+            for name, limit, amount in buckets:
+                self._store(conn, name, levels[name] - amount, now)
+            conn.execute('COMMIT')
+            return 0
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    
+    def _level(self, conn, name, limit, now):
+        row = conn.execute('SELECT level, updated_at FROM rate_buckets WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            return float(limit)
+        level, updated_at = row
+        return min(float(limit), level + max(0.0, now - updated_at) * limit / 60.0)
+    
+    def _adjust(self, conn, name, limit, delta, now):
+        self._store(conn, name, min(float(limit), self._level(conn, name, limit, now) + delta), now)
+    
+    def _store(self, conn, name, level, now):
+        conn.execute('''
+            INSERT INTO rate_buckets (name, level, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET level = excluded.level, updated_at = excluded.updated_at
+        ''', (name, level, now))
+    
+    def _connection(self):
+        # A connection of our own, in autocommit mode, so BEGIN IMMEDIATE never
+        # collides with a transaction the request has open on its connection
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = connect(self.db_path)
+            conn.isolation_level = None
+        return conn
+    
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+def init_rate_limiter(app):
+    """Create the application's OpenRouter rate limiter"""
+    limiter = None
+    if app.config['AI_RATE_LIMIT_ENABLED']:
+        limiter = RateLimiter(
+            app.config['DATABASE_PATH'],
+            global_rpm=app.config['AI_GLOBAL_RPM'],
+            global_tpm=app.config['AI_GLOBAL_TPM'],
+            user_rpm=app.config['AI_USER_RPM'],
+            user_tpm=app.config['AI_USER_TPM'],
+            batch_headroom=app.config['AI_BATCH_HEADROOM'],
+            deadlines={
+                'interactive': app.config['AI_INTERACTIVE_DEADLINE'],
+                'batch': app.config['AI_BATCH_DEADLINE']
+            }
+        )
+    app.extensions['rate_limiter'] = limiter
+    return limiter
+
+def get_rate_limiter():
+    """Get the rate limiter of the current application, or None if disabled"""
+    return current_app.extensions.get('rate_limiter')
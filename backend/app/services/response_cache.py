@@ -0,0 +1,148 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+class ResponseCache:
+    """LRU of encoded JSON bodies keyed by (ETag, content coding).
+
+    A strong ETag names one version of a resource, so its serialized body
+    and its gzip/brotli variants can be reused until the resource changes.
+    Bodies smaller than ``min_size`` are sent uncompressed. The cache is
+    bounded by the total size of the stored bodies.
+    """
+    
+    def __init__(self, max_bytes=64 * 1024 * 1024, min_size=1024, gzip_level=6, brotli_quality=5):
+        self.max_bytes = max_bytes
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.codings = (('br',) if brotli is not None else ()) + ('gzip',)
+        
+        self._lock = threading.Lock()
+        self._bodies = OrderedDict()  # (etag, coding) -> bytes
+        self._bytes = 0
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'not_modified': 0,
+            'evictions': 0,
+            'bytes_sent': 0,
+            'bytes_uncompressed': 0
+        }
+    
+    def get(self, etag, coding):
+        with self._lock:
+            body = self._bodies.get((etag, coding))
+            if body is None:
+                self._counters['misses'] += 1
+                return None
+            self._bodies.move_to_end((etag, coding))
+            self._counters['hits'] += 1
+            return body
+    
+    def put(self, etag, coding, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._bodies.pop((etag, coding), None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._bodies[(etag, coding)] = body
+            self._bytes += len(body)
+            
+            while self._bytes > self.max_bytes:
+                _, evicted = self._bodies.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._counters['evictions'] += 1
+    
+    def compress(self, body, coding):
+        if coding == 'br':
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+    
+    def record(self, sent, uncompressed=0, not_modified=False):
+        with self._lock:
+            self._counters['bytes_sent'] += sent
+            self._counters['bytes_uncompressed'] += uncompressed
+            if not_modified:
+                self._counters['not_modified'] += 1
+    
+    def stats(self):
+        """Cache size and hit counters, plus bytes sent versus uncompressed size"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['entries'] = len(self._bodies)
+            stats['bytes'] = self._bytes
+        stats['codings'] = list(self.codings)
+        return stats
+
+def etag_for(*parts):
+    """Strong ETag from the values that identify one version of a resource"""
+    return hashlib.sha256('\x1f'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:32]
+
+def conditional_json(etag, build):
+    """JSON response for the resource version named by ``etag``.
+
+    Answers 304 when the client already holds that version. Otherwise sends
+    the body (from ``build()`` on a cache miss) in the best content coding
+    the client accepts, reusing bodies already encoded for this ETag.
+    """
+    cache = get_response_cache()
+    if request.if_none_match.contains(etag):
+        cache.record(0, not_modified=True)
+        return _json_response(b'', etag, None, status=304)
+    
+    body = cache.get(etag, 'identity')
+    if body is None:
+        body = current_app.json.dumps(build()).encode('utf-8')
+        cache.put(etag, 'identity', body)
+    
+    coding = None
+    if len(body) >= cache.min_size:
+        coding = request.accept_encodings.best_match(cache.codings)
+    if coding:
+        encoded = cache.get(etag, coding)
+        if encoded is None:
+            encoded = cache.compress(body, coding)
+            cache.put(etag, coding, encoded)
+        cache.record(len(encoded), len(body))
+        return _json_response(encoded, etag, coding)
+    
+    cache.record(len(body), len(body))
+    return _json_response(body, etag, None)
+
+def json_with_etag(payload):
+    """conditional_json for responses whose ETag is the hash of their own body"""
+    body = current_app.json.dumps(payload).encode('utf-8')
+    etag = hashlib.sha256(body).hexdigest()[:32]
+    get_response_cache().put(etag, 'identity', body)
+    return conditional_json(etag, lambda: payload)
+
+def _json_response(body, etag, coding, status=200):
+    response = current_app.response_class(body, status=status, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Accept-Encoding')
+    if coding:
+        response.headers['Content-Encoding'] = coding
+    return response
+
+def init_response_cache(app):
+    """Create the application's response cache"""
+    cache = ResponseCache(
+        max_bytes=app.config['RESPONSE_CACHE_BYTES'],
+        min_size=app.config['RESPONSE_COMPRESS_MIN_SIZE']
+    )
+    app.extensions['response_cache'] = cache
+    return cache
+
+def get_response_cache():
+    """Get the response cache of the current application"""
+    return current_app.extensions['response_cache']
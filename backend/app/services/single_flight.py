@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from flask import current_app
+from app.db import connect
+from app.services.rate_limiter import RateLimitError
+
+
+class SingleFlightError(Exception):
+    """Raised to callers in other processes that shared the result of a call that failed"""
+    pass
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def flight_key(project_id, prompt, operation):
+    """Coalescing key for an AI request on a project"""
+    prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+    return f"{operation}:{project_id}:{prompt_hash}"
+
+
+class SingleFlight:
+    """Coalesces concurrent identical calls so only one of them does the work.
+
+    Threads in the same process wait on an in-memory flight. Across processes
+    (e.g. gunicorn workers) the leader holds a lease row in ``request_leases``;
+    other processes poll the row and pick up the stored result. A lease that
+    outlives ``lease_seconds`` is considered abandoned and can be taken over.
+    Finished results stay readable for ``result_ttl`` seconds to absorb
+    retries that arrive just after the call completed.
+
+    When the call fails, callers in the same process get the leader's own
+    exception. Other processes get a RateLimitError (with its
+    ``retry_after``) if that is what the leader hit, and a
+    SingleFlightError with the leader's message otherwise.
+    """
+
+    def __init__(self, db_path, lease_seconds=600, result_ttl=5, poll_interval=0.25):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._flights = {}
+        self._counters = {'leaders': 0, 'local_waiters': 0, 'remote_waiters': 0, 'takeovers': 0}
+
+    def do(self, key, fn):
+        """Run ``fn`` once for concurrent callers with the same key.
+
+        Returns ``(result, shared)`` where ``shared`` is True when the result
+        came from another caller's execution. ``fn`` must return a JSON
+        serializable value.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+            else:
+                self._counters['local_waiters'] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result, shared = self._run_with_lease(key, fn)
+            return flight.result, shared
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['in_flight'] = len(self._flights)
+        return stats
+
+    def _run_with_lease(self, key, fn):
+        owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+
+        while True:
+            state, row = self._acquire(key, owner)
+
+            if state == 'leader':
+                with self._lock:
+                    self._counters['leaders'] += 1
+                try:
+                    result = fn()
+                except Exception as e:
+                    self._release(key, owner, 'failed', error=str(e),
+                                  retry_after=getattr(e, 'retry_after', None))
+                    raise
+                self._release(key, owner, 'done', result=json.dumps(result))
+                return result, False
+
+            with self._lock:
+                self._counters['remote_waiters'] += 1
+            status, result, error, retry_after = self._wait_remote(key, row)
+            if status == 'done':
+                return json.loads(result), True
+            if status == 'failed':
+                if retry_after is not None:
+                    raise RateLimitError(error, retry_after)
+                raise SingleFlightError(error)
+            # The remote leader vanished; try to take the lease over
+            with self._lock:
+                self._counters['takeovers'] += 1
+
+    def _acquire(self, key, owner):
+        """Take the lease or return the current holder's row"""
+        now = time.time()
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM request_leases WHERE expires_at < ?', (now - 3600,))
+            cursor = conn.execute('''
+                INSERT OR IGNORE INTO request_leases (lease_key, owner, status, expires_at, created_at)
+                VALUES (?, ?, 'running', ?, ?)
+            ''', (key, owner, now + self.lease_seconds, now))
+            if cursor.rowcount == 0:
+                cursor = conn.execute('''
+                    UPDATE request_leases
+                    SET owner = ?, status = 'running', result = NULL, error_message = NULL, retry_after = NULL,
+                        expires_at = ?, created_at = ?
+                    WHERE lease_key = ? AND expires_at < ?
+                ''', (owner, now + self.lease_seconds, now, key, now))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        if cursor.rowcount == 1:
+            return 'leader', None
+
+        row = conn.execute('''
+            SELECT status, result, error_message, retry_after, expires_at FROM request_leases WHERE lease_key = ?
+        ''', (key,)).fetchone()
+        return 'follower', row
+
+    def _wait_remote(self, key, row):
+        """Poll another process's lease until it finishes or expires"""
+        while True:
+            if row is None:
+                return None, None, None, None
+            status, result, error, retry_after, expires_at = row
+            if status in ('done', 'failed'):
+                return status, result, error, retry_after
+            if expires_at < time.time():
+                return None, None, None, None
+
+            time.sleep(self.poll_interval)
+            row = self._connection().execute('''
+                SELECT status, result, error_message, retry_after, expires_at FROM request_leases WHERE lease_key = ?
+            ''', (key,)).fetchone()
+
+    def _release(self, key, owner, status, result=None, error=None, retry_after=None):
+        self._connection().execute('''
+            UPDATE request_leases SET status = ?, result = ?, error_message = ?, retry_after = ?, expires_at = ?
+            WHERE lease_key = ? AND owner = ?
+        ''', (status, result, error, retry_after, time.time() + self.result_ttl, key, owner))
+
+    def _connection(self):
+        # A connection of our own, in autocommit mode, so lease updates never
+        # commit or roll back a transaction the request has open on its connection
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = connect(self.db_path)
+            conn.isolation_level = None
+        return conn
+
+
+def init_single_flight(app):
+    """Create the application's request coalescer"""
+    single_flight = SingleFlight(
+        app.config['DATABASE_PATH'],
+        lease_seconds=app.config['SINGLE_FLIGHT_LEASE_SECONDS'],
+        result_ttl=app.config['SINGLE_FLIGHT_RESULT_TTL']
+    )
+    app.extensions['single_flight'] = single_flight
+    return single_flight
+
+
+def get_single_flight():
+    """Get the request coalescer of the current application"""
+    return current_app.extensions['single_flight']
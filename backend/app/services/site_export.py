@@ -0,0 +1,123 @@
+import gzip
+import os
+import re
+import shutil
+import tempfile
+import threading
+from flask import current_app
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+INDEX_FILE = 'index.html'
+CODING_SUFFIXES = {None: '', 'gzip': '.gz', 'br': '.br'}
+
+class SiteExporter:
+    """Generated sites on disk as precompressed, content-addressed bundles.
+
+    A bundle lives under ``<root>/<hash[:2]>/<hash>/`` and holds
+    ``index.html`` plus ``index.html.gz`` (and ``index.html.br`` when brotli
+    is installed), where the hash is the site's content blob hash. Bundles
+    are written once, compressed at the highest level, and never change
+    afterwards, so a static server (``gzip_static``/``brotli_static``) or
+    sendfile can serve them directly.
+    """
+    
+    def __init__(self, root, gzip_level=9, brotli_quality=11):
+        self.root = root
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.codings = (('br',) if brotli is not None else ()) + ('gzip',)
+        
+        self._lock = threading.Lock()
+        self._counters = {
+            'exports': 0,
+            'bytes_written': 0,
+            'removals': 0,
+            'errors': 0
+        }
+    
+    def bundle_dir(self, content_hash):
+        if not HASH_PATTERN.match(content_hash or ''):
+            raise ValueError("Invalid content hash")
+        return os.path.join(self.root, content_hash[:2], content_hash)
+    
+    def path(self, content_hash, coding=None):
+        """File holding a bundle's HTML in the given content coding (None for identity)"""
+        return os.path.join(self.bundle_dir(content_hash), INDEX_FILE + CODING_SUFFIXES[coding])
+    
+    def exists(self, content_hash):
+        return os.path.isfile(self.path(content_hash))
+    
+    def export(self, content_hash, html):
+        """Write a site's bundle unless it is already on disk; returns whether it was written"""
+        target = self.bundle_dir(content_hash)
+        if os.path.isdir(target):
+            return False
+        
+        raw = html.encode('utf-8')
+        files = {None: raw, 'gzip': gzip.compress(raw, compresslevel=self.gzip_level, mtime=0)}
+        if brotli is not None:
+            files['br'] = brotli.compress(raw, quality=self.brotli_quality)
+        
+        parent = os.path.dirname(target)
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix='.export-', dir=parent)
+        try:
+            for coding, data in files.items():
+                with open(os.path.join(staging, INDEX_FILE + CODING_SUFFIXES[coding]), 'wb') as f:
+                    f.write(data)
+            # Readers see either no bundle or a complete one
+            os.rename(staging, target)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+            if os.path.isdir(target):
+                return False  # Another worker exported the same content first
+            raise
+        
+        with self._lock:
+            self._counters['exports'] += 1
+            self._counters['bytes_written'] += sum(len(data) for data in files.values())
+        return True
+    
+    def try_export(self, content_hash, html):
+        """export() that logs failures instead of raising, for use after a save"""
+        try:
+            return self.export(content_hash, html)
+        except OSError as e:
+            with self._lock:
+                self._counters['errors'] += 1
+            print(f"Failed to export site {content_hash}: {e}")
+            return False
+    
+    def remove(self, content_hash):
+        """Delete a bundle"""
+        target = self.bundle_dir(content_hash)
+        if os.path.isdir(target):
+            shutil.rmtree(target, ignore_errors=True)
+            with self._lock:
+                self._counters['removals'] += 1
+    
+    def best_coding(self, accept_encodings):
+        """Best precompressed variant for a request's Accept-Encoding, or None for identity"""
+        return accept_encodings.best_match(self.codings)
+    
+    def stats(self):
+        """Export counters and the codings bundles are written in"""
+        with self._lock:
+            stats = dict(self._counters)
+        stats['codings'] = list(self.codings)
+        return stats
+
+def init_site_exporter(app):
+    """Create the application's site exporter"""
+    exporter = SiteExporter(app.config['PREVIEW_EXPORT_DIR'])
+    app.extensions['site_exporter'] = exporter
+    return exporter
+
+def get_site_exporter():
+    """Get the site exporter of the current application"""
+    return current_app.extensions['site_exporter']
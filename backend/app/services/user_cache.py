@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from app.db import get_db
+
+LOOKUP_FIELDS = ('email', 'username')
+
+class UserCache:
+    """In-process TTL + LRU cache of ``users`` rows, keyed by id, email and username.
+
+    Rows are cached for ``ttl`` seconds, at most ``max_entries`` of them.
+    Writes through ``User`` invalidate the local entry immediately and bump
+    a counter in the ``cache_versions`` table; other processes compare that
+    counter at most every ``version_check_interval`` seconds and drop their
+    whole cache when it has moved.
+    """
+    
+    def __init__(self, db_path, max_entries=1024, ttl=60, version_check_interval=1.0):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version_check_interval = version_check_interval
+        
+        self._lock = threading.Lock()
+        self._rows = OrderedDict()  # user_id -> (row, stored_at, lookups)
+        self._index = {field: {} for field in LOOKUP_FIELDS}  # field -> value -> user_id
+        self._version = None
+        self._version_checked_at = 0.0
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0,
+            'remote_invalidations': 0,
+            'version_checks': 0
+        }
+    
+    def get(self, field, value):
+        """Cached users row for an id, email or username, or None"""
+        self._check_version()
+        now = time.monotonic()
+        with self._lock:
+            user_id = value if field == 'id' else self._index[field].get(value)
+            entry = self._rows.get(user_id) if user_id is not None else None
+            if entry is None:
+                self._counters['misses'] += 1
+                return None
+            
+            row, stored_at, _ = entry
+            if now - stored_at >= self.ttl:
+                self._drop(user_id)
+                self._counters['expirations'] += 1
+                self._counters['misses'] += 1
+                return None
+            
+            self._rows.move_to_end(user_id)
+            self._counters['hits'] += 1
+            return row
+    
+    def put(self, row, lookups):
+        """Cache a users row; ``lookups`` maps 'email'/'username' to its values"""
+        user_id = row['id']
+        with self._lock:
+            self._drop(user_id)
+            self._rows[user_id] = (row, time.monotonic(), lookups)
+            for field in LOOKUP_FIELDS:
+                self._index[field][lookups[field]] = user_id
+            self._counters['stores'] += 1
+            
+            while len(self._rows) > self.max_entries:
+                oldest = next(iter(self._rows))
+                self._drop(oldest)
+                self._counters['evictions'] += 1
+    
+    def bump_version(self, conn):
+        """Record a user write for other processes (inside the caller's transaction)"""
+        conn.execute("UPDATE cache_versions SET version = version + 1 WHERE name = 'users'")
+        row = conn.execute("SELECT version FROM cache_versions WHERE name = 'users'").fetchone()
+        with self._lock:
+            # Our own write shouldn't make us throw away the rest of the cache
+            if row and self._version is not None and row[0] == self._version + 1:
+                self._version = row[0]
+    
+    def invalidate(self, user_id):
+        """Drop a user's cached row"""
+        with self._lock:
+            self._drop(user_id)
+            self._counters['invalidations'] += 1
+    
+    def stats(self):
+        """Entry count, hit rate and DB round trips saved"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['entries'] = len(self._rows)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['round_trips_saved'] = stats['hits'] - stats['version_checks']
+        return stats
+    
+    def _check_version(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._version_checked_at < self.version_check_interval:
+                return
+            self._version_checked_at = now
+            self._counters['version_checks'] += 1
+        
+        row = get_db(self.db_path).execute(
+            "SELECT version FROM cache_versions WHERE name = 'users'").fetchone()
+        version = row[0] if row else None
+        with self._lock:
+            if self._version is not None and version != self._version:
+                self._rows.clear()
+                for index in self._index.values():
+                    index.clear()
+                self._counters['remote_invalidations'] += 1
+            self._version = version
+    
+    def _drop(self, user_id):
+        entry = self._rows.pop(user_id, None)
+        if entry is None:
+            return
+        lookups = entry[2]
+        for field, index in self._index.items():
+            if index.get(lookups[field]) == user_id:
+                del index[lookups[field]]
+
+def init_user_cache(app):
+    """Create the application's user cache"""
+    cache = None
+    if app.config['USER_CACHE_ENABLED']:
+        cache = UserCache(
+            app.config['DATABASE_PATH'],
+            max_entries=app.config['USER_CACHE_SIZE'],
+            ttl=app.config['USER_CACHE_TTL'],
+            version_check_interval=app.config['USER_CACHE_VERSION_CHECK_INTERVAL']
+        )
+    app.extensions['user_cache'] = cache
+    return cache
+
+def get_user_cache():
+    """Get the user cache of the current application, or None if disabled"""
+    return current_app.extensions.get('user_cache')
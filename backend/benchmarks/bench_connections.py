@@ -0,0 +1,38 @@
+"""Primary-key lookups on a fresh connection per query vs the cached per-thread connection.
+
+    python benchmarks/bench_connections.py [lookups]
+"""
+import sqlite3
+import sys
+import time
+
+from common import make_app, register
+
+LOOKUPS = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+def main():
+    app = make_app()
+    register(app.test_client())
+    db_path = app.config['DATABASE_PATH']
+    
+    from app.db import get_db
+    
+    def fresh_connection():
+        conn = sqlite3.connect(db_path)
+        conn.execute('SELECT * FROM users WHERE id = ?', (1,)).fetchone()
+        conn.close()
+    
+    def cached_connection():
+        get_db(db_path).execute('SELECT * FROM users WHERE id = ?', (1,)).fetchone()
+    
+    with app.app_context():
+        for name, lookup in (('connect + query + close', fresh_connection), ('cached connection', cached_connection)):
+            lookup()
+            start = time.perf_counter()
+            for _ in range(LOOKUPS):
+                lookup()
+            average = (time.perf_counter() - start) / LOOKUPS * 1e6
+            print(f'{name:24s} {average:7.1f} us per lookup ({LOOKUPS} lookups)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Polling a project and the project listing with and without conditional requests.
+
+Polling clients send back the ETag of their last response in
+If-None-Match; the others fetch the full (gzip) body every time.
+
+    python benchmarks/bench_etags.py [requests]
+"""
+import sys
+import time
+
+from common import make_app, register
+
+REQUESTS = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+def poll(client, headers, url, conditional):
+    etag, sent, latencies = None, 0, []
+    for _ in range(REQUESTS):
+        request_headers = {**headers, 'Accept-Encoding': 'gzip'}
+        if conditional and etag:
+            request_headers['If-None-Match'] = etag
+        start = time.perf_counter()
+        response = client.get(url, headers=request_headers)
+        latencies.append((time.perf_counter() - start) * 1000)
+        sent += len(response.data)
+        etag = response.headers.get('ETag')
+    latencies.sort()
+    return sent / REQUESTS, latencies[REQUESTS // 2], latencies[int(REQUESTS * 0.95)]
+
+def main():
+    app = make_app()
+    client = app.test_client()
+    headers = register(client)
+    
+    code = '<html>' + ''.join(f'<section id="s{i}"><h2>Section {i}</h2><p>{"lorem ipsum dolor sit amet " * 20}</p>'
+                              f'</section>' for i in range(100)) + '</html>'
+    project_id = client.post('/api/projects/', json={'project_name': 'Site', 'website_type': 'business'},
+                             headers=headers).get_json()['project']['id']
+    client.put(f'/api/projects/{project_id}', json={'generated_code': code}, headers=headers)
+    for i in range(30):
+        client.post('/api/projects/', json={'project_name': f'Site {i}', 'website_type': 'business'}, headers=headers)
+    
+    identity = client.get(f'/api/projects/{project_id}', headers=headers)
+    print(f'project body without compression: {len(identity.data)} B')
+    for url in (f'/api/projects/{project_id}', '/api/projects/?per_page=20'):
+        for conditional in (False, True):
+            size, p50, p95 = poll(client, headers, url, conditional)
+            label = 'If-None-Match' if conditional else 'gzip, no ETag'
+            print(f'{url:28s} {label:14s} {size:8.0f} B/req  p50 {p50:.2f} ms  p95 {p95:.2f} ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Generation history with inline outputs vs outputs in content_blobs.
+
+Builds the same history twice: once the way it was stored before
+(generated HTML inline in every row, no per-project index) and once as
+it is stored now (a hash per row, deduplicated and compressed blobs,
+idx_history_project_created). Reports the database sizes and the
+latency of the first page, a deep cursor page and a single output fetch.
+
+    python benchmarks/bench_history.py [rows]
+"""
+import hashlib
+import os
+import random
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+
+from common import make_app, register, median_ms
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+PROJECTS = 2000
+PROJECT_ID = 777
+WORDS = ('hero', 'card', 'grid', 'flex', 'button', 'section', 'footer', 'nav', 'bakery', 'coffee',
+         'menu', 'about', 'contact', 'team', 'price')
+
+def output(project_id, revision):
+    """A ~1.6 KB page; each project cycles through three distinct outputs"""
+    rng = random.Random(project_id * 7 + revision)
+    body = ''.join(f'<div class="{rng.choice(WORDS)}">{rng.choice(WORDS)} {rng.choice(WORDS)} {revision}</div>\n'
+                   for _ in range(40))
+    return f'<!DOCTYPE html><html><head><style>.card{{padding:1rem}}</style></head><body>{body}</body></html>'
+
+def history_rows():
+    rng = random.Random(1)
+    start = datetime(2025, 1, 1)
+    for i in range(ROWS):
+        project_id = rng.randint(1, PROJECTS)
+        yield project_id, start + timedelta(seconds=i * 3), output(project_id, i % 9 // 3)
+
+def build(app, inline):
+    from app.models.content_blob import ContentBlob
+    
+    conn = sqlite3.connect(app.config['DATABASE_PATH'])
+    now = datetime.now()
+    conn.executemany('''
+        INSERT INTO website_projects (id, user_id, project_name, website_type, status, created_at, updated_at)
+        VALUES (?, 1, ?, 'business', 'generated', ?, ?)
+    ''', [(project_id, f'Project {project_id}', now, now) for project_id in range(1, PROJECTS + 1)])
+    if inline:
+        conn.execute('DROP INDEX idx_history_project_created')
+    
+    stored = set()
+    batch = []
+    for project_id, created_at, html in history_rows():
+        output_hash = None
+        if not inline:
+            output_hash = hashlib.sha256(html.encode('utf-8')).hexdigest()
+            if output_hash not in stored:
+                stored.add(output_hash)
+                codec, data = ContentBlob.compress(html)
+                conn.execute('''
+                    INSERT INTO content_blobs (hash, codec, size, stored_size, data, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (output_hash, codec, len(html), len(data), data, created_at))
+        batch.append((project_id, 'A prompt', html if inline else None, output_hash, 1.2, True, 'full',
+                      200, 300, created_at))
+        if len(batch) == 10000:
+            insert_history(conn, batch)
+            batch = []
+    insert_history(conn, batch)
+    conn.commit()
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    return conn
+
+def insert_history(conn, rows):
+    conn.executemany('''
+        INSERT INTO generation_history
+        (project_id, prompt, generated_output, output_hash, generation_time, success, mode,
+         prompt_tokens, completion_tokens, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+
+def main():
+    # Before: every row carries its HTML and listing a project's history scans the table
+    app = make_app(GENERATION_CACHE_ENABLED='false')
+    conn = build(app, inline=True)
+    print(f'inline outputs   database {os.path.getsize(app.config["DATABASE_PATH"]) / 1e6:8.1f} MB')
+    first_page = lambda: conn.execute('''
+        SELECT id, prompt, generated_output, generation_time, success, error_message, created_at
+        FROM generation_history WHERE project_id = ? ORDER BY created_at DESC LIMIT 20
+    ''', (PROJECT_ID,)).fetchall()
+    print(f'                 first page of 20 {median_ms(first_page):8.2f} ms')
+    conn.close()
+    
+    # After: hashes in the rows, each distinct output stored once, compressed
+    app = make_app(GENERATION_CACHE_ENABLED='false')
+    client = app.test_client()
+    headers = register(client)
+    conn = build(app, inline=False)
+    blobs, size, stored_size = conn.execute(
+        'SELECT COUNT(*), SUM(size), SUM(stored_size) FROM content_blobs').fetchone()
+    print(f'content_blobs    database {os.path.getsize(app.config["DATABASE_PATH"]) / 1e6:8.1f} MB '
+          f'({blobs} blobs: {size / 1e6:.1f} MB of HTML stored in {stored_size / 1e6:.1f} MB)')
+    
+    url = f'/api/ai/generation-history/{PROJECT_ID}?per_page=20'
+    print(f'                 first page of 20 {median_ms(lambda: client.get(url, headers=headers)):8.2f} ms')
+    cursor = None
+    for _ in range(20):
+        cursor = client.get(url + (f'&cursor={cursor}' if cursor else ''), headers=headers).get_json()['next_cursor']
+    deep = f'{url}&cursor={cursor}'
+    print(f'                 cursor page 21   {median_ms(lambda: client.get(deep, headers=headers)):8.2f} ms')
+    entry_id = client.get(url, headers=headers).get_json()['history'][0]['id']
+    output_url = f'/api/ai/generation-history/{PROJECT_ID}/{entry_id}/output'
+    print(f'                 output fetch     {median_ms(lambda: client.get(output_url, headers=headers)):8.2f} ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Offset vs keyset (cursor) paging through one user's projects, and the count endpoint.
+
+One user owns ``projects`` projects and nine others own a tenth as many
+each. Figures are the median of 20 requests for 50 projects per page.
+
+    python benchmarks/bench_pagination.py [projects]
+"""
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+from common import make_app, register, median_ms
+
+PROJECTS = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+PER_PAGE = 50
+
+def seed(db_path):
+    rng = random.Random(0)
+    start = datetime(2025, 1, 1)
+    rows = []
+    for user_id in range(1, 11):
+        for i in range(PROJECTS if user_id == 1 else PROJECTS // 10):
+            updated_at = start + timedelta(seconds=rng.randint(0, 10 ** 7))
+            rows.append((user_id, f'Project {i}', 'A description', 'business', '', updated_at, updated_at, 'generated'))
+    rng.shuffle(rows)
+    conn = sqlite3.connect(db_path)
+    conn.executemany('''
+        INSERT INTO website_projects
+        (user_id, project_name, description, website_type, requirements, created_at, updated_at, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+    return conn
+
+def main():
+    app = make_app()
+    client = app.test_client()
+    headers = register(client)
+    conn = seed(app.config['DATABASE_PATH'])
+    pages = PROJECTS // PER_PAGE
+    depths = [depth for depth in (1, pages // 2, pages) if depth >= 1]
+    
+    for page in depths:
+        url = f'/api/projects/?per_page={PER_PAGE}&page={page}'
+        print(f'offset page {page:5d}   {median_ms(lambda: client.get(url, headers=headers)):7.2f} ms')
+    
+    # Walk the cursors once to find the tokens for deep pages
+    cursors = {1: None}
+    cursor, page = None, 1
+    while page < depths[-1]:
+        query = f'&cursor={cursor}' if cursor else ''
+        cursor = client.get(f'/api/projects/?per_page={PER_PAGE}{query}', headers=headers).get_json()['next_cursor']
+        page += 1
+        cursors[page] = cursor
+    for page in depths:
+        query = f'&cursor={cursors[page]}' if cursors[page] else ''
+        url = f'/api/projects/?per_page={PER_PAGE}{query}'
+        print(f'cursor page {page:5d}   {median_ms(lambda: client.get(url, headers=headers)):7.2f} ms')
+    
+    print(f'count endpoint      {median_ms(lambda: client.get("/api/projects/count", headers=headers)):7.2f} ms')
+    count = lambda: conn.execute('SELECT COUNT(*) FROM website_projects WHERE user_id = 1').fetchone()
+    print(f'COUNT(*) query      {median_ms(count):7.2f} ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Project listing with every field vs a ?fields= projection, and building full models.
+
+The listing is read page by page (100 per page, following next_cursor)
+until every project has been returned; peak allocation is per page.
+
+    python benchmarks/bench_project_fields.py [projects]
+"""
+import sqlite3
+import sys
+import tracemalloc
+from datetime import datetime, timedelta
+
+from common import make_app, register, timings
+
+PROJECTS = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+def main():
+    app = make_app()
+    client = app.test_client()
+    headers = register(client)
+    
+    conn = sqlite3.connect(app.config['DATABASE_PATH'])
+    start = datetime(2025, 1, 1)
+    conn.executemany('''
+        INSERT INTO website_projects
+        (user_id, project_name, description, website_type, requirements, created_at, updated_at, status)
+        VALUES (1, ?, 'A description of the site', 'business', 'Some requirements text', ?, ?, 'draft')
+    ''', [(f'Project {i}', start + timedelta(seconds=i), start + timedelta(seconds=i)) for i in range(PROJECTS)])
+    conn.commit()
+    
+    for label, query in (('all fields', ''), ('?fields=id,project_name,status', '&fields=id,project_name,status')):
+        def list_all():
+            cursor, body = None, 0
+            while True:
+                url = f'/api/projects/?per_page=100{query}' + (f'&cursor={cursor}' if cursor else '')
+                response = client.get(url, headers=headers)
+                body += len(response.data)
+                cursor = response.get_json()['next_cursor']
+                if not cursor:
+                    return body
+        
+        body = list_all()
+        p50 = timings(list_all, runs=7)[3]
+        tracemalloc.start()
+        client.get(f'/api/projects/?per_page=100{query}', headers=headers)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f'{label:32s} p50 {p50:7.1f} ms  peak allocation {peak / 1e6:5.2f} MB  '
+              f'body {body / 1e6:.2f} MB')
+    
+    from app.models.project import WebsiteProject
+    with app.app_context():
+        WebsiteProject.find_by_user(1, limit=PROJECTS)
+        tracemalloc.start()
+        projects = WebsiteProject.find_by_user(1, limit=PROJECTS)
+        retained, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        p50 = timings(lambda: WebsiteProject.find_by_user(1, limit=PROJECTS), runs=7)[3]
+        print(f'find_by_user, {len(projects)} models      p50 {p50:7.1f} ms  retained {retained / 1e6:.2f} MB')
+
+if __name__ == '__main__':
+    main()
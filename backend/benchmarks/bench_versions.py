@@ -0,0 +1,74 @@
+"""Storage and rebuild cost of project versions vs a compressed blob per version.
+
+Records 50 successive edits of a ~55 KB page: 1-3 changed lines per edit
+and a 40-line section rewrite every 10th edit.
+
+    python benchmarks/bench_versions.py [snapshot interval]
+"""
+import random
+import sys
+import time
+
+from common import make_app
+
+INTERVAL = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+VERSIONS = 50
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore '
+         'magna aliqua enim minim veniam quis nostrud business modern premium quality service team design').split()
+
+def synthetic_page(rng, sections=10, filler=5000):
+    """A generated-looking page: shared CSS, then sections of cards"""
+    sentence = lambda words: ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+    css = '\n'.join(f'#s{i} .card {{\n  padding: {rng.randint(1, 40)}px;\n  color: #{rng.randint(0, 0xffffff):06x};\n}}'
+                    for i in range(sections * 6))
+    body = []
+    for i in range(sections):
+        cards = []
+        while sum(map(len, cards)) < filler:
+            cards.append(f'<div class="card">\n  <h3>{sentence(3)}</h3>\n  <p>{sentence(rng.randint(12, 30))}</p>\n</div>')
+        body.append(f'<section id="s{i}">\n<h2>Section {i}</h2>\n' + '\n'.join(cards) + '\n</section>')
+    return f'<!DOCTYPE html>\n<html>\n<head>\n<style>\n{css}\n</style>\n</head>\n<body>\n' + '\n'.join(body) + \
+        '\n</body>\n</html>'
+
+def edits(rng):
+    texts = [synthetic_page(rng)]
+    for i in range(VERSIONS - 1):
+        lines = texts[-1].split('\n')
+        for _ in range(rng.randint(1, 3)):
+            k = rng.randrange(len(lines))
+            lines[k] += f' <span>edit {i}</span>'
+        if i % 10 == 9:
+            k = rng.randrange(len(lines) - 60)
+            lines[k:k + 40] = [f'<p>rewritten {i} {j}</p>' for j in range(30)]
+        texts.append('\n'.join(lines))
+    return texts
+
+def main():
+    app = make_app(VERSION_SNAPSHOT_INTERVAL=INTERVAL)
+    texts = edits(random.Random(3))
+    
+    from app.models.content_blob import ContentBlob
+    from app.models.project_version import ProjectVersion
+    with app.app_context():
+        blobs = sum(len(ContentBlob.compress(text)[1]) for text in texts)
+        
+        start = time.perf_counter()
+        for text in texts:
+            ProjectVersion.record(1, text, commit=False)
+        record = (time.perf_counter() - start) / VERSIONS * 1000
+        storage = ProjectVersion.storage(1)
+        
+        # The version furthest from its snapshot needs the most deltas applied
+        worst = max(range(1, VERSIONS + 1), key=lambda version: (version - 1) % INTERVAL)
+        start = time.perf_counter()
+        for _ in range(20):
+            assert ProjectVersion.get_text(1, worst) == texts[worst - 1]
+        rebuild = (time.perf_counter() - start) / 20 * 1000
+    
+    print(f'{VERSIONS} versions of a {len(texts[0]) // 1024} KB page, {sum(map(len, texts)) // 1024} KB uncompressed')
+    print(f'compressed blob per version        {blobs // 1024:6d} KB')
+    print(f'version store, interval {INTERVAL:3d}        {storage["stored_size"] // 1024:6d} KB '
+          f'({storage["snapshots"]} snapshots), record {record:.1f} ms, rebuild <= {rebuild:.1f} ms')
+
+if __name__ == '__main__':
+    main()
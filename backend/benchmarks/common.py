@@ -0,0 +1,42 @@
+"""Shared setup for the benchmark scripts.
+
+Each benchmark builds its own throwaway database in a temporary directory
+and talks to the app through the Flask test client; no AI calls are made.
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def make_app(**env):
+    """Create the app on a fresh temporary database"""
+    os.environ['OPENROUTER_API_KEY'] = os.environ.get('OPENROUTER_API_KEY', 'benchmark')
+    os.environ['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'benchmark-jwt-secret-key-of-32-bytes')
+    os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+    for name, value in env.items():
+        os.environ[name] = str(value)
+    
+    from app import create_app
+    return create_app()
+
+def register(client, username='bench'):
+    """Register a user and return their Authorization header"""
+    response = client.post('/api/auth/register', json={
+        'username': username, 'email': f'{username}@example.com',
+        'password': 'secret123', 'full_name': username
+    })
+    return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+
+def timings(fn, runs=20):
+    """Run fn repeatedly; returns the sorted durations in milliseconds"""
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        durations.append((time.perf_counter() - start) * 1000)
+    return sorted(durations)
+
+def median_ms(fn, runs=20):
+    return timings(fn, runs)[runs // 2]
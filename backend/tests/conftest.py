@@ -0,0 +1,170 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.services import openrouter_client
+from app.services.job_queue import get_job_queue
+from app.services.history_writer import get_history_writer
+
+class StubOpenRouter:
+    """Local stand-in for the OpenRouter chat completions endpoint.
+
+    Answers every request with a small page quoting the end of the last
+    message, as JSON or, for ``stream`` requests, as Server-Sent Events.
+    Replies queued with ``reply()`` are used first, in order, to script
+    errors, slow answers and cut-off completions. While ``gate`` is
+    cleared, requests wait for it, so tests can hold calls open and look at
+    what is running.
+    """
+    
+    def __init__(self):
+        self.requests = []
+        self.replies = deque()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.gate = threading.Event()
+        self.gate.set()
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.url = f'http://127.0.0.1:{self.server.server_port}/api/v1/chat/completions'
+    
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    
+    def stop(self):
+        self.gate.set()
+        self.server.shutdown()
+        self.server.server_close()
+    
+    def reply(self, content=None, status=200, finish_reason='stop', headers=None, delay=0, chunk_size=16):
+        """Queue the answer to a coming request (``content`` None quotes the prompt)"""
+        self.replies.append({'content': content, 'status': status, 'finish_reason': finish_reason,
+                             'headers': headers or {}, 'delay': delay, 'chunk_size': chunk_size})
+    
+    def _next_reply(self, payload):
+        with self._lock:
+            reply = self.replies.popleft() if self.replies else {}
+        reply = {'content': None, 'status': 200, 'finish_reason': 'stop', 'headers': {}, 'delay': 0,
+                 'chunk_size': 16, **reply}
+        if reply['content'] is None:
+            prompt = payload['messages'][-1]['content']
+            reply['content'] = f'<!DOCTYPE html><html><body><h1>{prompt[-60:]}</h1></body></html>'
+        return reply
+    
+    def _handler(self):
+        stub = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            
+            def log_message(self, *args):
+                pass
+            
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                with stub._lock:
+                    stub.requests.append(payload)
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                try:
+                    stub.gate.wait(10)
+                    reply = stub._next_reply(payload)
+                    time.sleep(reply['delay'])
+                    usage = {'prompt_tokens': 10, 'completion_tokens': 10}
+                    content_type = 'application/json'
+                    if reply['status'] != 200:
+                        body = json.dumps({'error': {'code': reply['status'], 'message': reply['content']}})
+                    elif payload.get('stream'):
+                        content_type = 'text/event-stream'
+                        text, size = reply['content'], reply['chunk_size']
+                        events = [{'choices': [{'delta': {'content': text[i:i + size]}, 'finish_reason': None}]}
+                                  for i in range(0, len(text), size)]
+                        events.append({'choices': [{'delta': {}, 'finish_reason': reply['finish_reason']}],
+                                       'usage': usage})
+                        body = ': keep-alive\n\n' + ''.join(f'data: {json.dumps(event)}\n\n' for event in events)
+                        body += 'data: [DONE]\n\n'
+                    else:
+                        body = json.dumps({
+                            'model': payload['model'],
+                            'choices': [{'message': {'role': 'assistant', 'content': reply['content']},
+                                         'finish_reason': reply['finish_reason']}],
+                            'usage': usage
+                        })
+                    body = body.encode('utf-8')
+                finally:
+                    with stub._lock:
+                        stub.in_flight -= 1
+                self.send_response(reply['status'])
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in reply['headers'].items():
+                    self.send_header(name, str(value))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+        
+        return Handler
+
+@pytest.fixture
+def openrouter():
+    stub = StubOpenRouter()
+    stub.start()
+    yield stub
+    stub.stop()
+
+@pytest.fixture
+def make_app(openrouter, tmp_path, monkeypatch):
+    """Create apps on one temporary database that talk to the stub"""
+    monkeypatch.setenv('OPENROUTER_API_KEY', 'test-key')
+    monkeypatch.setenv('OPENROUTER_BASE_URL', openrouter.url)
+    monkeypatch.setenv('DATABASE_PATH', str(tmp_path / 'sitecraft.db'))
+    monkeypatch.setenv('GENERATION_CACHE_ENABLED', 'false')
+    # The OpenRouter client is shared by the process; build it from this test's settings
+    monkeypatch.setattr(openrouter_client, '_client', None)
+    apps = []
+    
+    def make(**env):
+        for name, value in env.items():
+            monkeypatch.setenv(name, str(value))
+        app = create_app()
+        apps.append(app)
+        return app
+    
+    yield make
+    for app in apps:
+        with app.app_context():
+            get_job_queue().stop(timeout=5)
+            get_history_writer().stop(timeout=5)
+
+def register(client, username):
+    """Register a user and return their Authorization header"""
+    response = client.post('/api/auth/register', json={
+        'username': username, 'email': f'{username}@example.com',
+        'password': 'secret123', 'full_name': username
+    })
+    return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+
+def create_project(client, headers, name='Site'):
+    response = client.post('/api/projects/', json={'project_name': name, 'website_type': 'business'},
+                           headers=headers)
+    return response.get_json()['project']['id']
+
+def wait_for(condition, timeout=10):
+    """Poll until condition() is true"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
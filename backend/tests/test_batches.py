@@ -0,0 +1,91 @@
+from conftest import register, create_project, wait_for
+
+def submit(client, headers, items, **options):
+    return client.post('/api/ai/generate-batch', json={'items': items, 'use_cache': False, **options},
+                       headers=headers)
+
+def batch_status(client, headers, batch_id):
+    return client.get(f'/api/ai/batches/{batch_id}', headers=headers)
+
+def test_items_are_checked_one_by_one(make_app):
+    client = make_app().test_client()
+    alice = register(client, 'alice')
+    bob = register(client, 'bob')
+    mine = create_project(client, alice, 'Bakery')
+    other = create_project(client, alice, 'Florist')
+    theirs = create_project(client, bob, 'Garage')
+    
+    response = submit(client, alice, [
+        {'project_id': mine, 'prompt': 'A bakery'},
+        {'project_id': theirs, 'prompt': 'A garage'},
+        {'project_id': mine, 'prompt': 'Another bakery'},
+        {'project_id': other, 'prompt': '   '},
+        {'project_id': str(other), 'prompt': 'A florist'},
+        {'project_id': True, 'prompt': 'A florist'},
+        'junk'
+    ])
+    assert response.status_code == 202
+    results = response.get_json()['results']
+    assert results[0]['status'] == 'queued' and results[0]['job_id']
+    assert [result.get('error') for result in results[1:]] == [
+        'Project not found',
+        'Project appears more than once in the batch',
+        'Website description/prompt is required',
+        'Project not found',
+        'Project not found',
+        'Website description/prompt is required'
+    ]
+    
+    batch = batch_status(client, alice, response.get_json()['batch_id']).get_json()
+    assert batch['batch']['total'] == 1
+    assert batch['jobs'][0]['project_id'] == mine
+
+def test_batches_without_valid_items_or_over_the_limit_are_rejected(make_app, openrouter):
+    client = make_app(GENERATION_BATCH_MAX_ITEMS=2).test_client()
+    alice = register(client, 'alice')
+    bob = register(client, 'bob')
+    theirs = create_project(client, bob)
+    
+    assert submit(client, alice, []).status_code == 400
+    assert submit(client, alice, {'project_id': theirs}).status_code == 400
+    assert submit(client, alice, [{'project_id': theirs, 'prompt': 'A garage'}] * 3).status_code == 400
+    
+    response = submit(client, alice, [{'project_id': theirs, 'prompt': 'A garage'}])
+    assert response.status_code == 400
+    assert response.get_json()['results'][0]['error'] == 'Project not found'
+    assert openrouter.requests == []
+
+def test_batch_status_tracks_every_job(make_app, openrouter):
+    client = make_app(GENERATION_JOBS_PER_USER=1, OPENROUTER_MAX_RETRIES=0).test_client()
+    headers = register(client, 'alice')
+    projects = [create_project(client, headers, f'Site {index}') for index in range(3)]
+    
+    openrouter.gate.clear()
+    # One of the three generations fails upstream
+    openrouter.reply('bad request', status=400)
+    response = submit(client, headers, [{'project_id': pid, 'prompt': f'Site {pid}'} for pid in projects])
+    batch_id = response.get_json()['batch_id']
+    
+    assert wait_for(lambda: batch_status(client, headers, batch_id).get_json()['batch']['counts']['running'] == 1)
+    status = batch_status(client, headers, batch_id).get_json()
+    assert status['batch']['counts'] == {'queued': 2, 'running': 1, 'completed': 0, 'failed': 0}
+    assert not status['batch']['done']
+    assert [job['project_id'] for job in status['jobs']] == projects
+    
+    openrouter.gate.set()
+    assert wait_for(lambda: batch_status(client, headers, batch_id).get_json()['batch']['done'])
+    status = batch_status(client, headers, batch_id).get_json()
+    assert status['batch']['counts'] == {'queued': 0, 'running': 0, 'completed': 2, 'failed': 1}
+    assert openrouter.max_in_flight == 1
+    failed = [job for job in status['jobs'] if job['status'] == 'failed']
+    assert '400' in failed[0]['error_message']
+
+def test_batches_of_other_users_are_hidden(make_app):
+    client = make_app().test_client()
+    alice = register(client, 'alice')
+    response = submit(client, alice, [{'project_id': create_project(client, alice), 'prompt': 'A bakery'}])
+    batch_id = response.get_json()['batch_id']
+    
+    assert batch_status(client, alice, batch_id).status_code == 200
+    assert batch_status(client, register(client, 'bob'), batch_id).status_code == 404
+    assert batch_status(client, alice, 'no-such-batch').status_code == 404
@@ -0,0 +1,34 @@
+from conftest import register
+
+def test_bulk_create_reports_invalid_items_individually(make_app):
+    client = make_app().test_client()
+    headers = register(client, 'alice')
+    
+    response = client.post('/api/projects/bulk', json={'projects': [
+        {'project_name': 'Bakery', 'description': 'Fresh bread'},
+        {'project_name': 123},
+        {'project_name': 'Florist', 'description': None},
+        {'project_name': 'Gym', 'requirements': ['pool']},
+        {'project_name': 'Cafe', 'website_type': 7},
+        {'project_name': '   '},
+        'not an object',
+        {'project_name': ' Library ', 'website_type': 'portfolio'}
+    ]}, headers=headers)
+    
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert [result['index'] for result in results] == list(range(8))
+    created = {result['index']: result['project'] for result in results if 'project' in result}
+    assert sorted(created) == [0, 7]
+    assert created[7]['project_name'] == 'Library'
+    assert all('error' in result for result in results if result['index'] not in created)
+    assert response.get_json()['message'] == 'Created 2 of 8 projects'
+    
+    listed = client.get('/api/projects/?fields=project_name', headers=headers).get_json()['projects']
+    assert sorted(project['project_name'] for project in listed) == ['Bakery', 'Library']
+
+def test_single_create_rejects_non_string_fields(make_app):
+    client = make_app().test_client()
+    headers = register(client, 'alice')
+    response = client.post('/api/projects/', json={'project_name': 'x', 'description': None}, headers=headers)
+    assert response.status_code == 400
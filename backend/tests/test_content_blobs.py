@@ -0,0 +1,50 @@
+import threading
+
+from app.db import get_db
+from app.models.content_blob import ContentBlob
+from app.models.project import WebsiteProject
+from conftest import register, create_project
+
+PAGE = '<html><body>Same cached page</body></html>'
+
+def test_put_holds_the_blob_until_the_reference_is_committed(make_app):
+    app = make_app()
+    client = app.test_client()
+    headers = register(client, 'alice')
+    first_id, second_id = create_project(client, headers, 'First'), create_project(client, headers, 'Second')
+    with app.app_context():
+        first = WebsiteProject.find_by_id(first_id, 1)
+        first.generated_code = PAGE
+        first.save()
+    
+    # Another request replaces the first project's page, releasing the blob
+    def replace_first():
+        with app.app_context():
+            project = WebsiteProject.find_by_id(first_id, 1)
+            project.generated_code = '<html><body>New page</body></html>'
+            project.save()
+    
+    with app.app_context():
+        conn = get_db()
+        blob_hash = ContentBlob.put(PAGE, commit=False)
+        replacer = threading.Thread(target=replace_first)
+        replacer.start()
+        replacer.join(0.3)
+        # The release waits for the claim instead of deleting the blob under us
+        assert replacer.is_alive()
+        conn.execute('UPDATE website_projects SET code_hash = ? WHERE id = ?', (blob_hash, second_id))
+        conn.commit()
+        replacer.join(5)
+        
+        assert ContentBlob.get(blob_hash) == PAGE
+        assert WebsiteProject.find_by_id(second_id, 1).generated_code == PAGE
+
+def test_released_blobs_are_stored_again(make_app):
+    app = make_app()
+    with app.app_context():
+        blob_hash = ContentBlob.put(PAGE)
+        ContentBlob.release(blob_hash)
+        assert ContentBlob.get(blob_hash) is None
+        
+        assert ContentBlob.put_many([PAGE, PAGE]) == [blob_hash, blob_hash]
+        assert ContentBlob.get(blob_hash) == PAGE
@@ -0,0 +1,84 @@
+import json
+
+from conftest import register, create_project
+
+PARTS = [
+    '<!DOCTYPE html><html><head><title>Bakery</title></head><body>'
+    '<section id="menu"><h2>Our bread</h2><p>Sourdough',
+    '```html\n<h2>Our bread</h2><p>Sourdough and rye</p></section>',
+    '</section><footer>Lisbon</footer></body></html>'
+]
+FIRST_TWO = PARTS[0] + ' and rye</p></section>'
+WHOLE = FIRST_TWO + '<footer>Lisbon</footer></body></html>'
+
+def script_cut_off_page(openrouter, chunk_size=16):
+    openrouter.reply(PARTS[0], finish_reason='length', chunk_size=chunk_size)
+    openrouter.reply(PARTS[1], finish_reason='length', chunk_size=chunk_size)
+    openrouter.reply(PARTS[2], chunk_size=chunk_size)
+
+def latest_history(client, headers, project_id):
+    return client.get(f'/api/ai/generation-history/{project_id}', headers=headers).get_json()['history'][0]
+
+def generate(client, headers, project_id):
+    response = client.post('/api/ai/generate-website', json={
+        'project_id': project_id, 'prompt': 'A bakery', 'use_cache': False
+    }, headers=headers)
+    assert response.status_code == 200
+    return response.get_json()['project']['generated_code']
+
+def stream(client, headers, project_id):
+    response = client.post('/api/ai/generate-website/stream', json={
+        'project_id': project_id, 'prompt': 'A bakery'
+    }, headers=headers)
+    events = [event.split('\n', 1) for event in response.get_data(as_text=True).split('\n\n') if event]
+    assert events[-1][0] == 'event: done'
+    return ''.join(json.loads(data[len('data: '):])['content'] for name, data in events if name == 'event: chunk')
+
+def test_cut_off_page_is_continued_and_stitched_without_repeats(make_app, openrouter):
+    client = make_app(HTML_PIPELINE='strip_fences').test_client()
+    headers = register(client, 'alice')
+    project_id = create_project(client, headers)
+    script_cut_off_page(openrouter)
+    
+    assert generate(client, headers, project_id) == WHOLE
+    assert len(openrouter.requests) == 3
+    # Continuations are sent the end of the document so far
+    assert openrouter.requests[1]['messages'][-2] == {'role': 'assistant', 'content': PARTS[0]}
+    
+    entry = latest_history(client, headers, project_id)
+    assert entry['continuations'] == 2
+    assert entry['continuation_time'] is not None
+
+def test_continuations_stop_at_max_continuations(make_app, openrouter, caplog):
+    client = make_app(HTML_PIPELINE='strip_fences', MAX_CONTINUATIONS=1).test_client()
+    headers = register(client, 'alice')
+    project_id = create_project(client, headers)
+    script_cut_off_page(openrouter)
+    
+    assert generate(client, headers, project_id) == FIRST_TWO
+    assert len(openrouter.requests) == 2
+    assert latest_history(client, headers, project_id)['continuations'] == 1
+    assert 'Output for generate still cut off after 1 continuation(s)' in caplog.text
+
+def test_no_continuations_when_disabled(make_app, openrouter):
+    client = make_app(HTML_PIPELINE='strip_fences', MAX_CONTINUATIONS=0).test_client()
+    headers = register(client, 'alice')
+    project_id = create_project(client, headers)
+    script_cut_off_page(openrouter)
+    
+    assert generate(client, headers, project_id) == PARTS[0]
+    assert len(openrouter.requests) == 1
+    assert latest_history(client, headers, project_id)['continuations'] == 0
+
+def test_streamed_continuations_hold_back_the_overlap(make_app, openrouter):
+    client = make_app(HTML_PIPELINE='strip_fences').test_client()
+    headers = register(client, 'alice')
+    project_id = create_project(client, headers)
+    # Small chunks so the repeated text arrives over several deltas
+    script_cut_off_page(openrouter, chunk_size=3)
+    
+    assert stream(client, headers, project_id) == WHOLE
+    assert len(openrouter.requests) == 3
+    assert latest_history(client, headers, project_id)['continuations'] == 2
+    project = client.get(f'/api/projects/{project_id}', headers=headers).get_json()['project']
+    assert project['generated_code'] == WHOLE
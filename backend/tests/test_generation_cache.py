@@ -0,0 +1,41 @@
+import sqlite3
+
+from app.db import get_db
+from app.services.generation_cache import GenerationCache, TOUCH_BATCH_SIZE
+
+def test_lookups_leave_the_request_transaction_alone(make_app):
+    app = make_app()
+    with app.app_context():
+        cache = GenerationCache(app.config['DATABASE_PATH'], max_memory_entries=0)
+        cache.set('key', 'cached page')
+        
+        conn = get_db()
+        conn.execute("INSERT INTO users (username, email, password_hash) VALUES ('pending', 'p@example.com', 'x')")
+        assert cache.get('key') == 'cached page'
+        
+        other = sqlite3.connect(app.config['DATABASE_PATH'])
+        assert other.execute("SELECT COUNT(*) FROM users WHERE username = 'pending'").fetchone()[0] == 0
+        other.close()
+        conn.rollback()
+
+def test_disk_hits_write_last_access_in_batches(make_app):
+    app = make_app()
+    with app.app_context():
+        cache = GenerationCache(app.config['DATABASE_PATH'], max_memory_entries=0)
+        keys = [f'key-{i}' for i in range(TOUCH_BATCH_SIZE)]
+        for key in keys:
+            cache.set(key, 'cached page')
+        other = sqlite3.connect(app.config['DATABASE_PATH'])
+        
+        def last_access():
+            return dict(other.execute('SELECT cache_key, last_access FROM generation_cache'))
+        
+        stored = last_access()
+        for key in keys[:-1]:
+            assert cache.get(key) == 'cached page'
+        assert last_access() == stored
+        
+        cache.get(keys[-1])
+        touched = last_access()
+        assert all(touched[key] > stored[key] for key in keys)
+        other.close()
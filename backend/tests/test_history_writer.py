@@ -0,0 +1,56 @@
+import sqlite3
+from datetime import datetime
+
+from app.db import get_db
+from app.services.history_writer import HistoryWriter
+from conftest import register, create_project
+
+def record(project_id, output):
+    return {'project_id': project_id, 'prompt': 'A bakery', 'generated_output': output,
+            'generation_time': 1.0, 'success': True, 'created_at': datetime.now()}
+
+def history_count(app):
+    other = sqlite3.connect(app.config['DATABASE_PATH'])
+    count = other.execute('SELECT COUNT(*) FROM generation_history').fetchone()[0]
+    other.close()
+    return count
+
+def test_queue_full_fallback_writes_outside_the_request_transaction(make_app):
+    app = make_app()
+    client = app.test_client()
+    project_id = create_project(client, register(client, 'alice'))
+    # A writer that is never started and has no room writes every record itself
+    writer = HistoryWriter(app, max_queue_size=0, enqueue_timeout=0)
+    
+    with app.app_context():
+        conn = get_db()
+        conn.execute('BEGIN')
+        conn.execute('SELECT COUNT(*) FROM users').fetchone()
+        writer.submit(record(project_id, '<html>bakery</html>'))
+        
+        assert conn.in_transaction
+        assert history_count(app) == 1
+        assert writer.stats()['sync_writes'] == 1
+        
+        # A failed write rolls back its own transaction, not the request's
+        writer.submit(record(project_id, b'not text'))
+        assert conn.in_transaction
+        assert history_count(app) == 1
+        assert writer.stats()['failed'] == 1
+        conn.rollback()
+
+def test_queued_records_are_written_in_batches(make_app):
+    app = make_app()
+    client = app.test_client()
+    project_id = create_project(client, register(client, 'alice'))
+    writer = HistoryWriter(app, batch_size=10, flush_interval=5)
+    writer.start()
+    
+    for i in range(25):
+        writer.submit(record(project_id, f'<html>page {i % 5}</html>'))
+    assert writer.flush(5)
+    writer.stop(5)
+    
+    assert history_count(app) == 25
+    stats = writer.stats()
+    assert (stats['written'], stats['batches'], stats['sync_writes']) == (25, 3, 0)
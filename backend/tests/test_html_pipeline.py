@@ -0,0 +1,152 @@
+import random
+
+import pytest
+
+from app.services.html_pipeline import (HTMLPostProcessor, Stage, STAGES, register_stage, minify_css,
+                                        minify_js, strip_code_fences)
+
+ALL_STAGES = ['strip_fences', 'balance_tags', 'minify_inline', 'dedupe_styles']
+
+PAGES = {
+    'fenced': '''```html
+<!DOCTYPE html>
+<html>
+<head>
+    <style>
+        /* Theme */
+        :root { --brand: #c60; }
+        a :hover { color : var(--brand) ; }
+        @media (max-width: 600px) { .menu   li { display: block; } }
+        @font-face { font-family: "Bake Sans"; src: url("bake.woff2"); }
+    </style>
+    <style>
+        .card { padding: 1rem; }
+    </style>
+</head>
+<body>
+    <nav class="menu"><ul><li><a href="#menu">Menu</a></li></ul></nav>
+    <section id="menu">
+        <style>
+            .card { padding: 1rem; }
+        </style>
+        <p>Fresh <b>bread</b> & coffee</p>
+        <!-- a comment with <tags> inside -->
+        <img src="loaf.png" alt="Loaf">
+    </section>
+    <script>
+        // Toggle the menu
+        const pattern = /<\\/?[a-z]+>/g;   /* not a comment: "//" */
+        const label = "a // b";
+        let total = 4 / 2 / 1;
+        document.querySelector('.menu').addEventListener('click', () => {
+            console.log(`menu ${total} </div>`);
+        });
+    </script>
+    <script type="application/ld+json">
+        {"@type":   "Bakery"}
+    </script>
+</body>
+</html>
+```''',
+    'cut_off': '''<!DOCTYPE html><html><head><style>.a{color:red}</style></head>
+<body><div class="wrap"><section><p>Stray</span> end tag</p>
+<ul><li>One<li>Two</ul><div><p>Unfinished <a href="#x" title="tail''',
+    'unterminated_script': '<html><body><p>Hi</p><script>const x = "</p>";\nlet y = x < 2;',
+}
+
+def pipeline(stages=ALL_STAGES):
+    return HTMLPostProcessor(stages).pipeline()
+
+def run_chunked(text, sizes, stages=ALL_STAGES):
+    """Feed text in chunks of the given sizes (cycled), then finish"""
+    run = pipeline(stages)
+    out = []
+    position = index = 0
+    while position < len(text):
+        size = sizes[index % len(sizes)]
+        out.append(run.feed(text[position:position + size]))
+        position += size
+        index += 1
+    out.append(run.finish())
+    return ''.join(out)
+
+@pytest.mark.parametrize('name', sorted(PAGES))
+@pytest.mark.parametrize('sizes', [[1], [2], [3], [7], [16], [64], [5, 1, 13, 2]])
+def test_chunked_input_gives_the_same_page_as_whole_input(name, sizes):
+    text = PAGES[name]
+    assert run_chunked(text, sizes) == pipeline().process(text)
+
+@pytest.mark.parametrize('name', sorted(PAGES))
+@pytest.mark.parametrize('stage', ALL_STAGES)
+def test_each_stage_is_chunking_independent_on_its_own(name, stage):
+    text = PAGES[name]
+    rng = random.Random(name + stage)
+    for _ in range(20):
+        sizes = [rng.randint(1, 40) for _ in range(8)]
+        assert run_chunked(text, sizes, [stage]) == pipeline([stage]).process(text), sizes
+
+def test_full_pipeline_cleans_a_fenced_page():
+    page = pipeline().process(PAGES['fenced'])
+    assert page.startswith('<!DOCTYPE html>') and page.endswith('</html>')
+    assert ':root{--brand:#c60}' in page
+    # A space before ':' in a selector is significant; in declarations it isn't
+    assert 'a :hover{color:var(--brand)}' in page
+    assert '@media (max-width:600px){.menu li{display:block}}' in page
+    assert '@font-face{font-family:"Bake Sans";src:url("bake.woff2")}' in page
+    # The repeated style block is dropped
+    assert page.count('.card{padding:1rem}') == 1
+    assert '<!-- a comment with <tags> inside -->' in page
+    assert 'const pattern = /<\\/?[a-z]+>/g;' in page
+    assert 'const label = "a // b";' in page
+    assert 'let total = 4 / 2 / 1;' in page
+    assert '`menu ${total} </div>`' in page
+    assert 'Toggle the menu' not in page
+    assert '{"@type":   "Bakery"}' in page
+
+def test_cut_off_pages_are_closed_and_stray_end_tags_dropped():
+    page = pipeline(['balance_tags']).process(PAGES['cut_off'])
+    assert '</span>' not in page
+    assert '<a href' not in page
+    assert page.endswith('<p>Unfinished </p></div></section></div></body></html>')
+
+def test_unterminated_scripts_are_passed_through():
+    page = pipeline(['minify_inline']).process(PAGES['unterminated_script'])
+    assert page == PAGES['unterminated_script']
+
+def test_fence_helpers_agree():
+    assert strip_code_fences('```html\n<p>x</p>\n```') == '<p>x</p>'
+    assert pipeline(['strip_fences']).process('```\n<p>x</p>\n```  ') == '<p>x</p>'
+    assert pipeline(['strip_fences']).process('<p>`code`</p>') == '<p>`code`</p>'
+
+def test_minifiers_keep_strings_intact():
+    assert minify_css('a { content: "  {  } ; " ; }') == 'a{content:"  {  } ; "}'
+    assert minify_js('x = "a  /* b */"  // c\n\n\ny = 1') == 'x = "a  /* b */"\ny = 1'
+
+def test_finished_pipelines_are_counted_and_logged(caplog):
+    caplog.set_level('INFO', logger='app.services.html_pipeline')
+    processor = HTMLPostProcessor(['strip_fences'])
+    run = processor.pipeline()
+    run.feed('```html\n<p>x</p>\n```')
+    run.finish()
+    report = processor.record(run)
+    assert (report['size_in'], report['size_out']) == (20, 8)
+    assert processor.stats()['pages'] == 1
+    assert 'Post-processed page: 20 -> 8 bytes (60.0% smaller); strip_fences' in caplog.text
+
+def test_stages_are_looked_up_by_name():
+    with pytest.raises(ValueError):
+        HTMLPostProcessor(['strip_fences', 'no_such_stage'])
+    
+    @register_stage
+    class Shout(Stage):
+        name = 'shout'
+        
+        def feed(self, chunk):
+            return chunk.upper()
+    
+    try:
+        processor = HTMLPostProcessor(['strip_fences', 'shout'])
+        assert processor.process('```html\n<p>hi</p>\n```') == '<P>HI</P>'
+        assert processor.stats()['pages'] == 1
+    finally:
+        del STAGES['shout']
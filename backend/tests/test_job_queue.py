@@ -0,0 +1,139 @@
+import sqlite3
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from app.services.job_queue import get_job_queue
+from conftest import register, create_project, wait_for
+
+def job_status(client, headers, job_id):
+    return client.get(f'/api/ai/jobs/{job_id}', headers=headers).get_json()['job']['status']
+
+def enqueue(client, headers, project_id, prompt):
+    response = client.post('/api/ai/generate-website', json={
+        'project_id': project_id, 'prompt': prompt, 'async': True, 'use_cache': False
+    }, headers=headers)
+    assert response.status_code == 202
+    return response.get_json()['job_id']
+
+def test_job_runs_from_enqueue_to_result(make_app, openrouter):
+    client = make_app().test_client()
+    headers = register(client, 'alice')
+    project_id = create_project(client, headers)
+    
+    openrouter.gate.clear()
+    job_id = enqueue(client, headers, project_id, 'A bakery in Lisbon')
+    assert wait_for(lambda: job_status(client, headers, job_id) == 'running')
+    
+    pending = client.get(f'/api/ai/jobs/{job_id}/result', headers=headers)
+    assert pending.status_code == 202
+    assert pending.get_json()['status'] == 'running'
+    
+    openrouter.gate.set()
+    assert wait_for(lambda: job_status(client, headers, job_id) == 'completed')
+    
+    result = client.get(f'/api/ai/jobs/{job_id}/result', headers=headers)
+    assert result.status_code == 200
+    assert 'A bakery in Lisbon' in result.get_json()['project']['generated_code']
+    assert len(openrouter.requests) == 1
+
+def test_jobs_of_other_users_are_hidden(make_app):
+    client = make_app().test_client()
+    alice = register(client, 'alice')
+    job_id = enqueue(client, alice, create_project(client, alice), 'A florist')
+    
+    bob = register(client, 'bob')
+    assert client.get(f'/api/ai/jobs/{job_id}', headers=bob).status_code == 404
+
+def test_restart_requeues_queued_and_stale_jobs(make_app, tmp_path):
+    app = make_app()
+    client = app.test_client()
+    headers = register(client, 'alice')
+    project_id = create_project(client, headers)
+    with app.app_context():
+        get_job_queue().stop(timeout=5)
+    
+    # Jobs a crashed process left behind: one never started, one stuck running
+    # for an hour, and one another process only just started
+    now = datetime.now()
+    jobs = {'queued': (None, 'queued'), 'stale': (now - timedelta(hours=1), 'running'),
+            'fresh': (now, 'running')}
+    ids = {}
+    conn = sqlite3.connect(str(tmp_path / 'sitecraft.db'))
+    user_id = conn.execute("SELECT id FROM users WHERE username = 'alice'").fetchone()[0]
+    for name, (started_at, status) in jobs.items():
+        ids[name] = uuid.uuid4().hex
+        conn.execute('''
+            INSERT INTO generation_jobs
+            (id, user_id, project_id, kind, prompt, use_cache, status, progress, created_at, started_at)
+            VALUES (?, ?, ?, 'generate', ?, 0, ?, ?, ?, ?)
+        ''', (ids[name], user_id, project_id, f'A {name} site', status, status, now, started_at))
+    conn.commit()
+    conn.close()
+    
+    client = make_app().test_client()
+    assert wait_for(lambda: job_status(client, headers, ids['queued']) == 'completed')
+    assert wait_for(lambda: job_status(client, headers, ids['stale']) == 'completed')
+    assert job_status(client, headers, ids['fresh']) == 'running'
+
+def test_per_user_limit_leaves_room_for_other_users(make_app, openrouter):
+    app = make_app(GENERATION_WORKERS=4, GENERATION_JOBS_PER_USER=1)
+    client = app.test_client()
+    alice = register(client, 'alice')
+    bob = register(client, 'bob')
+    
+    openrouter.gate.clear()
+    alice_jobs = [enqueue(client, alice, create_project(client, alice, f'Site {i}'), f'Alice site {i}')
+                  for i in range(3)]
+    bob_job = enqueue(client, bob, create_project(client, bob), 'Bob site')
+    
+    # One of Alice's jobs and Bob's job run; Alice's others wait despite idle workers
+    assert wait_for(lambda: openrouter.in_flight == 2)
+    assert job_status(client, bob, bob_job) == 'running'
+    statuses = sorted(job_status(client, alice, job_id) for job_id in alice_jobs)
+    assert statuses == ['queued', 'queued', 'running']
+    with app.app_context():
+        assert get_job_queue().stats()['running'] == 2
+    
+    openrouter.gate.set()
+    assert wait_for(lambda: all(job_status(client, alice, job_id) == 'completed' for job_id in alice_jobs))
+    assert job_status(client, bob, bob_job) == 'completed'
+    assert openrouter.max_in_flight == 2
+
+def test_jobs_of_a_dead_process_are_requeued_without_a_restart(make_app, tmp_path):
+    app = make_app(GENERATION_JOB_STALE_SECONDS=1)
+    client = app.test_client()
+    headers = register(client, 'alice')
+    project_id = create_project(client, headers)
+    
+    # A job another process had just started when it died
+    job_id = uuid.uuid4().hex
+    now = datetime.now()
+    conn = sqlite3.connect(str(tmp_path / 'sitecraft.db'))
+    conn.execute('''
+        INSERT INTO generation_jobs
+        (id, user_id, project_id, kind, prompt, use_cache, status, progress, worker_id, heartbeat_at,
+         created_at, started_at)
+        VALUES (?, 1, ?, 'generate', 'An orphaned site', 0, 'running', 'generating', 'gone:0', ?, ?, ?)
+    ''', (job_id, project_id, now, now, now))
+    conn.commit()
+    conn.close()
+    
+    assert job_status(client, headers, job_id) == 'running'
+    assert wait_for(lambda: job_status(client, headers, job_id) == 'completed', timeout=5)
+
+def test_long_running_jobs_of_a_live_process_are_left_alone(make_app, openrouter):
+    app = make_app(GENERATION_JOB_STALE_SECONDS=1)
+    client = app.test_client()
+    headers = register(client, 'alice')
+    
+    openrouter.gate.clear()
+    job_id = enqueue(client, headers, create_project(client, headers), 'A slow site')
+    assert wait_for(lambda: job_status(client, headers, job_id) == 'running')
+    # Several stale periods pass while the job is still running here
+    time.sleep(2.5)
+    assert job_status(client, headers, job_id) == 'running'
+    
+    openrouter.gate.set()
+    assert wait_for(lambda: job_status(client, headers, job_id) == 'completed')
+    assert len(openrouter.requests) == 1
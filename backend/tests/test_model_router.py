@@ -0,0 +1,118 @@
+import time
+
+from app.services.model_router import ModelRouter, parse_routes, get_model_router
+from conftest import register, create_project
+
+def test_routes_are_parsed_per_operation():
+    assert parse_routes('patch=fast/a | slow/b,unknown=x/y,section=,modify=x/z') == {
+        'patch': ['fast/a', 'slow/b'], 'modify': ['x/z']
+    }
+    router = ModelRouter(['x/default'], parse_routes('patch=fast/a|slow/b'))
+    assert router.models_for('patch') == ['fast/a', 'slow/b']
+    assert router.models_for('generate') == ['x/default']
+
+def test_measured_models_are_ordered_by_median_latency():
+    router = ModelRouter(['a', 'b', 'c'], min_samples=3)
+    assert router.candidates('generate') == ['a', 'b', 'c']
+    for _ in range(3):
+        router.record('generate', 'a', 2.0, True)
+        router.record('generate', 'b', 1.0, True)
+    # c has no measurements yet, so it is tried first to get some
+    assert router.candidates('generate') == ['c', 'b', 'a']
+    for _ in range(3):
+        router.record('generate', 'c', 1.5, True)
+    assert router.candidates('generate') == ['b', 'c', 'a']
+    # Operations are tracked separately
+    assert router.candidates('patch') == ['a', 'b', 'c']
+
+def test_consecutive_failures_cool_a_model_down():
+    router = ModelRouter(['a', 'b'], max_consecutive_failures=2, cooldown=0.2)
+    router.record('generate', 'a', 1.0, False)
+    assert router.candidates('generate') == ['a', 'b']
+    # A success resets the run
+    router.record('generate', 'a', 1.0, True)
+    router.record('generate', 'a', 1.0, False)
+    assert router.candidates('generate') == ['a', 'b']
+    
+    router.record('generate', 'a', 1.0, False)
+    assert router.candidates('generate') == ['b', 'a']
+    assert router.stats()['generate']['models']['a']['cooling_down']
+    time.sleep(0.25)
+    assert router.candidates('generate') == ['a', 'b']
+
+def test_a_high_error_rate_cools_a_model_down():
+    router = ModelRouter(['a', 'b'], min_samples=4, max_error_rate=0.5, max_consecutive_failures=10)
+    for ok in (True, False, True):
+        router.record('generate', 'a', 1.0, ok)
+    assert router.candidates('generate') == ['a', 'b']
+    router.record('generate', 'a', 1.0, False)
+    assert router.candidates('generate') == ['b', 'a']
+
+def test_max_consecutive_failures_comes_from_the_config(make_app):
+    app = make_app(AI_ROUTER_MAX_CONSECUTIVE_FAILURES=7)
+    with app.app_context():
+        assert get_model_router().max_consecutive_failures == 7
+
+def generate(client, headers, project_id, prompt='A bakery'):
+    return client.post('/api/ai/generate-website', json={
+        'project_id': project_id, 'prompt': prompt, 'use_cache': False
+    }, headers=headers)
+
+def stream(client, headers, project_id, prompt='A bakery'):
+    response = client.post('/api/ai/generate-website/stream', json={
+        'project_id': project_id, 'prompt': prompt
+    }, headers=headers)
+    return response.get_data(as_text=True)
+
+def router_stats(app):
+    with app.app_context():
+        return get_model_router().stats()['generate']
+
+def failover_app(make_app, **env):
+    return make_app(AI_MODELS='first/model,second/model', OPENROUTER_MAX_RETRIES=0, **env)
+
+def test_server_errors_fail_over_to_the_next_model(make_app, openrouter, caplog):
+    app = failover_app(make_app)
+    client = app.test_client()
+    headers = register(client, 'alice')
+    project_id = create_project(client, headers)
+    openrouter.reply('overloaded', status=503)
+    
+    assert generate(client, headers, project_id).status_code == 200
+    assert [request['model'] for request in openrouter.requests] == ['first/model', 'second/model']
+    stats = router_stats(app)
+    assert stats['failovers'] == 1
+    assert stats['models']['first/model']['error_rate'] == 1.0
+    assert stats['models']['second/model']['calls'] == 1
+    assert 'Model first/model failed for generate, trying second/model' in caplog.text
+
+def test_rate_limited_streams_fail_over_to_the_next_model(make_app, openrouter):
+    app = failover_app(make_app)
+    client = app.test_client()
+    headers = register(client, 'alice')
+    project_id = create_project(client, headers)
+    openrouter.reply('slow down', status=429)
+    
+    assert 'event: done' in stream(client, headers, project_id)
+    assert [request['model'] for request in openrouter.requests] == ['first/model', 'second/model']
+    assert router_stats(app)['failovers'] == 1
+
+def test_refused_requests_are_not_failed_over_or_held_against_the_model(make_app, openrouter):
+    app = failover_app(make_app, AI_ROUTER_MAX_CONSECUTIVE_FAILURES=1)
+    client = app.test_client()
+    headers = register(client, 'alice')
+    project_id = create_project(client, headers)
+    openrouter.reply('bad request', status=400)
+    openrouter.reply('bad request', status=400)
+    
+    response = generate(client, headers, project_id)
+    assert response.status_code == 500
+    assert '400' in response.get_json()['details']
+    assert 'event: error' in stream(client, headers, project_id, 'A florist')
+    assert [request['model'] for request in openrouter.requests] == ['first/model', 'first/model']
+    
+    stats = router_stats(app)
+    assert stats['failovers'] == 0
+    assert stats['models']['first/model']['samples'] == 0
+    assert not stats['models']['first/model']['cooling_down']
+    assert stats['order'] == ['first/model', 'second/model']
@@ -0,0 +1,92 @@
+import socket
+import time
+
+import pytest
+import requests
+
+from app.services import openrouter_client
+from app.services.openrouter_client import OpenRouterClient
+
+def make_client(**options):
+    settings = {'connect_timeout': 1.0, 'read_timeout': 2.0, 'max_retries': 3,
+                'backoff_base': 0.01, 'backoff_max': 1.0}
+    settings.update(options)
+    return OpenRouterClient(**settings)
+
+def post(client, openrouter):
+    return client.post(openrouter.url, json={'model': 'test/model', 'messages': [{'role': 'user', 'content': 'hi'}]})
+
+def test_429_is_retried_after_the_retry_after_delay(openrouter):
+    openrouter.reply('slow down', status=429, headers={'Retry-After': '0.3'})
+    client = make_client()
+    
+    start = time.monotonic()
+    response = post(client, openrouter)
+    assert response.status_code == 200
+    assert time.monotonic() - start >= 0.3
+    assert len(openrouter.requests) == 2
+    stats = client.stats()
+    assert (stats['retries'], stats['upstream_errors']) == (1, 1)
+
+def test_retry_after_is_capped_at_backoff_max(openrouter):
+    openrouter.reply('slow down', status=429, headers={'Retry-After': '3600'})
+    client = make_client(backoff_max=0.2)
+    
+    start = time.monotonic()
+    assert post(client, openrouter).status_code == 200
+    assert time.monotonic() - start < 2
+
+def test_503_then_200_succeeds_on_the_second_attempt(openrouter):
+    openrouter.reply('unavailable', status=503)
+    client = make_client()
+    
+    response = post(client, openrouter)
+    assert response.status_code == 200
+    assert response.json()['choices'][0]['finish_reason'] == 'stop'
+    assert len(openrouter.requests) == 2
+
+def test_persistent_5xx_returns_the_last_response_after_max_retries(openrouter):
+    for _ in range(3):
+        openrouter.reply('unavailable', status=503)
+    client = make_client(max_retries=2)
+    
+    response = post(client, openrouter)
+    assert response.status_code == 503
+    assert len(openrouter.requests) == 3
+    assert client.stats()['upstream_errors'] == 3
+
+def test_client_errors_are_not_retried(openrouter):
+    openrouter.reply('bad request', status=400)
+    assert post(make_client(), openrouter).status_code == 400
+    assert len(openrouter.requests) == 1
+
+def test_backoff_is_full_jitter_and_capped(openrouter, monkeypatch):
+    ceilings = []
+    monkeypatch.setattr(openrouter_client.random, 'uniform', lambda low, high: ceilings.append((low, high)) or 0)
+    for _ in range(4):
+        openrouter.reply('unavailable', status=502)
+    client = make_client(max_retries=4, backoff_base=0.5, backoff_max=1.5)
+    
+    assert post(client, openrouter).status_code == 200
+    assert ceilings == [(0, 0.5), (0, 1.0), (0, 1.5), (0, 1.5)]
+
+def test_read_timeout_is_raised_without_retrying(openrouter):
+    openrouter.reply(delay=1.0)
+    client = make_client(read_timeout=0.2)
+    
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        post(client, openrouter)
+    assert len(openrouter.requests) == 1
+    stats = client.stats()
+    assert (stats['timeouts'], stats['retries']) == (1, 0)
+
+def test_connection_errors_are_retried_then_raised():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    client = make_client(max_retries=2)
+    
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.post(f'http://127.0.0.1:{port}/api/v1/chat/completions', json={})
+    stats = client.stats()
+    assert (stats['connection_errors'], stats['retries']) == (3, 2)
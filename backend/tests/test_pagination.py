@@ -0,0 +1,28 @@
+import pytest
+
+from conftest import register, create_project
+
+@pytest.mark.parametrize('per_page', ['0', '-1', '1000', 'abc'])
+def test_paginated_routes_clamp_per_page(make_app, per_page):
+    client = make_app().test_client()
+    headers = register(client, 'alice')
+    project_id = create_project(client, headers)
+    
+    for url in ('/api/projects/', f'/api/ai/generation-history/{project_id}',
+                f'/api/projects/{project_id}/versions'):
+        response = client.get(f'{url}?per_page={per_page}', headers=headers)
+        assert response.status_code == 200, (url, response.get_json())
+
+def test_project_listing_pages_through_every_project(make_app):
+    client = make_app().test_client()
+    headers = register(client, 'alice')
+    created = {create_project(client, headers, f'Site {i}') for i in range(5)}
+    
+    seen = []
+    response = client.get('/api/projects/?per_page=2', headers=headers).get_json()
+    seen += [project['id'] for project in response['projects']]
+    while response['next_cursor']:
+        response = client.get(f"/api/projects/?per_page=2&cursor={response['next_cursor']}",
+                              headers=headers).get_json()
+        seen += [project['id'] for project in response['projects']]
+    assert sorted(seen) == sorted(created)
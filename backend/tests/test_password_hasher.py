@@ -0,0 +1,53 @@
+import threading
+
+import pytest
+
+from app.services import password_hasher
+from app.services.password_hasher import PasswordHasher, PasswordHasherBusyError
+from conftest import wait_for
+
+def test_timed_out_hashes_keep_their_slot_until_they_finish(monkeypatch):
+    gate = threading.Event()
+    monkeypatch.setattr(password_hasher, 'encode_hash', lambda *args: gate.wait(10) and 'hashed')
+    hasher = PasswordHasher(algorithm='pbkdf2_sha256', workers=1, max_pending=2, timeout=0.1)
+    
+    # The first hash times out for its caller but keeps running on the worker
+    with pytest.raises(PasswordHasherBusyError):
+        hasher.hash('first')
+    assert hasher.stats()['pending'] == 1
+    
+    # The second never starts: it is cancelled and its slot freed straight away
+    with pytest.raises(PasswordHasherBusyError):
+        hasher.hash('second')
+    assert hasher.stats()['pending'] == 1
+    assert hasher.stats()['timeouts'] == 2
+    
+    gate.set()
+    assert wait_for(lambda: hasher.stats()['pending'] == 0)
+    assert hasher.hash('third') == 'hashed'
+    hasher.shutdown()
+
+def test_work_nobody_waits_for_still_counts_against_max_pending(monkeypatch):
+    gate = threading.Event()
+    monkeypatch.setattr(password_hasher, 'encode_hash', lambda *args: gate.wait(10) and 'hashed')
+    hasher = PasswordHasher(algorithm='pbkdf2_sha256', workers=1, max_pending=1, timeout=0.1)
+    
+    with pytest.raises(PasswordHasherBusyError):
+        hasher.hash('first')
+    with pytest.raises(PasswordHasherBusyError, match='Too many'):
+        hasher.hash('second')
+    assert hasher.stats()['rejected'] == 1
+    
+    gate.set()
+    assert wait_for(lambda: hasher.stats()['pending'] == 0)
+    hasher.shutdown()
+
+def test_hashes_verify_and_flag_old_costs_for_rehash():
+    hasher = PasswordHasher(algorithm='pbkdf2_sha256', pbkdf2_iterations=1000, workers=1)
+    encoded = hasher.hash('secret123')
+    assert hasher.verify('secret123', encoded) == (True, False)
+    assert hasher.verify('wrong', encoded) == (False, False)
+    
+    stronger = PasswordHasher(algorithm='pbkdf2_sha256', pbkdf2_iterations=2000, workers=0)
+    assert stronger.verify('secret123', encoded) == (True, True)
+    hasher.shutdown()
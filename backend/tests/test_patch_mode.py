@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from app.services.html_patch import parse_edits, apply_edits, PatchError
+from conftest import register, create_project
+
+PAGE = '<!DOCTYPE html><html><body><h1>Bakery</h1><p>Fresh bread daily</p></body></html>'
+EDITS = [{'search': '<h1>Bakery</h1>', 'replace': '<h1>Lisbon Bakery</h1>'}]
+
+def test_edits_are_parsed_from_fenced_json_or_an_edits_object():
+    assert parse_edits(f'```json\n{json.dumps(EDITS)}\n```') == EDITS
+    assert parse_edits(json.dumps({'edits': EDITS})) == EDITS
+
+@pytest.mark.parametrize('text', [
+    'not json',
+    '[]',
+    '[{"search": "<h1>"}]',
+    '[{"search": "", "replace": "x"}]',
+])
+def test_malformed_edits_are_rejected(text):
+    with pytest.raises(PatchError):
+        parse_edits(text)
+
+def test_edits_apply_in_order():
+    edits = EDITS + [{'search': 'Lisbon', 'replace': 'Porto'}]
+    assert apply_edits(PAGE, edits) == PAGE.replace('Bakery</h1>', 'Porto Bakery</h1>')
+
+@pytest.mark.parametrize('edits', [
+    [{'search': '<h2>', 'replace': ''}],
+    [{'search': '<', 'replace': '['}],
+    [{'search': '</html>', 'replace': ''}],
+])
+def test_edits_must_match_once_and_keep_the_document_whole(edits):
+    with pytest.raises(PatchError):
+        apply_edits(PAGE, edits)
+
+def regenerate(client, headers, project_id, modifications='Name the city'):
+    response = client.post('/api/ai/regenerate-website', json={
+        'project_id': project_id, 'modifications': modifications, 'use_cache': False
+    }, headers=headers)
+    assert response.status_code == 200
+    return response.get_json()['project']['generated_code']
+
+def latest_history(client, headers, project_id):
+    return client.get(f'/api/ai/generation-history/{project_id}', headers=headers).get_json()['history'][0]
+
+@pytest.fixture
+def generated(make_app, openrouter):
+    """A client and a project whose page is large enough for patch mode"""
+    client = make_app(HTML_PIPELINE='strip_fences', PATCH_MODE_MIN_SIZE=len(PAGE)).test_client()
+    headers = register(client, 'alice')
+    project_id = create_project(client, headers)
+    openrouter.reply(PAGE)
+    client.post('/api/ai/generate-website', json={'project_id': project_id, 'prompt': 'A bakery'}, headers=headers)
+    return client, headers, project_id
+
+def test_large_pages_are_modified_with_local_edits(generated, openrouter):
+    client, headers, project_id = generated
+    openrouter.reply(json.dumps(EDITS))
+    
+    assert regenerate(client, headers, project_id) == apply_edits(PAGE, EDITS)
+    assert len(openrouter.requests) == 2
+    assert 'JSON array of edits' in openrouter.requests[1]['messages'][-1]['content']
+    entry = latest_history(client, headers, project_id)
+    assert entry['mode'] == 'patch'
+    assert entry['tokens_saved'] > 0
+
+def test_unusable_edits_fall_back_to_the_full_document(generated, openrouter, caplog):
+    client, headers, project_id = generated
+    rewritten = PAGE.replace('Bakery', 'Lisbon Bakery')
+    openrouter.reply(json.dumps([{'search': '<h2>Menu</h2>', 'replace': ''}]))
+    openrouter.reply(rewritten)
+    
+    assert regenerate(client, headers, project_id) == rewritten
+    assert len(openrouter.requests) == 3
+    assert 'JSON array of edits' not in openrouter.requests[2]['messages'][-1]['content']
+    entry = latest_history(client, headers, project_id)
+    assert entry['mode'] == 'patch_fallback'
+    # The failed attempt's tokens count against the fallback
+    assert entry['tokens_saved'] == -20
+    assert entry['prompt_tokens'] == 20 and entry['completion_tokens'] == 20
+    assert 'Patch edits could not be applied' in caplog.text
+
+def test_small_pages_are_regenerated_whole(make_app, openrouter):
+    client = make_app(HTML_PIPELINE='strip_fences', PATCH_MODE_MIN_SIZE=len(PAGE) + 1).test_client()
+    headers = register(client, 'alice')
+    project_id = create_project(client, headers)
+    openrouter.reply(PAGE)
+    client.post('/api/ai/generate-website', json={'project_id': project_id, 'prompt': 'A bakery'}, headers=headers)
+    
+    rewritten = PAGE.replace('Bakery', 'Lisbon Bakery')
+    openrouter.reply(rewritten)
+    assert regenerate(client, headers, project_id) == rewritten
+    assert latest_history(client, headers, project_id)['mode'] == 'full'
@@ -0,0 +1,51 @@
+from app.models.content_blob import ContentBlob
+from app.models.project import WebsiteProject
+from conftest import register, create_project
+
+def save_code(app, project_id, code):
+    with app.app_context():
+        project = WebsiteProject.find_by_id(project_id, 1)
+        project.generated_code = code
+        project.save()
+
+def test_preview_links_are_scoped_and_tokens_stay_out_of_urls(make_app):
+    app = make_app()
+    client = app.test_client()
+    headers = register(client, 'alice')
+    project_id = create_project(client, headers)
+    other_id = create_project(client, headers, 'Other')
+    save_code(app, project_id, '<html><body>Preview me</body></html>')
+    access_token = headers['Authorization'].split()[1]
+    
+    assert client.get(f'/preview/{project_id}', headers=headers).status_code == 200
+    assert client.get(f'/preview/{project_id}?jwt={access_token}').status_code == 401
+    
+    link = client.post(f'/preview/{project_id}/token', headers=headers).get_json()
+    response = client.get(link['url'])
+    assert response.status_code == 200
+    assert response.headers['Referrer-Policy'] == 'no-referrer'
+    assert client.get(f"/preview/{other_id}?token={link['token']}").status_code == 401
+    assert client.get(f'/preview/{project_id}?token=forged').status_code == 401
+    # A preview link is not an API token
+    assert client.get('/api/projects/', headers={'Authorization': f"Bearer {link['token']}"}).status_code != 200
+
+def test_preview_links_expire(make_app):
+    app = make_app(PREVIEW_TOKEN_SECONDS=-1)
+    client = app.test_client()
+    headers = register(client, 'alice')
+    project_id = create_project(client, headers)
+    save_code(app, project_id, '<p>Soon gone</p>')
+    
+    link = client.post(f'/preview/{project_id}/token', headers=headers).get_json()
+    assert client.get(link['url']).status_code == 401
+
+def test_bundles_are_kept_out_of_shared_caches(make_app):
+    app = make_app()
+    client = app.test_client()
+    headers = register(client, 'alice')
+    project_id = create_project(client, headers)
+    save_code(app, project_id, '<p>Bundle</p>')
+    
+    response = client.get(f"/preview/sites/{ContentBlob.content_hash('<p>Bundle</p>')}/index.html")
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'].startswith('private')
@@ -0,0 +1,97 @@
+import json
+
+from app.services.ai_service import AIService
+from app.services.html_context import trim_document, document_regions, keywords
+from conftest import register, create_project
+
+def section(name, filler):
+    return (f'<section id="{name}" class="block"><h2>{name.title()}</h2>'
+            f'<p>{filler * 40}</p></section>\n')
+
+PAGE = ('<!DOCTYPE html>\n<html>\n<head><title>Bakery</title>\n'
+        '<style>.block { padding: 2rem; } #pricing table { width: 100%; }</style>\n</head>\n<body>\n'
+        '<div class="wrapper">\n'
+        + section('menu', 'Sourdough, rye and seeded loaves. ')
+        + section('story', 'Baking in Lisbon since 1987. ')
+        + section('pricing', 'A loaf costs three euros. ')
+        + section('contact', 'Call us or drop by the shop. ')
+        + '</div>\n</body>\n</html>')
+
+def test_modification_prompts_share_a_byte_identical_prefix(make_app):
+    with make_app().app_context():
+        service = AIService(user_id=1)
+        full = service._modification_messages(PAGE, 'Make the menu blue', 'business')
+        patch = service._patch_messages(PAGE, 'Add a price table', 'business')
+        again = service._patch_messages(PAGE, 'Something else entirely', 'business')
+    
+    assert full[:2] == patch[:2] == again[:2]
+    assert PAGE in full[1]['content']
+    # Only the last message depends on the request
+    assert 'Make the menu blue' in full[2]['content']
+    assert not any('Make the menu blue' in message['content'] for message in full[:2])
+
+def test_wrappers_holding_most_of_the_page_are_split_into_blocks():
+    blocks = [element.attrs.get('id') or element.tag for _, _, element in document_regions(PAGE)]
+    assert blocks == ['title', 'style', 'menu', 'story', 'pricing', 'contact']
+
+def test_keywords_drop_stop_words_and_suffixes():
+    assert keywords('Please make the pricing tables bigger') == {'pric', 'tabl', 'bigger'}
+
+def test_blocks_unrelated_to_the_request_are_omitted():
+    trimmed, omitted = trim_document(PAGE, 'Add a row for croissants to the pricing table')
+    assert omitted == 3
+    for name in ('menu', 'story', 'contact'):
+        assert f'<!-- omitted: <section id="{name}" class="block"> (' in trimmed
+        assert f'<h2>{name.title()}</h2>' not in trimmed
+    # The matching block, the styles and the document's frame are sent as they are
+    assert section('pricing', 'A loaf costs three euros. ') in trimmed
+    assert trimmed.startswith(PAGE[:PAGE.index('<section')])
+    assert trimmed.endswith('</div>\n</body>\n</html>')
+
+def test_documents_are_sent_whole_when_trimming_would_not_help():
+    # Nothing matches
+    assert trim_document(PAGE, 'Use a serif font') == (PAGE, 0)
+    # Only matches words found in most blocks
+    assert trim_document(PAGE, 'Make every block bigger') == (PAGE, 0)
+    # Too little would be left out
+    assert trim_document(PAGE, 'Add a row for croissants to the pricing table', max_ratio=0.2) == (PAGE, 0)
+    assert trim_document('<html><body><p>Hi</p></body></html>', 'Change hi') == (
+        '<html><body><p>Hi</p></body></html>', 0)
+
+def regenerate(client, headers, project_id, modifications):
+    response = client.post('/api/ai/regenerate-website', json={
+        'project_id': project_id, 'modifications': modifications, 'use_cache': False
+    }, headers=headers)
+    assert response.status_code == 200
+    return response.get_json()['project']['generated_code']
+
+def patch_client(make_app, openrouter, **env):
+    client = make_app(HTML_PIPELINE='strip_fences', PATCH_MODE_MIN_SIZE=1, **env).test_client()
+    headers = register(client, 'alice')
+    project_id = create_project(client, headers)
+    openrouter.reply(PAGE)
+    client.post('/api/ai/generate-website', json={'project_id': project_id, 'prompt': 'A bakery'}, headers=headers)
+    return client, headers, project_id
+
+def test_a_patch_fallback_resends_the_same_prefix(make_app, openrouter):
+    client, headers, project_id = patch_client(make_app, openrouter)
+    openrouter.reply(json.dumps([{'search': 'not on the page', 'replace': ''}]))
+    openrouter.reply(PAGE.replace('three', 'four'))
+    
+    assert regenerate(client, headers, project_id, 'Raise the price') == PAGE.replace('three', 'four')
+    patch, full = openrouter.requests[1]['messages'], openrouter.requests[2]['messages']
+    assert patch[:2] == full[:2]
+    assert patch[2] != full[2]
+
+def test_trimmed_patches_are_applied_to_the_whole_document(make_app, openrouter, caplog):
+    caplog.set_level('INFO', logger='app.services.ai_service')
+    client, headers, project_id = patch_client(make_app, openrouter, PATCH_TRIM_ENABLED='true')
+    openrouter.reply(json.dumps([{'search': '<h2>Pricing</h2>', 'replace': '<h2>Prices</h2>'}]))
+    
+    code = regenerate(client, headers, project_id, 'Rename the pricing heading')
+    assert code == PAGE.replace('<h2>Pricing</h2>', '<h2>Prices</h2>')
+    messages = openrouter.requests[1]['messages']
+    assert '<!-- omitted: <section id="menu"' in messages[1]['content']
+    assert 'Sourdough' not in messages[1]['content']
+    assert 'omitted' in messages[2]['content']
+    assert 'Prompt for patch: ~' in caplog.text
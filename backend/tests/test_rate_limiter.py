@@ -0,0 +1,125 @@
+import time
+
+import pytest
+
+from app.services.rate_limiter import RateLimiter, RateLimitError
+from conftest import register, create_project
+
+@pytest.fixture
+def limiter(make_app):
+    """Build limiters on the app's database; every budget is off unless given"""
+    db_path = make_app().config['DATABASE_PATH']
+    
+    def build(**limits):
+        options = {'global_rpm': 0, 'global_tpm': 0, 'user_rpm': 0, 'user_tpm': 0, 'batch_headroom': 0.25}
+        options.update(limits)
+        return RateLimiter(db_path, **options)
+    
+    return build
+
+def level(limiter, name):
+    return limiter._connection().execute('SELECT level FROM rate_buckets WHERE name = ?', (name,)).fetchone()[0]
+
+def test_tokens_are_taken_until_the_bucket_runs_dry(limiter):
+    # 6000 tokens/min refill at 100 a second, so waits are easy to predict
+    rate = limiter(user_tpm=6000)
+    assert rate._try_take(1, 4000, 'interactive') == 0
+    assert level(rate, 'user:1:tokens') == pytest.approx(2000, abs=5)
+    
+    assert rate._try_take(1, 4000, 'interactive') == pytest.approx(20, abs=0.1)
+    # Nothing is taken by a call that has to wait
+    assert level(rate, 'user:1:tokens') == pytest.approx(2000, abs=5)
+    # Other users have buckets of their own
+    assert rate._try_take(2, 4000, 'interactive') == 0
+
+def test_a_call_must_fit_every_bucket(limiter):
+    rate = limiter(global_rpm=2, user_rpm=30)
+    assert rate._try_take(1, 100, 'interactive') == 0
+    assert rate._try_take(2, 100, 'interactive') == 0
+    assert rate._try_take(3, 100, 'interactive') == pytest.approx(30, abs=0.1)
+    # The user's bucket is left untouched
+    conn = rate._connection()
+    assert conn.execute("SELECT 1 FROM rate_buckets WHERE name = 'user:3:requests'").fetchone() is None
+
+def test_calls_larger_than_a_bucket_wait_for_it_to_be_full(limiter):
+    rate = limiter(user_tpm=6000)
+    assert rate._try_take(1, 10000, 'interactive') == 0
+    # The bucket goes into debt and refills from there
+    assert level(rate, 'user:1:tokens') == pytest.approx(-4000, abs=5)
+    assert rate._try_take(1, 10000, 'interactive') == pytest.approx(100, abs=0.1)
+
+def test_batch_calls_leave_headroom_for_interactive_ones(limiter):
+    rate = limiter(user_tpm=6000)
+    assert rate._try_take(1, 4000, 'batch') == 0
+    # 2000 left, but a batch call must leave 1500 (25%) behind
+    assert rate._try_take(1, 600, 'batch') == pytest.approx(1, abs=0.1)
+    assert rate._try_take(1, 600, 'interactive') == 0
+    # A batch call never needs more than the whole bucket
+    assert limiter(user_tpm=6000)._try_take(9, 6000, 'batch') == 0
+
+def test_settle_refunds_unused_tokens_and_records_usage(limiter):
+    rate = limiter(global_tpm=6000, user_tpm=6000)
+    reserved = rate.acquire(1, 4000)
+    rate.settle(1, reserved, 300, 700, model='test/model')
+    assert level(rate, 'user:1:tokens') == pytest.approx(5000, abs=5)
+    assert level(rate, 'global:tokens') == pytest.approx(5000, abs=5)
+    
+    usage = rate.usage(user_id=1)
+    assert (usage['requests'], usage['prompt_tokens'], usage['completion_tokens']) == (1, 300, 700)
+    stats = rate.stats()
+    assert (stats['tokens_reserved'], stats['tokens_refunded']) == (4000, 3000)
+
+def test_settle_without_usage_keeps_the_reservation(limiter):
+    rate = limiter(user_tpm=6000)
+    rate.settle(1, rate.acquire(1, 4000))
+    assert level(rate, 'user:1:tokens') == pytest.approx(2000, abs=5)
+    
+    # A call that failed before using anything gives it all back
+    rate.settle(1, rate.acquire(1, 1000), 0, 0)
+    assert level(rate, 'user:1:tokens') == pytest.approx(2000, abs=5)
+
+def test_overspent_calls_are_charged_the_difference(limiter):
+    rate = limiter(user_tpm=6000)
+    rate.settle(1, rate.acquire(1, 1000), 1000, 1000)
+    assert level(rate, 'user:1:tokens') == pytest.approx(4000, abs=5)
+
+def test_acquire_waits_for_budget_within_its_deadline(limiter):
+    rate = limiter(user_tpm=600)
+    rate.poll_interval = 0.05
+    rate.acquire(1, 600)
+    
+    start = time.monotonic()
+    rate.acquire(1, 3)
+    assert time.monotonic() - start >= 0.25
+    assert rate.stats()['delayed'] == 1
+
+def test_acquire_gives_up_when_the_wait_passes_the_deadline(limiter):
+    rate = limiter(user_rpm=1)
+    rate.deadlines = {'interactive': 5, 'batch': 600}
+    rate.acquire(1, 10)
+    
+    with pytest.raises(RateLimitError) as error:
+        rate.acquire(1, 10)
+    assert error.value.retry_after == pytest.approx(60, abs=0.1)
+    assert rate.stats()['rejected'] == 1
+
+def test_budgets_are_shared_between_limiters_on_one_database(limiter):
+    first, second = limiter(user_rpm=1), limiter(user_rpm=1)
+    assert first._try_take(1, 10, 'interactive') == 0
+    assert second._try_take(1, 10, 'interactive') > 0
+
+def test_generation_over_budget_is_answered_with_429(make_app, openrouter):
+    client = make_app(AI_USER_RPM=1, AI_INTERACTIVE_DEADLINE=1).test_client()
+    headers = register(client, 'alice')
+    project_id = create_project(client, headers)
+    
+    def generate(prompt):
+        return client.post('/api/ai/generate-website', json={
+            'project_id': project_id, 'prompt': prompt, 'use_cache': False
+        }, headers=headers)
+    
+    assert generate('A bakery').status_code == 200
+    response = generate('A florist')
+    assert response.status_code == 429
+    assert 55 <= int(response.headers['Retry-After']) <= 60
+    assert len(openrouter.requests) == 1
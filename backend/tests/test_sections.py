@@ -0,0 +1,117 @@
+import json
+
+import pytest
+
+from app.services.ai_service import parse_outline, MAX_SECTIONS
+from conftest import register, create_project
+
+OUTLINE = {
+    'title': 'Bakery & Co',
+    'shared_css': ':root { --brand: #c60; }',
+    'sections': [
+        {'id': 'nav', 'name': 'Navigation', 'description': 'Links'},
+        {'id': 'Our Menu!', 'name': 'Menu', 'description': 'Breads'},
+        {'id': 'footer', 'name': 'Footer', 'description': 'Address'}
+    ]
+}
+SECTIONS = ['<nav id="nav">Home</nav>', '<section id="our-menu">Rye</section>', '<footer id="footer">Lisbon</footer>']
+
+def test_outline_ids_are_normalised_and_sections_capped():
+    outline = parse_outline('```json\n' + json.dumps({
+        'sections': [{'id': 'Our Menu!'}, {'name': 'No id'}, 'junk']
+        + [{'id': f's{index}'} for index in range(MAX_SECTIONS)]
+    }) + '\n```')
+    assert outline['title'] == 'Website' and outline['shared_css'] == ''
+    ids = [section['id'] for section in outline['sections']]
+    assert ids[:2] == ['our-menu', 'section-2']
+    # The cap applies before non-object entries are dropped
+    assert len(ids) == MAX_SECTIONS - 1
+
+@pytest.mark.parametrize('text', ['not json', '{"sections": []}', '[1, 2]'])
+def test_unusable_outlines_are_rejected(text):
+    with pytest.raises(Exception):
+        parse_outline(text)
+
+def generate_sections(client, headers, project_id):
+    response = client.post('/api/ai/generate-website', json={
+        'project_id': project_id, 'prompt': 'A bakery', 'mode': 'sections', 'use_cache': False
+    }, headers=headers)
+    assert response.status_code == 200
+    return response.get_json()['project']['generated_code']
+
+def test_sections_are_merged_in_outline_order_with_shared_css(make_app, openrouter):
+    client = make_app(HTML_PIPELINE='strip_fences', SECTION_WORKERS=1).test_client()
+    headers = register(client, 'alice')
+    project_id = create_project(client, headers)
+    openrouter.reply(json.dumps(OUTLINE))
+    for section in SECTIONS:
+        openrouter.reply(f'```html\n{section}\n```')
+    
+    code = generate_sections(client, headers, project_id)
+    assert '<title>Bakery &amp; Co</title>' in code
+    assert OUTLINE['shared_css'] in code
+    body = code.split('<body>\n', 1)[1].split('\n</body>', 1)[0]
+    assert body == '\n\n'.join(SECTIONS)
+    
+    assert len(openrouter.requests) == 4
+    assert openrouter.requests[0]['max_tokens'] == 1500
+    for request, name in zip(openrouter.requests[1:], ['Navigation', 'Menu', 'Footer']):
+        assert request['max_tokens'] == 3000
+        assert f'Section "{name}"' in request['messages'][-1]['content']
+    
+    entry = client.get(f'/api/ai/generation-history/{project_id}', headers=headers).get_json()['history'][0]
+    assert entry['mode'] == 'sections'
+    assert (entry['prompt_tokens'], entry['completion_tokens']) == (40, 40)
+
+def test_sections_are_generated_concurrently(make_app, openrouter):
+    client = make_app(SECTION_WORKERS=3).test_client()
+    headers = register(client, 'alice')
+    project_id = create_project(client, headers)
+    openrouter.reply(json.dumps(OUTLINE))
+    for section in SECTIONS:
+        openrouter.reply(section, delay=0.3)
+    
+    generate_sections(client, headers, project_id)
+    assert openrouter.max_in_flight == 3
+
+def test_cut_off_sections_are_retried_with_a_larger_budget(make_app, openrouter, caplog):
+    client = make_app(HTML_PIPELINE='strip_fences', SECTION_WORKERS=1, SECTION_RETRIES=1).test_client()
+    headers = register(client, 'alice')
+    project_id = create_project(client, headers)
+    openrouter.reply(json.dumps(OUTLINE))
+    openrouter.reply('<nav id="nav">Ho', finish_reason='length')
+    for section in SECTIONS:
+        openrouter.reply(section)
+    
+    code = generate_sections(client, headers, project_id)
+    assert '<nav id="nav">Home</nav>' in code and '<nav id="nav">Ho\n' not in code
+    retry = openrouter.requests[2]
+    assert retry['max_tokens'] == 6000
+    assert 'cut off' in retry['messages'][-1]['content']
+    assert 'still truncated' not in caplog.text
+
+def test_a_bad_outline_fails_without_generating_sections(make_app, openrouter):
+    client = make_app().test_client()
+    headers = register(client, 'alice')
+    project_id = create_project(client, headers)
+    openrouter.reply('Sorry, I cannot plan that.')
+    
+    response = client.post('/api/ai/generate-website', json={
+        'project_id': project_id, 'prompt': 'A bakery', 'mode': 'sections', 'use_cache': False
+    }, headers=headers)
+    assert response.status_code == 500
+    assert 'outline' in response.get_json()['details']
+    assert len(openrouter.requests) == 1
+
+def test_sections_still_cut_off_after_the_retries_are_kept_and_logged(make_app, openrouter, caplog):
+    client = make_app(HTML_PIPELINE='strip_fences', SECTION_WORKERS=1, SECTION_RETRIES=1).test_client()
+    headers = register(client, 'alice')
+    project_id = create_project(client, headers)
+    openrouter.reply(json.dumps(OUTLINE))
+    openrouter.reply('<nav id="nav">Ho', finish_reason='length')
+    openrouter.reply('<nav id="nav">Hom', finish_reason='length')
+    for section in SECTIONS[1:]:
+        openrouter.reply(section)
+    
+    assert '<nav id="nav">Hom' in generate_sections(client, headers, project_id)
+    assert "Section 'nav' still truncated after 1 retries" in caplog.text
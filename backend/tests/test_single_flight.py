@@ -0,0 +1,78 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from app.db import get_db
+from app.services.rate_limiter import RateLimitError
+from app.services.single_flight import SingleFlight, SingleFlightError
+
+def run_concurrently(app, flights, fn):
+    """Call the same key on each flight, the first one leading; returns what each raised"""
+    errors = [None] * len(flights)
+    
+    def call(index):
+        with app.app_context():
+            try:
+                flights[index].do('key', fn)
+            except Exception as e:
+                errors[index] = e
+    
+    threads = [threading.Thread(target=call, args=(index,)) for index in range(len(flights))]
+    threads[0].start()
+    time.sleep(0.1)
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+def slow_failure(error):
+    def fn():
+        time.sleep(0.3)
+        raise error
+    return fn
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+def test_followers_get_the_leaders_rate_limit_error(app):
+    local = SingleFlight(app.config['DATABASE_PATH'])
+    # A second instance on the same database stands in for another process
+    remote = SingleFlight(app.config['DATABASE_PATH'])
+    
+    leader, follower, other_process = run_concurrently(
+        app, [local, local, remote], slow_failure(RateLimitError('budget exhausted', 7.5)))
+    
+    assert isinstance(leader, RateLimitError)
+    assert follower is leader
+    assert isinstance(other_process, RateLimitError)
+    assert other_process.retry_after == 7.5
+
+def test_other_failures_reach_other_processes_as_single_flight_errors(app):
+    local = SingleFlight(app.config['DATABASE_PATH'])
+    remote = SingleFlight(app.config['DATABASE_PATH'])
+    
+    leader, follower, other_process = run_concurrently(app, [local, local, remote],
+                                                       slow_failure(ValueError('bad output')))
+    
+    assert isinstance(leader, ValueError) and follower is leader
+    assert isinstance(other_process, SingleFlightError)
+    assert str(other_process) == 'bad output'
+
+def test_leases_leave_the_request_transaction_alone(app):
+    flights = SingleFlight(app.config['DATABASE_PATH'])
+    with app.app_context():
+        conn = get_db()
+        conn.execute('BEGIN')
+        conn.execute('SELECT COUNT(*) FROM users').fetchone()
+        assert flights.do('key', lambda: 'result') == ('result', False)
+        
+        # The lease was written and committed without ending the request's transaction
+        assert conn.in_transaction
+        other = sqlite3.connect(app.config['DATABASE_PATH'])
+        assert other.execute("SELECT status FROM request_leases WHERE lease_key = 'key'").fetchone()[0] == 'done'
+        other.close()
+        conn.rollback()
@@ -0,0 +1,11 @@
+from conftest import register
+
+def test_stats_are_limited_to_admin_accounts(make_app):
+    client = make_app(STATS_ADMIN_EMAILS='Admin@Example.com').test_client()
+    
+    assert client.get('/api/stats', headers=register(client, 'admin')).status_code == 200
+    assert client.get('/api/stats', headers=register(client, 'alice')).status_code == 403
+
+def test_stats_are_closed_by_default(make_app):
+    client = make_app(STATS_ADMIN_EMAILS='').test_client()
+    assert client.get('/api/stats', headers=register(client, 'admin')).status_code == 403
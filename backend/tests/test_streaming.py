@@ -0,0 +1,97 @@
+import json
+
+from conftest import register, create_project
+
+PAGE = '<!DOCTYPE html><html><body><h1>Bakery</h1><p>Fresh bread daily</p></body></html>'
+
+def read_events(response):
+    """Split an SSE body into (event, data) pairs"""
+    events = []
+    for block in response.get_data(as_text=True).split('\n\n'):
+        if not block:
+            continue
+        event, data = block.split('\n')
+        assert event.startswith('event: ') and data.startswith('data: ')
+        events.append((event[len('event: '):], json.loads(data[len('data: '):])))
+    return events
+
+def latest_history(client, headers, project_id):
+    return client.get(f'/api/ai/generation-history/{project_id}', headers=headers).get_json()['history'][0]
+
+def test_code_is_relayed_as_chunk_events_then_done(make_app, openrouter):
+    client = make_app(HTML_PIPELINE='strip_fences').test_client()
+    headers = register(client, 'alice')
+    project_id = create_project(client, headers)
+    # Fenced and split so the fence straddles several deltas
+    openrouter.reply(f'```html\n{PAGE}\n```', chunk_size=5)
+    
+    response = client.post('/api/ai/generate-website/stream', json={
+        'project_id': project_id, 'prompt': 'A bakery'
+    }, headers=headers)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert openrouter.requests[0]['stream'] is True
+    
+    events = read_events(response)
+    names = [name for name, data in events]
+    assert names[-1] == 'done' and set(names[:-1]) == {'chunk'}
+    assert len(names) > 2
+    assert ''.join(data['content'] for name, data in events[:-1]) == PAGE
+    
+    done = events[-1][1]
+    assert done['project']['generated_code'] == PAGE
+    assert done['project']['status'] == 'generated'
+    assert client.get(f'/api/projects/{project_id}', headers=headers).get_json()['project']['generated_code'] == PAGE
+    assert latest_history(client, headers, project_id)['success']
+
+def test_upstream_failure_ends_the_stream_with_an_error_event(make_app, openrouter):
+    client = make_app(OPENROUTER_MAX_RETRIES=0).test_client()
+    headers = register(client, 'alice')
+    project_id = create_project(client, headers)
+    openrouter.reply('bad request', status=400)
+    
+    response = client.post('/api/ai/generate-website/stream', json={
+        'project_id': project_id, 'prompt': 'A bakery'
+    }, headers=headers)
+    assert response.status_code == 200
+    
+    events = read_events(response)
+    assert [name for name, data in events] == ['error']
+    assert events[0][1]['error'] == 'AI generation failed'
+    assert '400' in events[0][1]['details']
+    
+    project = client.get(f'/api/projects/{project_id}', headers=headers).get_json()['project']
+    assert not project['generated_code']
+    entry = latest_history(client, headers, project_id)
+    assert not entry['success'] and '400' in entry['error_message']
+
+def test_regeneration_stream_needs_existing_code(make_app, openrouter):
+    client = make_app().test_client()
+    headers = register(client, 'alice')
+    project_id = create_project(client, headers)
+    
+    response = client.post('/api/ai/regenerate-website/stream', json={
+        'project_id': project_id, 'modifications': 'Make it blue'
+    }, headers=headers)
+    assert response.status_code == 400
+    assert openrouter.requests == []
+
+def test_regeneration_stream_sends_the_current_code(make_app, openrouter):
+    client = make_app(HTML_PIPELINE='strip_fences').test_client()
+    headers = register(client, 'alice')
+    project_id = create_project(client, headers)
+    openrouter.reply(PAGE)
+    read_events(client.post('/api/ai/generate-website/stream', json={
+        'project_id': project_id, 'prompt': 'A bakery'
+    }, headers=headers))
+    
+    blue = PAGE.replace('<h1>', '<h1 style="color:blue">')
+    openrouter.reply(blue, chunk_size=7)
+    events = read_events(client.post('/api/ai/regenerate-website/stream', json={
+        'project_id': project_id, 'modifications': 'Make the heading blue'
+    }, headers=headers))
+    assert events[-1][0] == 'done'
+    assert events[-1][1]['project']['generated_code'] == blue
+    assert events[-1][1]['project']['status'] == 'regenerated'
+    assert any(PAGE in message['content'] for message in openrouter.requests[1]['messages'])
@@ -0,0 +1,111 @@
+import time
+
+from app.db import get_db
+from app.models.user import User
+from app.services.user_cache import get_user_cache
+from conftest import register
+
+def row(user_id, username):
+    return {'id': user_id, 'username': username, 'email': f'{username}@example.com'}
+
+def cache_row(cache, user_id, username):
+    cache.put(row(user_id, username), {'email': f'{username}@example.com', 'username': username})
+
+def users_version(app):
+    with app.app_context():
+        return get_db().execute("SELECT version FROM cache_versions WHERE name = 'users'").fetchone()[0]
+
+def test_rows_are_found_by_id_email_and_username(make_app):
+    app = make_app(USER_CACHE_VERSION_CHECK_INTERVAL=60)
+    with app.app_context():
+        cache = get_user_cache()
+        cache_row(cache, 1, 'alice')
+        assert cache.get('id', 1)['username'] == 'alice'
+        assert cache.get('email', 'alice@example.com')['id'] == 1
+        assert cache.get('username', 'alice')['id'] == 1
+        assert cache.get('username', 'bob') is None
+        
+        # Storing the row again under a new name retires the old lookups
+        cache_row(cache, 1, 'alicia')
+        assert cache.get('username', 'alice') is None
+        assert cache.get('username', 'alicia')['id'] == 1
+
+def test_least_recently_used_rows_are_evicted(make_app):
+    app = make_app(USER_CACHE_SIZE=2, USER_CACHE_VERSION_CHECK_INTERVAL=60)
+    with app.app_context():
+        cache = get_user_cache()
+        cache_row(cache, 1, 'alice')
+        cache_row(cache, 2, 'bob')
+        cache.get('id', 1)
+        cache_row(cache, 3, 'carol')
+        
+        assert cache.get('id', 2) is None and cache.get('username', 'bob') is None
+        assert cache.get('id', 1) is not None and cache.get('id', 3) is not None
+        assert cache.stats()['evictions'] == 1
+
+def test_rows_expire_after_the_ttl(make_app):
+    app = make_app(USER_CACHE_VERSION_CHECK_INTERVAL=60)
+    with app.app_context():
+        cache = get_user_cache()
+        cache.ttl = 0.1
+        cache_row(cache, 1, 'alice')
+        assert cache.get('id', 1) is not None
+        time.sleep(0.15)
+        assert cache.get('id', 1) is None
+        assert cache.stats()['expirations'] == 1
+
+def test_profile_updates_invalidate_and_bump_the_version(make_app):
+    app = make_app(USER_CACHE_VERSION_CHECK_INTERVAL=0)
+    client = app.test_client()
+    headers = register(client, 'alice')
+    register(client, 'bob')
+    # Both users are now cached
+    assert client.get('/api/auth/profile', headers=headers).get_json()['user']['username'] == 'alice'
+    with app.app_context():
+        User.find_by_username('bob')
+    before = users_version(app)
+    
+    response = client.put('/api/auth/profile', json={'username': 'alicia'}, headers=headers)
+    assert response.status_code == 200
+    assert users_version(app) == before + 1
+    assert client.get('/api/auth/profile', headers=headers).get_json()['user']['username'] == 'alicia'
+    
+    with app.app_context():
+        assert User.find_by_username('alice') is None
+        stats = get_user_cache().stats()
+        # Our own write doesn't flush other users' rows
+        assert stats['remote_invalidations'] == 0
+        hits = stats['hits']
+        assert User.find_by_username('bob') is not None
+        assert get_user_cache().stats()['hits'] == hits + 1
+
+def test_other_processes_drop_their_cache_when_the_version_moves(make_app):
+    writer = make_app(USER_CACHE_VERSION_CHECK_INTERVAL=0)
+    client = writer.test_client()
+    headers = register(client, 'alice')
+    reader = make_app(USER_CACHE_VERSION_CHECK_INTERVAL=0)
+    with reader.app_context():
+        assert User.find_by_id(1).username == 'alice'
+        assert User.find_by_id(1).username == 'alice'
+        assert get_user_cache().stats()['hits'] == 1
+    
+    client.put('/api/auth/profile', json={'full_name': 'Alice Smith'}, headers=headers)
+    
+    with reader.app_context():
+        assert User.find_by_id(1).full_name == 'Alice Smith'
+        assert get_user_cache().stats()['remote_invalidations'] == 1
+
+def test_version_checks_are_rate_limited(make_app):
+    writer = make_app(USER_CACHE_VERSION_CHECK_INTERVAL=0)
+    client = writer.test_client()
+    headers = register(client, 'alice')
+    reader = make_app(USER_CACHE_VERSION_CHECK_INTERVAL=60)
+    with reader.app_context():
+        User.find_by_id(1)
+    
+    client.put('/api/auth/profile', json={'full_name': 'Alice Smith'}, headers=headers)
+    
+    with reader.app_context():
+        # Stale until the next version check is due
+        assert User.find_by_id(1).full_name == 'alice'
+        assert get_user_cache().stats()['version_checks'] == 1
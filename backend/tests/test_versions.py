@@ -0,0 +1,119 @@
+import random
+
+import pytest
+
+from app.db import get_db
+from app.models.content_blob import ContentBlob
+from app.models.project_version import make_delta, apply_delta
+from conftest import register, create_project
+
+def page(seed, lines=200):
+    rng = random.Random(seed)
+    body = ''.join(f'<p id="p{index}">Paragraph {index} about {rng.choice(["rye", "spelt", "oats"])} '
+                   f'{rng.random():.6f}</p>\n' for index in range(lines))
+    return f'<!DOCTYPE html>\n<html>\n<body>\n{body}</body>\n</html>\n'
+
+def edit(text, line, new):
+    lines = text.splitlines(keepends=True)
+    lines[line] = new
+    return ''.join(lines)
+
+@pytest.mark.parametrize('parent, text', [
+    ('', 'a\nb\n'),
+    ('a\nb\n', ''),
+    ('a\nb\nc', 'a\nB\nc'),
+    ('a\nb\nc\n', 'start\na\nb\nc\nend'),
+    ('x\ny\nx\ny\n', 'y\nx\ny\nx\n'),
+    (page(1), page(2)),
+    (page(1), edit(edit(page(1), 5, 'five\n'), 150, '')),
+])
+def test_deltas_rebuild_the_text_exactly(parent, text):
+    assert apply_delta(parent, make_delta(parent, text)) == text
+
+def save(client, headers, project_id, code):
+    response = client.put(f'/api/projects/{project_id}', json={'generated_code': code}, headers=headers)
+    assert response.status_code == 200
+
+def versions(client, headers, project_id):
+    return client.get(f'/api/projects/{project_id}/versions', headers=headers).get_json()
+
+def version_code(client, headers, project_id, version):
+    return client.get(f'/api/projects/{project_id}/versions/{version}', headers=headers).get_json()['generated_code']
+
+@pytest.fixture
+def history(make_app):
+    """A project saved six times, with snapshots every three versions"""
+    app = make_app(VERSION_SNAPSHOT_INTERVAL=3)
+    client = app.test_client()
+    headers = register(client, 'alice')
+    project_id = create_project(client, headers)
+    codes = [page(1)]
+    for line in range(1, 6):
+        codes.append(edit(codes[-1], line * 30, f'<p>Edit {line}</p>\n'))
+    for code in codes:
+        save(client, headers, project_id, code)
+    return app, client, headers, project_id, codes
+
+def test_versions_are_snapshots_every_interval_and_deltas_between(history):
+    app, client, headers, project_id, codes = history
+    listing = versions(client, headers, project_id)
+    assert [(v['version'], v['parent_version'], v['kind']) for v in listing['versions']] == [
+        (6, 5, 'delta'), (5, 4, 'delta'), (4, 3, 'snapshot'),
+        (3, 2, 'delta'), (2, 1, 'delta'), (1, None, 'snapshot')
+    ]
+    storage = listing['storage']
+    assert (storage['versions'], storage['snapshots']) == (6, 2)
+    assert storage['stored_size'] < storage['size'] / 4
+    
+    for version, code in enumerate(codes, start=1):
+        assert version_code(client, headers, project_id, version) == code
+
+def test_unchanged_saves_and_rewrites(history):
+    app, client, headers, project_id, codes = history
+    save(client, headers, project_id, codes[-1])
+    assert versions(client, headers, project_id)['storage']['versions'] == 6
+    
+    # A page rewritten from scratch isn't worth a delta
+    save(client, headers, project_id, page(2))
+    latest = versions(client, headers, project_id)['versions'][0]
+    assert (latest['version'], latest['kind']) == (7, 'snapshot')
+    assert version_code(client, headers, project_id, 7) == page(2)
+
+def test_corrupted_versions_fail_their_integrity_check(history):
+    app, client, headers, project_id, codes = history
+    with app.app_context():
+        conn = get_db()
+        codec, data = ContentBlob.compress(make_delta(codes[2], codes[2].replace('Paragraph 7 ', 'Paragraph 8 ')))
+        conn.execute('UPDATE project_versions SET codec = ?, data = ? WHERE project_id = ? AND version = 3',
+                     (codec, data, project_id))
+        conn.commit()
+    
+    response = client.get(f'/api/projects/{project_id}/versions/3', headers=headers)
+    assert response.status_code == 500
+    assert 'integrity check' in response.get_json()['details']
+    # Versions rebuilt from a later snapshot are unaffected
+    assert version_code(client, headers, project_id, 5) == codes[4]
+
+def test_rollback_saves_the_old_code_as_a_new_version(history):
+    app, client, headers, project_id, codes = history
+    response = client.post(f'/api/projects/{project_id}/versions/2/rollback', headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['version'] == 7
+    assert response.get_json()['project']['generated_code'] == codes[1]
+    
+    latest = versions(client, headers, project_id)['versions'][0]
+    assert latest['message'] == 'Rollback to version 2'
+    assert version_code(client, headers, project_id, 7) == codes[1]
+    project = client.get(f'/api/projects/{project_id}', headers=headers).get_json()['project']
+    assert project['generated_code'] == codes[1]
+    
+    diff = client.get(f'/api/projects/{project_id}/versions/7/diff?against=6', headers=headers).get_json()
+    assert (diff['added_lines'], diff['removed_lines']) == (4, 4)
+
+def test_rollback_needs_an_existing_version_of_your_own_project(history):
+    app, client, headers, project_id, codes = history
+    assert client.post(f'/api/projects/{project_id}/versions/99/rollback', headers=headers).status_code == 404
+    bob = register(client, 'bob')
+    assert client.post(f'/api/projects/{project_id}/versions/2/rollback', headers=bob).status_code == 404
+    assert client.get(f'/api/projects/{project_id}/versions/2', headers=bob).status_code == 404
+    assert versions(client, headers, project_id)['storage']['versions'] == 6
@@ -1,7 +1,7 @@
 -- SiteCraft AI Database Schema
 
 -- Users table for authentication
-CREATE TABLE users (
+CREATE TABLE IF NOT EXISTS users (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     username VARCHAR(50) UNIQUE NOT NULL,
     email VARCHAR(100) UNIQUE NOT NULL,
@@ -13,7 +13,7 @@ CREATE TABLE users (
 );
 
 -- Website projects table
-CREATE TABLE website_projects (
+CREATE TABLE IF NOT EXISTS website_projects (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     user_id INTEGER NOT NULL,
     project_name VARCHAR(100) NOT NULL,
@@ -21,6 +21,7 @@ CREATE TABLE website_projects (
     website_type VARCHAR(50),
     requirements TEXT,
     generated_code TEXT,
+    code_hash VARCHAR(64),
     status VARCHAR(20) DEFAULT 'draft',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -28,20 +29,28 @@ CREATE TABLE website_projects (
 );
 
 -- AI generation history
-CREATE TABLE generation_history (
+CREATE TABLE IF NOT EXISTS generation_history (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     project_id INTEGER NOT NULL,
     prompt TEXT NOT NULL,
     generated_output TEXT,
+    output_hash VARCHAR(64),
     generation_time REAL,
     success BOOLEAN DEFAULT TRUE,
     error_message TEXT,
+    mode VARCHAR(20),
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    tokens_saved INTEGER,
+    version INTEGER,
+    continuations INTEGER DEFAULT 0,
+    continuation_time REAL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (project_id) REFERENCES website_projects (id) ON DELETE CASCADE
 );
 
 -- User sessions for authentication
-CREATE TABLE user_sessions (
+CREATE TABLE IF NOT EXISTS user_sessions (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     user_id INTEGER NOT NULL,
     session_token VARCHAR(255) UNIQUE NOT NULL,
@@ -50,9 +59,140 @@ CREATE TABLE user_sessions (
     FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
 );
 
+-- Background website generation jobs
+CREATE TABLE IF NOT EXISTS generation_jobs (
+    id VARCHAR(32) PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    project_id INTEGER NOT NULL,
+    kind VARCHAR(20) DEFAULT 'generate',
+    prompt TEXT NOT NULL,
+    use_cache BOOLEAN DEFAULT TRUE,
+    status VARCHAR(20) DEFAULT 'queued',
+    progress VARCHAR(50) DEFAULT 'queued',
+    error_message TEXT,
+    generation_time REAL,
+    batch_id VARCHAR(32),
+    worker_id VARCHAR(64),
+    heartbeat_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE,
+    FOREIGN KEY (project_id) REFERENCES website_projects (id) ON DELETE CASCADE
+);
+
+-- Cached AI completions keyed by a hash of the request
+CREATE TABLE IF NOT EXISTS generation_cache (
+    cache_key VARCHAR(64) PRIMARY KEY,
+    model VARCHAR(100),
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+
+-- Leases that coalesce identical in-flight AI requests across processes
+CREATE TABLE IF NOT EXISTS request_leases (
+    lease_key VARCHAR(150) PRIMARY KEY,
+    owner VARCHAR(64) NOT NULL,
+    status VARCHAR(20) DEFAULT 'running',
+    result TEXT,
+    error_message TEXT,
+    retry_after REAL,
+    expires_at REAL NOT NULL,
+    created_at REAL NOT NULL
+);
+
+-- Compressed, content-addressed storage for generated HTML
+CREATE TABLE IF NOT EXISTS content_blobs (
+    hash VARCHAR(64) PRIMARY KEY,
+    codec VARCHAR(10) NOT NULL,
+    size INTEGER NOT NULL,
+    stored_size INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Revisions of each project's generated code: compressed snapshots or line deltas against the parent
+CREATE TABLE IF NOT EXISTS project_versions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    project_id INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    parent_version INTEGER,
+    kind VARCHAR(10) NOT NULL,
+    codec VARCHAR(10) NOT NULL,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    stored_size INTEGER NOT NULL,
+    content_hash VARCHAR(64) NOT NULL,
+    message TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (project_id, version),
+    FOREIGN KEY (project_id) REFERENCES website_projects (id) ON DELETE CASCADE
+);
+
+-- Per-user project totals, kept current by the triggers below
+CREATE TABLE IF NOT EXISTS user_project_counts (
+    user_id INTEGER PRIMARY KEY,
+    project_count INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_projects_count_insert AFTER INSERT ON website_projects
+BEGIN
+    INSERT INTO user_project_counts (user_id, project_count) VALUES (NEW.user_id, 1)
+    ON CONFLICT(user_id) DO UPDATE SET project_count = project_count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_projects_count_delete AFTER DELETE ON website_projects
+BEGIN
+    UPDATE user_project_counts SET project_count = project_count - 1 WHERE user_id = OLD.user_id;
+END;
+
+-- Backfill the totals the first time the counts table is created
+INSERT INTO user_project_counts (user_id, project_count)
+SELECT user_id, COUNT(*) FROM website_projects
+WHERE NOT EXISTS (SELECT 1 FROM user_project_counts)
+GROUP BY user_id;
+
+-- Change counters that let each process invalidate its in-memory caches
+CREATE TABLE IF NOT EXISTS cache_versions (
+    name VARCHAR(50) PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT OR IGNORE INTO cache_versions (name, version) VALUES ('users', 0);
+
+-- Token buckets for OpenRouter budgets, shared by every worker process
+CREATE TABLE IF NOT EXISTS rate_buckets (
+    name VARCHAR(64) PRIMARY KEY,
+    level REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+
+-- Token usage reported by OpenRouter for each call
+CREATE TABLE IF NOT EXISTS ai_usage (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    priority VARCHAR(20),
+    model VARCHAR(100),
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Indexes for better performance
-CREATE INDEX idx_users_email ON users(email);
-CREATE INDEX idx_users_username ON users(username);
-CREATE INDEX idx_projects_user_id ON website_projects(user_id);
-CREATE INDEX idx_sessions_token ON user_sessions(session_token);
-CREATE INDEX idx_sessions_user_id ON user_sessions(user_id);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
+CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
+CREATE INDEX IF NOT EXISTS idx_projects_user_id ON website_projects(user_id);
+CREATE INDEX IF NOT EXISTS idx_projects_user_updated ON website_projects(user_id, updated_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_projects_code_hash ON website_projects(code_hash);
+CREATE INDEX IF NOT EXISTS idx_history_project_created ON generation_history(project_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_history_output_hash ON generation_history(output_hash);
+CREATE INDEX IF NOT EXISTS idx_sessions_token ON user_sessions(session_token);
+CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON user_sessions(user_id);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON generation_jobs(status, created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_user_id ON generation_jobs(user_id);
+CREATE INDEX IF NOT EXISTS idx_jobs_batch_id ON generation_jobs(batch_id);
+CREATE INDEX IF NOT EXISTS idx_cache_last_access ON generation_cache(last_access);
+CREATE INDEX IF NOT EXISTS idx_ai_usage_created ON ai_usage(created_at);
+CREATE INDEX IF NOT EXISTS idx_ai_usage_user_created ON ai_usage(user_id, created_at);
\ No newline at end of file